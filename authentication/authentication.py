@@ -0,0 +1,191 @@
+"""
+JWT authentication resolving the user from the cache.
+
+simplejwt loads the user with one query on every authenticated request. The
+user is cached per id for a short time instead and invalidated by the
+CustomUser signals (see authentication.signals), so most requests reach the
+views without querying the user table.
+
+Verified access tokens are also kept in a bounded in-process LRU keyed by the
+token digest until their `exp`, so a token is decoded and its signature checked
+once per process rather than on each request, and the validated token of a
+request is kept on it for the middlewares reading it before the view.
+
+Users are loaded from the primary: a replica lagging behind the invalidation
+would put the old row back in the cache. Invalidation only reaches the other
+worker processes through a shared cache: with the per process LocMemCache, a
+deleted or deactivated account is cached a few seconds only (see config.caches).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from config.caches import invalidated_timeout
+
+USER_CACHE_TIMEOUT = 60
+VERIFIED_TOKEN_CACHE_SIZE = 1024
+
+
+def cache_key(user_id):
+    return f'authentication:user:{user_id}'
+
+
+def invalidate(user_id):
+    """Drop cached user, now and after the current transaction commits"""
+    key = cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class VerifiedTokenCache:
+    """Thread-safe LRU of validated tokens, each one kept until its exp"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(raw_token):
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode()
+        return hashlib.sha256(raw_token).digest()
+
+    def get(self, raw_token):
+        """Return validated token, None if unknown or expired"""
+        key = self._key(raw_token)
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None:
+                expires_at, token = entry
+                if expires_at > time.time():
+                    self._tokens.move_to_end(key)
+                    self.hits += 1
+                    return token
+                del self._tokens[key]
+            self.misses += 1
+        return None
+
+    def set(self, raw_token, token):
+        expires_at = token.get('exp')
+        if expires_at is None:
+            return
+        key = self._key(raw_token)
+        with self._lock:
+            self._tokens[key] = (expires_at, token)
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.maxsize:
+                self._tokens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Return hit / miss counters and current size"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._tokens)}
+
+
+verified_tokens = VerifiedTokenCache(VERIFIED_TOKEN_CACHE_SIZE)
+
+
+class CachedUserJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with verified tokens and users loaded from caches"""
+
+    def get_validated_token(self, raw_token):
+        token = verified_tokens.get(raw_token)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            verified_tokens.set(raw_token, token)
+        return token
+
+    def get_request_token(self, request):
+        """Return the validated token of request, None without one; validated once per request"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        # DRF requests wrap the HttpRequest seen by the middlewares
+        http_request = getattr(request, '_request', request)
+        validated = getattr(http_request, '_validated_token', None)
+        if validated is not None and validated[0] == raw_token:
+            return validated[1]
+        token = self.get_validated_token(raw_token)
+        http_request._validated_token = (raw_token, token)
+        return token
+
+    def authenticate(self, request):
+        validated_token = self.get_request_token(request)
+        if validated_token is None:
+            return None
+        return self.get_user(validated_token), validated_token
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views, the user being loaded with the async cache / ORM"""
+        validated_token = self.get_request_token(request)
+        if validated_token is None:
+            return None
+        return await self.aget_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        key = cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            try:
+                user = self.user_model.objects.using(DEFAULT_DB_ALIAS).get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            cache.set(key, user, invalidated_timeout(USER_CACHE_TIMEOUT))
+        return self._check_user(user, validated_token)
+
+    async def aget_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        key = cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            try:
+                user = await self.user_model.objects.using(DEFAULT_DB_ALIAS).aget(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            await cache.aset(key, user, invalidated_timeout(USER_CACHE_TIMEOUT))
+        return self._check_user(user, validated_token)
+
+    @staticmethod
+    def _user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    @staticmethod
+    def _check_user(user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
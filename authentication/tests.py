@@ -1,8 +1,19 @@
+import time
 from datetime import date
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.authentication import VerifiedTokenCache, verified_tokens
+from config.caches import LOCAL_CACHE_TIMEOUT
 
 User = get_user_model()
 
@@ -50,3 +61,91 @@ class UserTestCase(TestCase):
         with self.assertRaises(ValidationError):
             self.minor_user.full_clean()
 
+
+class CachedUserAuthenticationTestCase(APITestCase):
+    """Test users are resolved from the cache on authenticated requests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="testuser", password="password", date_of_birth=date(2000, 10, 27),
+        )
+
+    def setUp(self):
+        cache.clear()
+        verified_tokens.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.url = reverse('users-profile')
+
+    def user_queries(self):
+        """Return number of queries on the user table of a profile GET"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len([query for query in context if 'authentication_customuser' in query['sql']])
+
+    def test_user_is_cached(self):
+        """Test the user is loaded once then read from the cache"""
+        self.assertEqual(self.user_queries(), 1)
+        self.assertEqual(self.user_queries(), 0)
+
+    def test_profile_update_invalidates(self):
+        """Test the cached user is dropped when the profile changes"""
+        self.user_queries()
+        self.client.patch(self.url, {'first_name': "Nouveau"})
+        self.assertEqual(self.client.get(self.url).data['first_name'], "Nouveau")
+
+    def test_local_cache_expires_quickly(self):
+        """Test a per process cache keeps the user seconds only: other processes miss its invalidation"""
+        self.user_queries()
+        with mock.patch('time.time', return_value=time.time() + LOCAL_CACHE_TIMEOUT + 1):
+            self.assertEqual(self.user_queries(), 1)
+
+    def test_deleted_user_is_rejected(self):
+        """Test the token of a deleted account is rejected"""
+        self.user_queries()
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class VerifiedTokenCacheTestCase(APITestCase):
+    """Test verified tokens are reused until they expire"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="testuser", password="password", is_staff=True,
+        )
+
+    def setUp(self):
+        cache.clear()
+        verified_tokens.clear()
+
+    def test_token_verified_once(self):
+        """Test a token is validated once then served from the cache"""
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        for _ in range(3):
+            self.client.get(reverse('users-profile'))
+
+        response = self.client.get(reverse('users-token-cache'))
+        self.assertEqual(response.data, {'hits': 3, 'misses': 1, 'size': 1})
+
+    def test_expired_and_evicted_tokens(self):
+        """Test expired entries are dropped and least recently used ones evicted"""
+        tokens = VerifiedTokenCache(maxsize=2)
+        tokens.set("expired", {'exp': 1})
+        self.assertIsNone(tokens.get("expired"))
+
+        for raw_token in ("a", "b"):
+            tokens.set(raw_token, {'exp': 2 ** 40})
+        tokens.get("a")
+        tokens.set("c", {'exp': 2 ** 40})
+        self.assertIsNone(tokens.get("b"))
+        self.assertIsNotNone(tokens.get("a"))
+        self.assertEqual(tokens.stats()['size'], 2)
+
+    def test_counters_staff_only(self):
+        """Test counters are hidden from non staff users"""
+        other = User.objects.create_user(username="other", password="password")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse('users-token-cache')).status_code, 403)
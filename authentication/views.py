@@ -1,9 +1,10 @@
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
+from authentication.authentication import verified_tokens
 from authentication.models import CustomUser
 from authentication.serializers import UserSerializer, SignupSerializer
 
@@ -15,6 +16,8 @@ class UserViewset(ModelViewSet):
     def get_permissions(self):
         if self.action in ['register', 'login']:
             return [AllowAny()]
+        if self.action == 'token_cache':
+            return [IsAuthenticated(), IsAdminUser()]
         return [IsAuthenticated(), ]
 
 
@@ -69,3 +72,7 @@ class UserViewset(ModelViewSet):
                 'message' : 'Le compte a été supprimé'
             },status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['get'], url_path='token-cache')
+    def token_cache(self, request, *args, **kwargs):
+        """Hit / miss counters of the verified token cache of this process"""
+        return Response(verified_tokens.stats())
@@ -0,0 +1,22 @@
+"""
+Lifetime of cache entries invalidated by writes.
+
+A write drops the entries it changes from the cache of its own process only,
+unless the cache is shared between worker processes (REDIS_URL, see settings).
+With the per process LocMemCache, such entries live LOCAL_CACHE_TIMEOUT seconds
+at most, so other processes do not serve them stale for long.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+LOCAL_CACHE_TIMEOUT = 5
+
+
+def is_shared():
+    """Return True if the default cache is shared between processes"""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def invalidated_timeout(timeout):
+    """Return timeout with a shared cache, at most LOCAL_CACHE_TIMEOUT with a per process one"""
+    return timeout if is_shared() else min(timeout, LOCAL_CACHE_TIMEOUT)
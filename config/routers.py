@@ -0,0 +1,124 @@
+"""
+Primary / replica database routing.
+
+Reads of REPLICATED_APPS models go to a random read replica (DATABASES aliases
+starting with 'replica', see DATABASE_REPLICAS in settings), writes to
+'default'. A request is pinned to the primary when it writes (unsafe method) or
+when its user wrote less than REPLICA_STICKY_SECONDS ago, so users read their
+own writes whatever the replica lag. Reads inside a transaction of the primary
+stay on the primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+REPLICATED_APPS = {'tracking_projects'}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_primary = ContextVar('config_use_primary', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+@contextmanager
+def use_primary():
+    """Route reads to the primary inside the block"""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Reads to replicas unless pinned to the primary, writes to the primary"""
+
+    def __init__(self):
+        self.replicas = replica_aliases()
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or model._meta.app_label not in REPLICATED_APPS:
+            return None
+        if _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Replicas hold the same rows as the primary"""
+        return True
+
+
+##########################################################################
+#                            Sticky primary
+##########################################################################
+
+def sticky_key(user_id):
+    return f'config:primary:{user_id}'
+
+
+def _token_user_id(request):
+    """Return the user id of the JWT of request, None if there is no valid one"""
+    from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
+    from rest_framework_simplejwt.settings import api_settings
+    from authentication.authentication import CachedUserJWTAuthentication
+
+    try:
+        # Kept on the request: the view authenticates with the same validation
+        token = CachedUserJWTAuthentication().get_request_token(request)
+    except (InvalidToken, TokenError):
+        return None
+    return None if token is None else token.get(api_settings.USER_ID_CLAIM)
+
+
+def _wrote(request, response):
+    return request.method not in SAFE_METHODS and response.status_code < 400
+
+
+@sync_and_async_middleware
+def primary_sticky_middleware(get_response):
+    """Pin writes, and reads of users who wrote recently, to the primary"""
+    if not replica_aliases():
+        raise MiddlewareNotUsed()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            user_id = _token_user_id(request)
+            pinned = request.method not in SAFE_METHODS or (
+                user_id is not None and await cache.aget(sticky_key(user_id), False)
+            )
+            token = _use_primary.set(pinned)
+            try:
+                response = await get_response(request)
+            finally:
+                _use_primary.reset(token)
+            if user_id is not None and _wrote(request, response):
+                await cache.aset(sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+            return response
+    else:
+        def middleware(request):
+            user_id = _token_user_id(request)
+            pinned = request.method not in SAFE_METHODS or (
+                user_id is not None and cache.get(sticky_key(user_id), False)
+            )
+            token = _use_primary.set(pinned)
+            try:
+                response = get_response(request)
+            finally:
+                _use_primary.reset(token)
+            if user_id is not None and _wrote(request, response):
+                cache.set(sticky_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+            return response
+
+    return middleware
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -60,6 +61,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.routers.primary_sticky_middleware',
+    'config.sqlite.serialized_writes_middleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -92,6 +95,73 @@ DATABASES = {
     }
 }
 
+# Read replicas, kept in sync outside Django: DATABASE_REPLICAS=replica1.sqlite3,replica2.sqlite3
+# Reads of tracking_projects go to a replica, writes and recent writers to default (config.routers)
+for index, name in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Project shards: DATABASE_SHARDS=shard1.sqlite3,shard2.sqlite3 (migrate each with --database=shardN)
+# Rows of a project live in one shard, users and global indexes in default (tracking_projects.sharding)
+for index, name in enumerate(filter(None, os.environ.get('DATABASE_SHARDS', '').split(',')), start=1):
+    DATABASES[f'shard{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name.strip(),
+    }
+
+DATABASE_ROUTERS = ['tracking_projects.sharding.ProjectShardRouter', 'config.routers.PrimaryReplicaRouter']
+
+# Seconds during which a user who wrote reads from the primary
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+# SQLite production profile: DATABASE_PROFILE=production (config.sqlite)
+# WAL so readers do not wait for the writer, transactions taking the write lock when
+# they begin, waiting for it up to SQLITE_BUSY_TIMEOUT seconds, persistent connections.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'development')
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5))
+# Seconds a write request waits for the writes of its process before a 503
+SQLITE_WRITE_QUEUE_TIMEOUT = float(os.environ.get('SQLITE_WRITE_QUEUE_TIMEOUT', 10))
+SQLITE_PRODUCTION_OPTIONS = {
+    'timeout': SQLITE_BUSY_TIMEOUT,
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': ';'.join([
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA mmap_size=268435456',
+        'PRAGMA cache_size=-65536',
+        'PRAGMA temp_store=MEMORY',
+    ]),
+}
+
+if DATABASE_PROFILE == 'production':
+    for database in DATABASES.values():
+        database['OPTIONS'] = {**SQLITE_PRODUCTION_OPTIONS, **database.get('OPTIONS', {})}
+        database['CONN_MAX_AGE'] = 600
+        database['CONN_HEALTH_CHECKS'] = True
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Shared between worker processes when REDIS_URL is set (requires redis-py),
+# local to each process otherwise.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -135,12 +205,18 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework_simplejwt.authentication.JWTAuthentication',),
+    'DEFAULT_AUTHENTICATION_CLASSES': ('authentication.authentication.CachedUserJWTAuthentication',),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 6,
     'DATETIME_FORMAT': '%Y-%m-%d - %H:%M:%S',
 }
 
+# Number of children embedded in project / issue detail responses
+NESTED_PREVIEW_SIZE = 5
+
+# List pages serialized from row tuples (tracking_projects.compiled), same JSON
+COMPILED_LIST_SERIALIZERS = os.environ.get('COMPILED_LIST_SERIALIZERS') == '1'
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
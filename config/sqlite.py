@@ -0,0 +1,90 @@
+"""
+SQLite production profile (DATABASE_PROFILE=production, see settings).
+
+SQLite has a single writer. The profile opens connections in WAL mode (readers
+never wait for the writer), with tuned pragmas, persistent connections and
+transactions that take the write lock when they begin (BEGIN IMMEDIATE) so two
+transactions cannot deadlock upgrading a read lock; a connection waits up to
+SQLITE_BUSY_TIMEOUT seconds for the lock held by another process.
+
+Inside a process, serialized_writes_middleware queues write requests: they run
+one at a time, each in one transaction of 'default' (one commit per request).
+Async write requests are queued and run the same way from a thread: the ORM
+calls of the async view come back to that thread (sync_to_async inside
+async_to_sync), inside its transaction, and the lock is released by the thread
+that took it even if the request is cancelled while waiting.
+A request waiting more than SQLITE_WRITE_QUEUE_TIMEOUT seconds for its turn, or
+for the lock of another process, gets a 503 with Retry-After instead of a
+"database is locked" error.
+"""
+import threading
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError, transaction
+from django.http import JsonResponse
+from django.utils.decorators import sync_and_async_middleware
+
+from config.routers import SAFE_METHODS
+
+BUSY_MESSAGE = "Base de données occupée, réessayez."
+# Seconds suggested to clients before retrying a write
+RETRY_AFTER = 1
+
+_write_lock = threading.Lock()
+
+
+def is_busy_error(exc):
+    """True if exc is SQLite giving up on the write lock"""
+    message = str(exc).lower()
+    return isinstance(exc, OperationalError) and ('locked' in message or 'busy' in message)
+
+
+def busy_response():
+    return JsonResponse({'detail': BUSY_MESSAGE}, status=503, headers={'Retry-After': str(RETRY_AFTER)})
+
+
+def _run_in_transaction(get_response, request):
+    """Run request in one transaction, rolled back if the response is a server error"""
+    try:
+        with transaction.atomic():
+            response = get_response(request)
+            if response.status_code >= 500:
+                transaction.set_rollback(True)
+    except OperationalError as exc:
+        # Raised by BEGIN / COMMIT: view errors are already responses here
+        if not is_busy_error(exc):
+            raise
+        return busy_response()
+    return response
+
+
+def _run_queued(get_response, request):
+    """Wait for the turn of request, then run it in one transaction"""
+    if not _write_lock.acquire(timeout=settings.SQLITE_WRITE_QUEUE_TIMEOUT):
+        return busy_response()
+    try:
+        return _run_in_transaction(get_response, request)
+    finally:
+        _write_lock.release()
+
+
+@sync_and_async_middleware
+def serialized_writes_middleware(get_response):
+    """Run the write requests of the process one at a time, with a bounded wait"""
+    if settings.DATABASE_PROFILE != 'production':
+        raise MiddlewareNotUsed()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if request.method in SAFE_METHODS:
+                return await get_response(request)
+            return await sync_to_async(_run_queued)(async_to_sync(get_response), request)
+    else:
+        def middleware(request):
+            if request.method in SAFE_METHODS:
+                return get_response(request)
+            return _run_queued(get_response, request)
+
+    return middleware
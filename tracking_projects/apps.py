@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TrackingProjectsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tracking_projects'
+
+    def ready(self):
+        from tracking_projects import signals  # noqa: F401
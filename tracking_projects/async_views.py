@@ -0,0 +1,257 @@
+"""
+Async read path of the tracking API, served under /api/v1/async/ (ASGI).
+
+DRF views are synchronous: under ASGI each request holds a worker thread. These
+plain Django async views authenticate with the cached JWT authentication, check
+membership with the async resolver and load rows with the async ORM (row tuples
+with COMPILED_LIST_SERIALIZERS, see tracking_projects.compiled). Rows are
+loaded with everything the serializers read (select_related / previews), so
+serialization runs on the event loop without queries. Queries go to the shard
+of the project in URL (see tracking_projects.sharding).
+"""
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from authentication.authentication import CachedUserJWTAuthentication
+from tracking_projects import compiled, events, membership, sharding
+from tracking_projects.filters import IssueFilterBackend, CreatedAtOrderingFilter
+from tracking_projects.models import Project, Contributor, Issue, Comment, MembershipIndex
+from tracking_projects.pagination import (
+    ProjectPagination, ContributorPagination, IssuePagination, CommentPagination,
+)
+from tracking_projects.permissions import IsContributor
+from tracking_projects.serializers import (
+    NESTED_PREVIEW_SIZE,
+    ProjectListSerializer, ProjectDetailSerializer,
+    ContributorListSerializer, ContributorDetailSerializer,
+    IssueListSerializer, IssueDetailSerializer,
+    CommentListSerializer, CommentDetailSerializer,
+)
+
+
+class AsyncAPIView(View):
+    """GET only view authenticated with the cached JWT authentication, errors rendered as DRF does"""
+    http_method_names = ['get']
+    authentication = CachedUserJWTAuthentication()
+
+    async def authenticate(self, request):
+        result = await self.authentication.aauthenticate(request)
+        if result is None:
+            raise exceptions.NotAuthenticated()
+        return result[0]
+
+    def render(self, data, status=200, headers=None):
+        return HttpResponse(
+            JSONRenderer().render(data), status=status,
+            content_type='application/json', headers=headers,
+        )
+
+    def handle_exception(self, request, exc):
+        """Render API exceptions as DRF's exception handler does"""
+        headers = None
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            headers = {'WWW-Authenticate': self.authentication.authenticate_header(request)}
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return self.render(data, status=exc.status_code, headers=headers)
+
+
+class AsyncReadView(AsyncAPIView):
+    """
+    List (no pk in URL) or retrieve one resource.
+
+    Subclasses set the queryset, serializers, pagination and filters like a
+    viewset. get_queryset() restricts queryset to the parents in URL
+    (parent_lookups), subclasses add what their serializers read. Nested
+    resources are restricted to contributors of the project in URL.
+    """
+    # Required: rows read by the view
+    queryset = None
+    # {URL kwarg: lookup} of the parents in URL
+    parent_lookups = {}
+    pagination_class = None
+    filter_backends = ()
+    list_serializer_class = None
+    detail_serializer_class = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.queryset is None:
+            raise ImproperlyConfigured(f"{cls.__name__} must set queryset")
+
+    async def get(self, request, *args, **kwargs):
+        request = Request(request)
+        self.request = request
+        self.action = 'retrieve' if 'pk' in kwargs else 'list'
+        try:
+            with sharding.for_project(self.get_project_id()):
+                request.user = await self.authenticate(request)
+                await self.check_permissions(request)
+                if self.action == 'list':
+                    data = await self.list(request)
+                else:
+                    data = await self.retrieve(request)
+        except exceptions.APIException as exc:
+            return self.handle_exception(request, exc)
+        return self.render(data)
+
+    def get_project_id(self):
+        return self.kwargs.get('project_pk')
+
+    async def check_permissions(self, request):
+        project_id = self.kwargs.get('project_pk')
+        if project_id and not await membership.ais_contributor(request.user, project_id):
+            raise exceptions.PermissionDenied(IsContributor.message)
+
+    def get_queryset(self):
+        return self.queryset.filter(**{lookup: self.kwargs[kwarg] for kwarg, lookup in self.parent_lookups.items()})
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+    async def list(self, request):
+        queryset = self.get_queryset()
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+        paginator = self.pagination_class()
+        compiled_serializer = compiled.for_queryset(self.list_serializer_class, queryset)
+        if compiled_serializer is not None:
+            rows = compiled_serializer.rows(queryset, *[field.lstrip('-') for field in paginator.ordering])
+            page = await paginator.apaginate_queryset(rows, request, view=self)
+            return paginator.get_paginated_response(await compiled_serializer.aserialize(page)).data
+        page = await self.load_page(await paginator.apaginate_queryset(queryset, request, view=self))
+        serializer = self.list_serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data).data
+
+    async def load_page(self, page):
+        """Return the objects to serialize for a page of get_queryset()"""
+        return page
+
+    async def retrieve(self, request):
+        try:
+            obj = await self.get_queryset().aget(pk=self.kwargs['pk'])
+        except ObjectDoesNotExist:
+            raise exceptions.NotFound()
+        return self.detail_serializer_class(obj, context=self.get_serializer_context()).data
+
+
+class ProjectAsyncView(AsyncReadView):
+    """
+    [Endpoint]
+    - List: GET /api/v1/async/projects/
+    - Retrieve: GET /api/v1/async/projects/<int:project_id>/
+    """
+    queryset = Project.objects.all()
+    pagination_class = ProjectPagination
+    list_serializer_class = ProjectListSerializer
+    detail_serializer_class = ProjectDetailSerializer
+
+    async def check_permissions(self, request):
+        """Projects of other users are not found, as in the sync API"""
+        if self.action == 'retrieve' and not await membership.ais_contributor(request.user, self.kwargs['pk']):
+            raise exceptions.NotFound()
+
+    def get_project_id(self):
+        return self.kwargs.get('pk')
+
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            return sharding.with_users(super().get_queryset(), 'author').with_previews(NESTED_PREVIEW_SIZE)
+        return sharding.memberships(self.request.user)
+
+    async def load_page(self, page):
+        """The list pages the membership index of the user"""
+        if page and isinstance(page[0], MembershipIndex):
+            return await sharding.aload_projects([row.project_id for row in page])
+        return page
+
+
+class ContributorAsyncView(AsyncReadView):
+    """
+    [Endpoint]
+    - List: GET /api/v1/async/projects/<int:project_id>/contributors/
+    - Retrieve: GET /api/v1/async/projects/<int:project_id>/contributors/<int:contributor_id>/
+    """
+    queryset = Contributor.objects.all()
+    parent_lookups = {'project_pk': 'project_id'}
+    pagination_class = ContributorPagination
+    list_serializer_class = ContributorListSerializer
+    detail_serializer_class = ContributorDetailSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            return sharding.with_users(queryset.select_related('project'), 'user')
+        return sharding.with_users(queryset, 'user')
+
+
+class IssueAsyncView(AsyncReadView):
+    """
+    [Endpoint]
+    - List: GET /api/v1/async/projects/<int:project_id>/issues/ (same filters as the sync list)
+    - Retrieve: GET /api/v1/async/projects/<int:project_id>/issues/<int:issue_id>/
+    """
+    queryset = Issue.objects.all()
+    parent_lookups = {'project_pk': 'project_id'}
+    pagination_class = IssuePagination
+    filter_backends = [IssueFilterBackend, CreatedAtOrderingFilter]
+    list_serializer_class = IssueListSerializer
+    detail_serializer_class = IssueDetailSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            return (
+                sharding.with_users(queryset.select_related('project'), 'author', 'assigned_to')
+                .with_previews(NESTED_PREVIEW_SIZE)
+            )
+        return sharding.with_users(queryset, 'author')
+
+
+class CommentAsyncView(AsyncReadView):
+    """
+    [Endpoint]
+    - List: GET /api/v1/async/projects/<int:project_id>/issues/<int:issue_id>/comments/
+    - Retrieve: GET /api/v1/async/projects/<int:project_id>/issues/<int:issue_id>/comments/<uuid:comment_id>/
+    """
+    queryset = Comment.objects.all()
+    parent_lookups = {'issue_pk': 'issue_id', 'project_pk': 'issue__project_id'}
+    pagination_class = CommentPagination
+    list_serializer_class = CommentListSerializer
+    detail_serializer_class = CommentDetailSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            return sharding.with_users(queryset.select_related('issue'), 'author')
+        return sharding.with_users(queryset, 'author')
+
+
+class EventStreamView(AsyncAPIView):
+    """
+    Server-Sent Events of issues / comments of the user's projects.
+
+    [Endpoint]
+    - Stream: GET /api/v1/async/events/ (Last-Event-ID header to resume)
+    """
+
+    async def get(self, request, *args, **kwargs):
+        request = Request(request)
+        self.request = request
+        try:
+            user = await self.authenticate(request)
+            last_event_id = request.headers.get('Last-Event-ID')
+            last_event_id = int(last_event_id) if last_event_id else None
+        except exceptions.APIException as exc:
+            return self.handle_exception(request, exc)
+        except ValueError:
+            return self.handle_exception(request, exceptions.ParseError("Last-Event-ID invalide."))
+        response = StreamingHttpResponse(
+            events.stream(user, last_event_id), content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,121 @@
+"""
+Response cache for project and issue detail.
+
+Entries are stored per object as (etag, origin, data): a hit must match the
+current ETag of the project (see tracking_projects.conditional), and the signals
+evict the entries of the objects touched by a write (see tracking_projects.signals).
+Concurrent misses of a key are coalesced: one request builds the entry, the
+others wait for it. Entries are built from the primary, so a lagging replica
+cannot store old data under the current ETag.
+"""
+import threading
+import time
+import weakref
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.response import Response
+
+from config.routers import use_primary
+from tracking_projects.conditional import get_etag
+
+DETAIL_CACHE_TIMEOUT = 60 * 10
+BUILD_LOCK_TIMEOUT = 5
+BUILD_WAIT_INTERVAL = 0.05
+
+_locks = weakref.WeakValueDictionary()
+_locks_guard = threading.Lock()
+
+
+def project_detail_key(project_id):
+    return f'tracking_projects:detail:project:{project_id}'
+
+
+def issue_detail_key(issue_id):
+    return f'tracking_projects:detail:issue:{issue_id}'
+
+
+def evict(*keys):
+    cache.delete_many(keys)
+
+
+def _thread_lock(key):
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = threading.Lock()
+        return lock
+
+
+def _wait_for(key, is_valid):
+    """Wait for another process to build key, return its value or None on timeout"""
+    deadline = time.monotonic() + BUILD_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(BUILD_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if is_valid(entry):
+            return entry
+    return None
+
+
+def get_or_build(key, etag, origin, build):
+    """
+    Return data cached under key for (etag, origin), build it once on miss.
+    Threads of this process wait on a lock, other processes on a cache lock key.
+    """
+
+    def is_valid(entry):
+        return entry is not None and entry[0] == etag and entry[1] == origin
+
+    entry = cache.get(key)
+    if is_valid(entry):
+        return entry[2]
+
+    with _thread_lock(key):
+        entry = cache.get(key)
+        if is_valid(entry):
+            return entry[2]
+
+        lock_key = f'{key}:lock'
+        if not cache.add(lock_key, 1, BUILD_LOCK_TIMEOUT):
+            entry = _wait_for(key, is_valid)
+            if entry is not None:
+                return entry[2]
+        try:
+            with use_primary():
+                data = build()
+            cache.set(key, (etag, origin, data), DETAIL_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return data
+
+
+class DetailCacheMixin:
+    """
+    Serve retrieve from the detail cache.
+    Object permissions are checked on an unsaved instance carrying the ids from
+    the URL, so a hit does not load the object. Views set both attributes.
+    """
+    # Key of the entry from the object id, e.g. staticmethod(project_detail_key)
+    detail_cache_key = None
+    # Unsaved instance from the URL kwargs, e.g. staticmethod(lambda kwargs: Project(pk=kwargs['pk']))
+    detail_cache_stub = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.detail_cache_key is None or cls.detail_cache_stub is None:
+            raise ImproperlyConfigured(f"{cls.__name__} must set detail_cache_key and detail_cache_stub")
+
+    def retrieve(self, request, *args, **kwargs):
+        etag = get_etag(request, *args, **kwargs)
+        if etag is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        self.check_object_permissions(request, self.detail_cache_stub(self.kwargs))
+        data = get_or_build(
+            self.detail_cache_key(self.kwargs['pk']),
+            etag,
+            request.build_absolute_uri('/'),
+            lambda: super(DetailCacheMixin, self).retrieve(request, *args, **kwargs).data,
+        )
+        return Response(data)
@@ -0,0 +1,222 @@
+"""
+Compiled list serializers (settings.COMPILED_LIST_SERIALIZERS).
+
+A DRF list serializer builds each row through the field machinery: a model
+instance, get_attribute() along `source`, to_representation() per field.
+CompiledSerializer reads the fields of a list serializer once into a plan of
+`.values_list()` lookups and converters, and builds the row dict straight
+from the tuple with it: same keys in the same order, same values, so
+the rendered JSON is byte for byte the one of the serializer.
+
+Only the field types used by the list serializers are supported, compiling
+another serializer raises ImproperlyConfigured. Sharded, `relation.attribute`
+sources are read with one query per relation instead of a join, users being in
+'default' (see tracking_projects.sharding).
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from rest_framework import ISO_8601, fields, relations
+from rest_framework.settings import api_settings
+
+from tracking_projects import sharding
+
+# Fields whose representation is the database value
+IDENTITY_FIELDS = {
+    fields.IntegerField, fields.CharField, fields.ChoiceField, fields.ReadOnlyField,
+    relations.PrimaryKeyRelatedField,
+}
+
+
+def enabled():
+    return getattr(settings, 'COMPILED_LIST_SERIALIZERS', False)
+
+
+def _datetime_converter(field):
+    """DateTimeField.to_representation() with its format and timezone resolved once"""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None:
+        return None
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None or output_format.lower() == ISO_8601:
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        return value.astimezone(field_timezone).strftime(output_format)
+    return convert
+
+
+def _converter(field):
+    """Return the function representing a database value of field, None if it is the value"""
+    if type(field) in IDENTITY_FIELDS:
+        return None
+    if type(field) is fields.DateTimeField:
+        return _datetime_converter(field)
+    if type(field) is fields.UUIDField:
+        return str if field.uuid_format == 'hex_verbose' else field.to_representation
+    raise ImproperlyConfigured(f"{type(field).__name__} {field.field_name!r} cannot be compiled")
+
+
+def _related_converter(values, convert):
+    """Represent the attribute of the related row of a foreign key, None if the row is gone"""
+    if convert is None:
+        return values.get
+
+    def convert_related(pk):
+        value = values.get(pk)
+        return None if value is None else convert(value)
+    return convert_related
+
+
+class Column:
+    """An output field: its lookup, and the relation read apart when sharded"""
+
+    def __init__(self, field, lookup, related=None):
+        self.field = field
+        self.name = field.field_name
+        self.lookup = lookup
+        # (model, attribute) of a `relation.attribute` source read with its own query
+        self.related = related
+
+
+class CompiledSerializer:
+    """
+    Serialize rows of `rows(queryset)` as serializer_class(many=True).data does.
+    Use compile_serializer(), plans are built once per serializer class.
+    """
+
+    def __init__(self, serializer_class, sharded=False):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.columns = [self._column(field, sharded) for field in serializer_class()._readable_fields]
+        self.lookups = list(dict.fromkeys(column.lookup for column in self.columns))
+        # Unsupported field types fail here, not on the first request
+        self._build = self._compile()
+
+    def _column(self, field, sharded):
+        attrs = field.source_attrs
+        try:
+            model_field = self.model._meta.get_field(attrs[0]) if attrs else None
+        except FieldDoesNotExist:
+            model_field = None
+        if model_field is None or len(attrs) > 2 or (model_field.is_relation and not model_field.many_to_one):
+            raise ImproperlyConfigured(f"Source {field.source!r} of {field.field_name!r} cannot be compiled")
+        if len(attrs) == 1:
+            if model_field.is_relation and type(field) is not relations.PrimaryKeyRelatedField:
+                raise ImproperlyConfigured(f"{type(field).__name__} {field.field_name!r} cannot be compiled")
+            return Column(field, model_field.attname)
+        if model_field.null and not field.allow_null:
+            # DRF skips the key when the relation is empty
+            raise ImproperlyConfigured(f"Source {field.source!r} of {field.field_name!r} cannot be compiled")
+        if sharded:
+            return Column(field, model_field.attname, related=(model_field.related_model, attrs[1]))
+        return Column(field, '__'.join(attrs))
+
+    def _compile(self):
+        """Return make(*converters) -> function building the dict of a row tuple"""
+        # (name, position in the row, index of its converter or None when the value is the representation)
+        plan = [
+            (
+                column.name,
+                self.lookups.index(column.lookup),
+                None if column.related is None and _converter(column.field) is None else index,
+            )
+            for index, column in enumerate(self.columns)
+        ]
+
+        def make(*converters):
+            items = [
+                (name, position, None if index is None else converters[index])
+                for name, position, index in plan
+            ]
+
+            def build(row):
+                data = {}
+                for name, position, convert in items:
+                    value = row[position]
+                    data[name] = value if convert is None or value is None else convert(value)
+                return data
+            return build
+        return make
+
+    def rows(self, queryset, *extra):
+        """Return queryset as row tuples, with the `extra` lookups (pagination ordering) as attributes"""
+        lookups = self.lookups + [lookup for lookup in extra if lookup not in self.lookups]
+        return queryset.select_related(None).prefetch_related(None).values_list(*lookups, named=True)
+
+    def _related_querysets(self, rows):
+        """Yield (columns, queryset of (pk, attributes)) per relation read apart"""
+        relations_columns = {}
+        for column in self.columns:
+            if column.related is not None:
+                relations_columns.setdefault(column.lookup, []).append(column)
+        for lookup, columns in relations_columns.items():
+            position = self.lookups.index(lookup)
+            ids = {row[position] for row in rows} - {None}
+            model = columns[0].related[0]
+            yield columns, model.objects.filter(pk__in=ids).values_list(
+                'pk', *[column.related[1] for column in columns],
+            )
+
+    def _converters(self, related_values):
+        converters = []
+        for index, column in enumerate(self.columns):
+            convert = _converter(column.field)
+            if index in related_values:
+                convert = _related_converter(related_values[index], convert)
+            converters.append(convert)
+        return converters
+
+    def _related_values(self, columns, values):
+        """Return {column index: {pk: attribute}} of a relation read apart"""
+        return {
+            self.columns.index(column): {row[0]: row[offset] for row in values}
+            for offset, column in enumerate(columns, start=1)
+        }
+
+    def serialize(self, rows):
+        """Return the representation of rows, a list of dicts"""
+        related_values = {}
+        for columns, queryset in self._related_querysets(rows):
+            related_values.update(self._related_values(columns, list(queryset)))
+        return list(map(self._build(*self._converters(related_values)), rows))
+
+    async def aserialize(self, rows):
+        """serialize() for async views"""
+        related_values = {}
+        for columns, queryset in self._related_querysets(rows):
+            related_values.update(self._related_values(columns, [row async for row in queryset]))
+        return list(map(self._build(*self._converters(related_values)), rows))
+
+
+@lru_cache(maxsize=None)
+def _compile_serializer(serializer_class, sharded):
+    return CompiledSerializer(serializer_class, sharded)
+
+
+def compile_serializer(serializer_class):
+    """Return the CompiledSerializer of serializer_class, built once"""
+    return _compile_serializer(serializer_class, sharding.enabled())
+
+
+def for_queryset(serializer_class, queryset):
+    """Return the compiled serializer_class for a list of queryset, None if disabled or not applicable"""
+    if not enabled() or queryset.model is not serializer_class.Meta.model:
+        return None
+    return compile_serializer(serializer_class)
+
+
+class CompiledListMixin:
+    """Serialize list pages with the compiled list serializer when enabled"""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        compiled = for_queryset(self.get_serializer_class(), queryset)
+        if compiled is None or self.paginator is None:
+            return super().list(request, *args, **kwargs)
+        ordering = [field.lstrip('-') for field in self.paginator.ordering]
+        page = self.paginate_queryset(compiled.rows(queryset, *ordering))
+        return self.get_paginated_response(compiled.serialize(page))
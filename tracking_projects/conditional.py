@@ -0,0 +1,125 @@
+"""
+Conditional requests (ETag / Last-Modified) for the tracking API.
+
+Validators come from Project.version and Project.updated_at, bumped on any write
+to the project, its issues, comments or contributors (see tracking_projects.signals),
+so they are computed with one small query and without serializing the response.
+GET / HEAD answer 304 Not Modified, PUT / PATCH answer 412 Precondition Failed
+when If-Match does not match. ETags are strong: they also carry the query
+string and the renderer, which change the bytes of the response.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from tracking_projects import membership, sharding
+from tracking_projects.models import Project
+
+
+def _validators(request, *args, **kwargs):
+    """
+    Return (etag, last_modified) of the resource, memoized on request.
+    Nested routes and project detail depend on one project version,
+    project list depends on every project visible to the user.
+    """
+    if not hasattr(request, '_tracking_validators'):
+        if request.method not in ('GET', 'HEAD') and not (
+                'HTTP_IF_MATCH' in request.META or 'HTTP_IF_UNMODIFIED_SINCE' in request.META
+        ):
+            # Nothing to compare: skip the query on unconditional writes
+            return None, None
+        project_id = kwargs.get('project_pk') or kwargs.get('pk')
+        if project_id and not membership.is_contributor(request.user, project_id):
+            # Nested routes already checked it: project detail must not answer 304 to others
+            request._tracking_validators = None, None
+        else:
+            if project_id:
+                etag, last_modified = _project_validators(project_id)
+            else:
+                etag, last_modified = _project_list_validators(request.user)
+            if etag is not None:
+                etag = f'"{etag}-{_representation(request)}"'
+            request._tracking_validators = etag, last_modified
+    return request._tracking_validators
+
+
+def _representation(request):
+    """Return a short digest of the query parameters and renderer of request"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    parameters = sorted(request.GET.lists())
+    digest = hashlib.sha256(repr((parameters, getattr(renderer, 'format', None))).encode())
+    return digest.hexdigest()[:12]
+
+
+def _project_validators(project_id):
+    try:
+        row = (
+            Project.objects.using(sharding.db_for_project(project_id)).filter(pk=project_id)
+            .values_list('version', 'updated_at')
+            .first()
+        )
+    except (TypeError, ValueError):
+        row = None
+    if row is None:
+        return None, None
+    version, updated_at = row
+    return f'p{project_id}-v{version}', updated_at
+
+
+def _aggregate(projects):
+    return projects.aggregate(
+        count=Count('pk'), last_id=Max('pk'), versions=Sum('version'), updated_at=Max('updated_at'),
+    )
+
+
+def _project_list_validators(user):
+    if not sharding.enabled():
+        row = _aggregate(Project.objects.filter(pk__in=sharding.memberships(user).values('project_id')))
+    else:
+        # One aggregate per shard holding projects of user, combined
+        project_ids = sharding.memberships(user).values_list('project_id', flat=True)
+        rows = [
+            _aggregate(Project.objects.using(alias).filter(pk__in=ids))
+            for alias, ids in sharding.group_by_shard(project_ids).items()
+        ]
+        row = {
+            'count': sum(row['count'] for row in rows),
+            'last_id': max((row['last_id'] for row in rows if row['last_id']), default=None),
+            'versions': sum(row['versions'] or 0 for row in rows) if rows else None,
+            'updated_at': max((row['updated_at'] for row in rows if row['updated_at']), default=None),
+        }
+    etag = f'u{user.pk}-n{row["count"]}-m{row["last_id"]}-s{row["versions"]}'
+    return etag, row['updated_at']
+
+
+def get_etag(request, *args, **kwargs):
+    return _validators(request, *args, **kwargs)[0]
+
+
+def get_last_modified(request, *args, **kwargs):
+    return _validators(request, *args, **kwargs)[1]
+
+
+conditional = method_decorator(condition(etag_func=get_etag, last_modified_func=get_last_modified))
+
+
+class ConditionalMixin:
+    """Answer conditional GET / HEAD and If-Match protected PUT / PATCH"""
+
+    @conditional
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @conditional
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @conditional
+    def partial_update(self, request, *args, **kwargs):
+        return super().partial_update(request, *args, **kwargs)
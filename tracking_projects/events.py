@@ -0,0 +1,188 @@
+"""
+Issue / comment activity pushed to clients as Server-Sent Events.
+
+Model and bulk signals (see tracking_projects.signals) write ActivityEvent rows
+in the transaction of the change, or once the shard of the project commits when
+projects are sharded (see tracking_projects.sharding). The table is the pub/sub shared by workers:
+the Hub of each worker event loop polls it while connections are open and fans
+new events out to them. SQLite serializes writers, so event ids are committed
+in order and polling `id > last seen` misses none.
+
+Each connection has a bounded queue: a client too slow to drain it is sent a
+`reset` event and disconnected, and reloads its lists when it reconnects.
+"""
+import asyncio
+import json
+import weakref
+from datetime import timedelta
+from functools import partial
+
+from django.utils import timezone
+
+from tracking_projects import membership, sharding
+from tracking_projects.models import ActivityEvent
+
+POLL_INTERVAL = 0.5
+HEARTBEAT_INTERVAL = 15
+QUEUE_SIZE = 100
+REPLAY_LIMIT = 500
+EVENT_RETENTION = timedelta(hours=1)
+
+ISSUE_FIELDS = ('title', 'status', 'priority', 'tag')
+
+
+##########################################################################
+#                            Publishing
+##########################################################################
+
+def issue_event(issue, action):
+    payload = {'type': 'issue', 'action': action, 'id': issue.pk, 'project': issue.project_id}
+    if action != 'deleted':
+        payload.update({field: getattr(issue, field) for field in ISSUE_FIELDS})
+        payload.update(author=issue.author_id, assigned_to=issue.assigned_to_id)
+    return ActivityEvent(project_id=issue.project_id, payload=payload)
+
+
+def comment_event(comment, project_id, action):
+    payload = {
+        'type': 'comment', 'action': action, 'uuid': str(comment.pk),
+        'issue': comment.issue_id, 'project': project_id,
+    }
+    if action != 'deleted':
+        payload.update(author=comment.author_id, description=comment.description)
+    return ActivityEvent(project_id=project_id, payload=payload)
+
+
+def publish(events):
+    """Write events in the current transaction, on the commit of the shard when sharded"""
+    sharding.on_commit(partial(ActivityEvent.objects.bulk_create, events))
+
+
+def purge(before=None):
+    """Delete events older than the retention, return how many were deleted"""
+    before = before or timezone.now() - EVENT_RETENTION
+    deleted, _ = ActivityEvent.objects.filter(created_at__lt=before).delete()
+    return deleted
+
+
+async def fetch(after_id, limit=REPLAY_LIMIT):
+    """Return events with id > after_id, oldest first"""
+    events = ActivityEvent.objects.filter(id__gt=after_id).values('id', 'project_id', 'payload')
+    return [event async for event in events.order_by('id')[:limit]]
+
+
+async def last_id():
+    event = await ActivityEvent.objects.order_by('-id').values('id').afirst()
+    return event['id'] if event else 0
+
+
+##########################################################################
+#                            Fan-out
+##########################################################################
+
+class Subscription:
+    """Events queued for one connection"""
+
+    def __init__(self, size):
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+
+class Hub:
+    """Poll events while connections are open and fan them out"""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.last_id = None
+        self._task = None
+
+    async def subscribe(self):
+        """Return a subscription receiving the events written from now on"""
+        if self.last_id is None:
+            self.last_id = await last_id()
+        subscription = Subscription(QUEUE_SIZE)
+        self.subscriptions.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def dispatch(self, event):
+        for subscription in list(self.subscriptions):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+    async def _poll(self):
+        while self.subscriptions:
+            for event in await fetch(self.last_id):
+                self.last_id = event['id']
+                self.dispatch(event)
+            await asyncio.sleep(POLL_INTERVAL)
+        # Events written while idle are not for any connection
+        self.last_id = None
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """Return the hub of the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = Hub()
+    return _hubs[loop]
+
+
+##########################################################################
+#                            Stream
+##########################################################################
+
+def format_event(event):
+    payload = event['payload']
+    return (
+        f"id: {event['id']}\n"
+        f"event: {payload['type']}.{payload['action']}\n"
+        f"data: {json.dumps(payload)}\n\n"
+    )
+
+
+async def stream(user, last_event_id=None):
+    """
+    Yield SSE messages of the projects of user: events after last_event_id
+    first (Last-Event-ID of a reconnecting client), then live events.
+    """
+    hub = get_hub()
+    subscription = await hub.subscribe()
+    try:
+        yield ": connected\n\n"
+        sent_id = 0
+        if last_event_id is not None:
+            missed = await fetch(last_event_id, REPLAY_LIMIT + 1)
+            if len(missed) > REPLAY_LIMIT:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            for event in missed:
+                sent_id = event['id']
+                if await membership.ais_contributor(user, event['project_id']):
+                    yield format_event(event)
+
+        while True:
+            if subscription.overflowed:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event['id'] <= sent_id:
+                continue
+            if await membership.ais_contributor(user, event['project_id']):
+                yield format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
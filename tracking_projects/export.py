@@ -0,0 +1,168 @@
+"""
+Streaming export of a project: issues followed by their comments.
+
+Rows are read by keyset chunks of issues (pk > last exported) and the comments
+of each chunk with a server-side cursor, so memory does not depend on the size
+of the project and no relation is loaded per row. In a shard, usernames are read
+from 'default' (see Usernames).
+"""
+import csv
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+from tracking_projects import sharding
+from tracking_projects.models import Issue, Comment, Contributor
+
+EXPORT_CHUNK_SIZE = 500
+
+ISSUE_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'priority': 'priority',
+    'tag': 'tag',
+    'status': 'status',
+    'author': 'author_id',
+    'author_name': 'author__username',
+    'assigned_to': 'assigned_to_id',
+    'assigned_to_name': 'assigned_to__username',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+COMMENT_FIELDS = {
+    'uuid': 'uuid',
+    'issue': 'issue_id',
+    'description': 'description',
+    'author': 'author_id',
+    'author_name': 'author__username',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+TIMESTAMP_FIELDS = ('created_at', 'updated_at')
+# Joined lookups of users, replaced by Usernames in shards
+USERNAME_LOOKUPS = {'author__username': 'author_id', 'assigned_to__username': 'assigned_to_id'}
+CSV_COLUMNS = ['type', 'id', 'issue'] + [
+    field for field in ISSUE_FIELDS if field != 'id'
+]
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline delimited JSON. Rows are streamed by the view, errors are rendered as one line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+class CSVRenderer(NDJSONRenderer):
+    """CSV. Rows are streamed by the view, errors are rendered as one JSON line"""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """
+    NDJSON unless CSV is asked for: clients asking for JSON (Accept header or
+    ?format=json) get the NDJSON stream rather than a 406 / 404.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except (NotAcceptable, Http404):
+            return renderers[0], renderers[0].media_type
+
+
+def format_timestamp(value):
+    """ISO 8601 as in the JSON responses: milliseconds, 'Z' for UTC"""
+    return DjangoJSONEncoder().default(value)
+
+
+class Usernames(dict):
+    """
+    Usernames by user id for the export of a sharded project, users being in
+    'default': those of the contributors at once, former ones on first use.
+    """
+
+    def __init__(self, project_id, alias):
+        user_ids = Contributor.objects.using(alias).filter(project_id=project_id).values_list('user_id', flat=True)
+        super().__init__(get_user_model().objects.filter(pk__in=list(user_ids)).values_list('pk', 'username'))
+
+    def __missing__(self, user_id):
+        self[user_id] = get_user_model().objects.filter(pk=user_id).values_list('username', flat=True).first()
+        return self[user_id]
+
+
+def _lookups(fields, usernames):
+    return [lookup for lookup in fields.values() if usernames is None or lookup not in USERNAME_LOOKUPS]
+
+
+def _rename(row, fields, usernames=None):
+    if usernames is not None:
+        for lookup, user_field in USERNAME_LOOKUPS.items():
+            if lookup in fields.values():
+                row[lookup] = usernames[row[user_field]] if row[user_field] else None
+    # Formatted here for both writers, the CSV one would write str(datetime)
+    for lookup in TIMESTAMP_FIELDS:
+        if row.get(lookup) is not None:
+            row[lookup] = format_timestamp(row[lookup])
+    return {name: row[lookup] for name, lookup in fields.items()}
+
+
+def iter_project_rows(project_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield ('issue', row) then ('comment', row) of its comments, issue by issue"""
+    # Streamed after the view returned: the shard is given explicitly
+    alias = sharding.db_for_project(project_id)
+    usernames = Usernames(project_id, alias) if alias else None
+    last_id = 0
+    while True:
+        issues = list(
+            Issue.objects.using(alias).filter(project_id=project_id, pk__gt=last_id)
+            .order_by('pk')
+            .values(*_lookups(ISSUE_FIELDS, usernames))[:chunk_size]
+        )
+        if not issues:
+            return
+        comments = (
+            Comment.objects.using(alias).filter(issue_id__in=[issue['id'] for issue in issues])
+            .order_by('issue_id', 'created_at', 'uuid')
+            .values(*_lookups(COMMENT_FIELDS, usernames))
+            .iterator(chunk_size=chunk_size)
+        )
+        comment = next(comments, None)
+        for issue in issues:
+            yield 'issue', _rename(issue, ISSUE_FIELDS, usernames)
+            while comment is not None and comment['issue_id'] == issue['id']:
+                yield 'comment', _rename(comment, COMMENT_FIELDS, usernames)
+                comment = next(comments, None)
+        last_id = issues[-1]['id']
+
+
+def iter_ndjson(project_id):
+    encoder = DjangoJSONEncoder()
+    for kind, row in iter_project_rows(project_id):
+        yield encoder.encode({'type': kind, **row}) + '\n'
+
+
+class _Echo:
+    """File-like object returning what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(project_id):
+    writer = csv.DictWriter(_Echo(), fieldnames=CSV_COLUMNS, extrasaction='ignore')
+    yield writer.writerow(dict(zip(CSV_COLUMNS, CSV_COLUMNS)))
+    for kind, row in iter_project_rows(project_id):
+        if kind == 'comment':
+            row = {**row, 'id': row['uuid']}
+        yield writer.writerow({'type': kind, **row})
@@ -0,0 +1,67 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from tracking_projects.models import Issue
+
+
+class IssueFilterBackend(BaseFilterBackend):
+    """
+    Filter issues on ?status=, ?priority=, ?tag= (comma separated values)
+    and ?assigned_to=<user_id>|me|none.
+    Every combination is served by an index starting with project (see Issue.Meta.indexes).
+    """
+    choice_filters = {
+        'status': Issue.STATUS_CHOICES,
+        'priority': Issue.PRIORITY_CHOICES,
+        'tag': Issue.TAG_CHOICES,
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        if view.action != 'list':
+            return queryset
+        params = request.query_params
+        errors = {}
+
+        for field, choices in self.choice_filters.items():
+            if field not in params:
+                continue
+            values = [value.strip() for value in params[field].split(',') if value.strip()]
+            allowed = {value for value, _ in choices}
+            invalid = [value for value in values if value not in allowed]
+            if invalid or not values:
+                errors[field] = f"Valeurs possibles : {', '.join(sorted(allowed))}"
+                continue
+            if len(values) == 1:
+                queryset = queryset.filter(**{field: values[0]})
+            else:
+                queryset = queryset.filter(**{f'{field}__in': values})
+
+        assigned_to = params.get('assigned_to')
+        if assigned_to == 'none':
+            queryset = queryset.filter(assigned_to__isnull=True)
+        elif assigned_to == 'me':
+            queryset = queryset.filter(assigned_to=request.user)
+        elif assigned_to is not None:
+            if not assigned_to.isdigit():
+                errors['assigned_to'] = "Identifiant d'utilisateur, 'me' ou 'none' attendu."
+            else:
+                queryset = queryset.filter(assigned_to_id=int(assigned_to))
+
+        if errors:
+            raise ValidationError(errors)
+        return queryset
+
+
+class CreatedAtOrderingFilter(OrderingFilter):
+    """
+    ?ordering=created_at or -created_at, pk breaking ties in the same direction.
+    Used by the cursor pagination to pick its ordering.
+    """
+    ordering_fields = ['created_at']
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view) or view.pagination_class.ordering)
+        if ordering and ordering[-1].lstrip('-') != 'pk':
+            direction = '-' if ordering[0].startswith('-') else ''
+            ordering.append(f'{direction}pk')
+        return ordering
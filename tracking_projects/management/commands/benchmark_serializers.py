@@ -0,0 +1,109 @@
+"""
+Compare the DRF list serializers with their compiled version (tracking_projects.compiled).
+
+Sample issues and comments are created in transactions rolled back at the end.
+For each list serializer, a page of --rows rows is serialized --repeat times by
+both: serialization alone (rows already loaded), then loading + serialization.
+Best times are reported, after checking both render the same JSON.
+"""
+import time
+from contextlib import ExitStack
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.renderers import JSONRenderer
+
+from tracking_projects import compiled, sharding
+from tracking_projects.models import Project, Issue, Comment
+from tracking_projects.serializers import IssueListSerializer, CommentListSerializer
+
+User = get_user_model()
+
+
+def best_time(function, repeat):
+    """Return the best duration of function() over repeat runs, in milliseconds"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations) * 1000
+
+
+class Command(BaseCommand):
+    help = "Benchmark the compiled list serializers against the DRF serializers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Rows per page (default 1000)")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per measure (default 5)")
+
+    def handle(self, *args, rows=1000, repeat=5, **options):
+        if rows < 1 or repeat < 1:
+            raise CommandError("--rows et --repeat doivent être positifs.")
+        aliases = {DEFAULT_DB_ALIAS, *sharding.shard_aliases()}
+        with ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(transaction.atomic(using=alias))
+            try:
+                project = self.create_sample(rows)
+                with sharding.for_project(project.pk):
+                    self.benchmark(project, rows, repeat)
+            finally:
+                for alias in aliases:
+                    transaction.set_rollback(True, using=alias)
+
+    def create_sample(self, rows):
+        """Return a project with `rows` issues, the first one having `rows` comments"""
+        author = User.objects.create(username="benchmark-author", date_of_birth=date(2000, 1, 1))
+        assignee = User.objects.create(username="benchmark-assignee", date_of_birth=date(2000, 1, 1))
+        project = Project.objects.create(name="Benchmark", description="Benchmark", type='back-end', author=author)
+        with sharding.for_project(project.pk):
+            issues = Issue.objects.bulk_create(sharding.assign_ids([
+                Issue(
+                    title=f"Issue {index}", project=project, author=author,
+                    assigned_to=assignee if index % 2 else None,
+                )
+                for index in range(rows)
+            ]))
+            Comment.objects.bulk_create([
+                Comment(description=f"Commentaire {index}", issue=issues[0], author=author)
+                for index in range(rows)
+            ])
+        return project
+
+    def benchmark(self, project, rows, repeat):
+        cases = [
+            (IssueListSerializer, sharding.with_users(Issue.objects.filter(project=project), 'author')),
+            (CommentListSerializer, sharding.with_users(Comment.objects.filter(issue__project=project), 'author')),
+        ]
+        renderer = JSONRenderer()
+        for serializer_class, queryset in cases:
+            compiled_serializer = compiled.compile_serializer(serializer_class)
+            queryset = queryset.order_by('-created_at', '-pk')[:rows]
+            rows_queryset = compiled_serializer.rows(queryset)
+            instances, row_tuples = list(queryset), list(rows_queryset)
+
+            expected = renderer.render(serializer_class(instances, many=True).data)
+            if renderer.render(compiled_serializer.serialize(row_tuples)) != expected:
+                raise CommandError(f"{serializer_class.__name__} : les JSON diffèrent.")
+
+            measures = [
+                (
+                    "serialize",
+                    best_time(lambda: serializer_class(instances, many=True).data, repeat),
+                    best_time(lambda: compiled_serializer.serialize(row_tuples), repeat),
+                ),
+                (
+                    "load + serialize",
+                    best_time(lambda: serializer_class(list(queryset.all()), many=True).data, repeat),
+                    best_time(lambda: compiled_serializer.serialize(list(rows_queryset.all())), repeat),
+                ),
+            ]
+            self.stdout.write(f"{serializer_class.__name__} ({len(instances)} rows)")
+            for name, drf_time, compiled_time in measures:
+                self.stdout.write(
+                    f"  {name:<17} DRF {drf_time:8.2f} ms   compiled {compiled_time:8.2f} ms"
+                    f"   x{drf_time / compiled_time:.1f}"
+                )
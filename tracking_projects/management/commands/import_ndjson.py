@@ -0,0 +1,256 @@
+"""
+Import issues and comments into a project from an NDJSON file.
+
+Lines use the export format (see tracking_projects.export):
+    {"type": "issue", "id": 12, "title": "...", "author_name": "...", ...}
+    {"type": "comment", "issue": 12, "uuid": "...", "description": "...", "author_name": "...", ...}
+
+A comment's issue is the issue imported with that id in the same batch or the
+one before (the export writes comments right after their issue), otherwise the
+issue of the project with that id: comments can be added to existing issues.
+Comments of any other issue are rejected. Authors are resolved by author_name (username),
+or author (id), and must be contributors of the project.
+
+The file is read line by line and imported by batches: each batch is validated
+against preloaded issue / author maps and inserted with bulk_create in its own
+transaction, which also saves its end offset in an ImportCheckpoint row: a
+batch is imported and checkpointed, or neither, so an interrupted import resumed
+with --resume imports each issue once. Comments keep their uuid (or get one
+generated): comments already in the database are skipped, so replaying a file
+without --resume does not duplicate them (its issues are imported again).
+"""
+import json
+import os
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from tracking_projects import membership, sharding
+from tracking_projects.models import Project, Issue, Comment, ImportCheckpoint
+from tracking_projects.serializers import BulkCreateIssueSerializer, CreateCommentSerializer
+from tracking_projects.signals import bulk_created, bulk_write
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Import issues and comments into a project from an NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON file")
+        parser.add_argument('--project', type=int, required=True, help="Target project id")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--checkpoint', help="Checkpoint name (default: absolute path of the file)"
+        )
+        parser.add_argument(
+            '--resume', action='store_true', help="Resume from the checkpoint"
+        )
+
+    def handle(self, *args, **options):
+        # Queries go to the shard of the project (see tracking_projects.sharding)
+        with sharding.for_project(options['project']):
+            self.import_file(options)
+
+    def import_file(self, options):
+        try:
+            self.project = Project.objects.get(pk=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError(f"Project {options['project']} does not exist")
+        _, self.contributor_ids = membership.get_membership(self.project.pk)
+        self.checkpoint_source = options['checkpoint'] or os.path.abspath(options['path'])
+        # Source issue id -> imported issue id, for the last two batches only
+        self.issue_ids, self.previous_issue_ids = {}, {}
+        self.counts = {'issues': 0, 'comments': 0, 'skipped': 0, 'errors': 0}
+
+        offset, line_number = 0, 0
+        checkpoint = ImportCheckpoint.objects.filter(
+            project=self.project, source=self.checkpoint_source
+        ).first()
+        if options['resume'] and checkpoint is not None:
+            offset, line_number = checkpoint.offset, checkpoint.line
+            self.issue_ids = {int(key): value for key, value in checkpoint.issue_ids.items()}
+
+        with open(options['path'], 'rb') as stream:
+            stream.seek(offset)
+            batch = []
+            for raw_line in stream:
+                offset += len(raw_line)
+                line_number += 1
+                if raw_line.strip():
+                    batch.append((line_number, raw_line))
+                if len(batch) >= options['batch_size']:
+                    self.import_batch(batch, offset, line_number)
+                    batch = []
+            if batch:
+                self.import_batch(batch, offset, line_number)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.counts['issues']} issues, {self.counts['comments']} comments imported, "
+            f"{self.counts['skipped']} comments already imported, {self.counts['errors']} lines rejected"
+        ))
+
+    def save_checkpoint(self, offset, line_number):
+        """Save the end of the current batch, in its transaction"""
+        ImportCheckpoint.objects.update_or_create(
+            project=self.project, source=self.checkpoint_source,
+            defaults={'offset': offset, 'line': line_number, 'issue_ids': self.issue_ids},
+        )
+
+    def reject(self, line_number, errors):
+        self.counts['errors'] += 1
+        self.stderr.write(f"line {line_number}: {errors}")
+
+    def import_batch(self, batch, offset, line_number):
+        records = []
+        for line_number, raw_line in batch:
+            try:
+                record = json.loads(raw_line)
+            except ValueError as error:
+                self.reject(line_number, error)
+                continue
+            if not isinstance(record, dict) or record.get('type') not in ('issue', 'comment'):
+                self.reject(line_number, "type must be 'issue' or 'comment'")
+                continue
+            records.append((line_number, record))
+
+        authors = self.load_authors(record for _, record in records)
+        self.previous_issue_ids, self.issue_ids = self.issue_ids, {}
+
+        with transaction.atomic(using=sharding.db_for_project(self.project.pk)), bulk_write():
+            pending_comments = self.import_issues(records, authors)
+            self.import_comments(pending_comments, authors)
+            self.save_checkpoint(offset, line_number)
+
+    def load_authors(self, records):
+        """Return {username: id} and {id: id} of authors referenced by records, with one query"""
+        records = list(records)
+        usernames = {record['author_name'] for record in records if record.get('author_name')}
+        ids = {record['author'] for record in records if isinstance(record.get('author'), int)}
+        rows = User.objects.filter(username__in=usernames) | User.objects.filter(pk__in=ids)
+        authors = {}
+        for pk, username in rows.values_list('pk', 'username'):
+            authors[username] = authors[pk] = pk
+        return authors
+
+    def resolve_author(self, record, authors):
+        author_id = authors.get(record.get('author_name')) or authors.get(record.get('author'))
+        if author_id is None or author_id not in self.contributor_ids:
+            return None
+        return author_id
+
+    def import_issues(self, records, authors):
+        """Insert issue records, return comment records left to import"""
+        context = {'contributor_ids': self.contributor_ids}
+        issues, sources, comments = [], [], []
+        for line_number, record in records:
+            if record['type'] == 'comment':
+                comments.append((line_number, record))
+                continue
+            serializer = BulkCreateIssueSerializer(data=record, context=context)
+            if not serializer.is_valid():
+                self.reject(line_number, serializer.errors)
+                continue
+            author_id = self.resolve_author(record, authors)
+            if author_id is None:
+                self.reject(line_number, "unknown author or not a contributor")
+                continue
+            data = dict(serializer.validated_data)
+            assigned_to_id = data.pop('assigned_to', None)
+            issues.append(Issue(
+                **data, assigned_to_id=assigned_to_id, project=self.project, author_id=author_id
+            ))
+            sources.append(record)
+
+        if issues:
+            issues = Issue.objects.bulk_create(sharding.assign_ids(issues))
+            self.restore_created_at(Issue, issues, sources)
+            for record, issue in zip(sources, issues):
+                if record.get('id') is not None:
+                    self.issue_ids[record['id']] = issue.pk
+            bulk_created.send(sender=Issue, project_id=self.project.pk, instances=issues)
+            self.counts['issues'] += len(issues)
+        return comments
+
+    def load_project_issues(self, records):
+        """Return the ids of project issues referenced by comment records and not imported, with one query"""
+        ids = {record['issue'] for _, record in records if isinstance(record.get('issue'), int)}
+        ids -= self.issue_ids.keys() | self.previous_issue_ids.keys()
+        if not ids:
+            return set()
+        return set(Issue.objects.filter(project=self.project, pk__in=ids).values_list('pk', flat=True))
+
+    def resolve_issue(self, record, project_issues):
+        """
+        Return the issue of a comment record: the issue imported from its source id
+        in this batch or the previous one, else the project issue with that id, else None.
+        """
+        source_id = record.get('issue')
+        issue_id = self.issue_ids.get(source_id)
+        if issue_id is None and source_id in self.previous_issue_ids:
+            # Kept for the next batch: comments of an issue may span several batches
+            issue_id = self.issue_ids[source_id] = self.previous_issue_ids[source_id]
+        if issue_id is None and source_id in project_issues:
+            issue_id = source_id
+        return issue_id
+
+    def import_comments(self, records, authors):
+        comments, sources = [], []
+        project_issues = self.load_project_issues(records)
+        for line_number, record in records:
+            issue_id = self.resolve_issue(record, project_issues)
+            serializer = CreateCommentSerializer(data=record)
+            if not serializer.is_valid():
+                self.reject(line_number, serializer.errors)
+                continue
+            author_id = self.resolve_author(record, authors)
+            if issue_id is None or author_id is None:
+                self.reject(line_number, "unknown issue, or author not a contributor")
+                continue
+            try:
+                comment_uuid = uuid.UUID(str(record['uuid'])) if record.get('uuid') else uuid.uuid4()
+            except ValueError:
+                self.reject(line_number, "invalid uuid")
+                continue
+            comments.append(Comment(
+                uuid=comment_uuid, issue_id=issue_id, author_id=author_id,
+                **serializer.validated_data,
+            ))
+            sources.append(record)
+
+        comments, sources = self.exclude_imported(comments, sources)
+        if comments:
+            Comment.objects.bulk_create(comments)
+            self.restore_created_at(Comment, comments, sources)
+            bulk_created.send(sender=Comment, project_id=self.project.pk, instances=comments)
+            self.counts['comments'] += len(comments)
+
+    def exclude_imported(self, comments, sources):
+        """Return comments (and their records) whose uuid is not already in the database or the batch"""
+        seen = set(
+            Comment.objects.filter(uuid__in=[comment.uuid for comment in comments])
+            .values_list('uuid', flat=True)
+        )
+        new_comments, new_sources = [], []
+        for comment, record in zip(comments, sources):
+            if comment.uuid in seen:
+                self.counts['skipped'] += 1
+                continue
+            seen.add(comment.uuid)
+            new_comments.append(comment)
+            new_sources.append(record)
+        return new_comments, new_sources
+
+    def restore_created_at(self, model, instances, records):
+        """auto_now_add overrides created_at on insert: set it back from the records"""
+        dated = []
+        for instance, record in zip(instances, records):
+            created_at = parse_datetime(record['created_at']) if record.get('created_at') else None
+            if created_at is not None:
+                instance.created_at = created_at
+                dated.append(instance)
+        if dated:
+            model.objects.bulk_update(dated, ['created_at'])
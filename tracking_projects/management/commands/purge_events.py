@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tracking_projects import events
+
+
+class Command(BaseCommand):
+    help = "Delete activity events older than the event stream retention"
+
+    def handle(self, *args, **options):
+        deleted = events.purge()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} event(s) deleted"))
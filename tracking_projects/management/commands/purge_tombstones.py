@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tracking_projects import sync
+
+
+class Command(BaseCommand):
+    help = "Delete tombstones older than the changes feed retention"
+
+    def handle(self, *args, **options):
+        deleted = sync.purge_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} tombstone(s) deleted"))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tracking_projects import sharding, statistics
+from tracking_projects.models import ProjectCounter
+
+
+class Command(BaseCommand):
+    help = "Recompute the statistics counters of projects and report drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', dest='projects',
+                            help="Only this project (repeatable)")
+        parser.add_argument('--verify', action='store_true',
+                            help="Report drift without rewriting counters")
+
+    def handle(self, *args, projects=None, verify=False, **options):
+        drifted, rebuilt = 0, 0
+        for alias in sharding.databases():
+            with sharding.using_shard(alias):
+                computed = statistics.compute_counters(projects)
+                drifted += self.rebuild(computed, verify, alias)
+            rebuilt += len(computed)
+
+        if verify:
+            if drifted:
+                self.stdout.write(self.style.WARNING(f"{drifted} counter(s) drifted"))
+            else:
+                self.stdout.write(self.style.SUCCESS("No drift"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Statistics rebuilt for {rebuilt} project(s), {drifted} counter(s) fixed"
+        ))
+
+    def rebuild(self, computed, verify, alias):
+        """Report, and unless verify rewrite, the counters of a database; return how many drifted"""
+        stored = {}
+        for project_id, name, value in ProjectCounter.objects.filter(
+                project_id__in=list(computed)).values_list('project_id', 'name', 'value'):
+            stored.setdefault(project_id, {})[name] = value
+
+        drifted = 0
+        for project_id, values in computed.items():
+            current = stored.get(project_id, {})
+            for name, value in values.items():
+                if current.get(name) != value:
+                    drifted += 1
+                    self.stdout.write(
+                        f"project {project_id} {name}: {current.get(name)} -> {value}"
+                    )
+
+        if verify:
+            return drifted
+
+        with transaction.atomic(using=alias):
+            statistics.create_counters(list(computed))
+            counters = list(ProjectCounter.objects.filter(project_id__in=list(computed)))
+            for counter in counters:
+                counter.value = computed[counter.project_id].get(counter.name, 0)
+            ProjectCounter.objects.bulk_update(counters, ['value'], batch_size=500)
+        return drifted
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+
+from tracking_projects import search, sharding
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SQLite FTS5 indexes of issues and comments"
+
+    def handle(self, *args, **options):
+        for alias in sharding.databases():
+            database = connections[alias] if alias else connection
+            if database.vendor != 'sqlite':
+                self.stdout.write("Search indexes are only used with SQLite.")
+                return
+            if search.restore_index(alias):
+                # Missing tables / triggers created again, every row indexed
+                continue
+            with transaction.atomic(using=alias), database.cursor() as cursor:
+                for statement in search.REBUILD_SQL:
+                    cursor.execute(statement)
+        self.stdout.write(self.style.SUCCESS("Search indexes rebuilt"))
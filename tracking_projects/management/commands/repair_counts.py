@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from tracking_projects import sharding
+from tracking_projects.models import Project, Contributor, Issue, Comment
+
+
+def count_subquery(queryset, field):
+    """Return a correlated COUNT(*) of queryset rows grouped on field"""
+    counted = queryset.order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted), 0)
+
+
+class Command(BaseCommand):
+    help = "Verify or repair the denormalized counts of projects and issues"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', dest='projects',
+                            help="Only this project (repeatable)")
+        parser.add_argument('--verify', action='store_true',
+                            help="Report drift without repairing counts")
+
+    def handle(self, *args, projects=None, verify=False, **options):
+        drifted = 0
+        for alias in sharding.databases():
+            with sharding.using_shard(alias):
+                drifted += self.repair(projects, verify, alias)
+
+        if verify:
+            if drifted:
+                self.stdout.write(self.style.WARNING(f"{drifted} count(s) drifted"))
+            else:
+                self.stdout.write(self.style.SUCCESS("No drift"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"{drifted} count(s) repaired"))
+
+    def repair(self, projects, verify, alias):
+        """Report, and unless verify repair, the counts of a database; return how many drifted"""
+        project_rows, issue_rows = Project.objects.all(), Issue.objects.all()
+        if projects:
+            project_rows = project_rows.filter(pk__in=projects)
+            issue_rows = issue_rows.filter(project_id__in=projects)
+
+        checks = [
+            (project_rows, 'contributors_count', Contributor.objects.filter(project=OuterRef('pk')), 'project'),
+            (project_rows, 'issues_count', Issue.objects.filter(project=OuterRef('pk')), 'project'),
+            (project_rows, 'comments_count', Comment.objects.filter(issue__project=OuterRef('pk')), 'issue__project'),
+            (issue_rows, 'comments_count', Comment.objects.filter(issue=OuterRef('pk')), 'issue'),
+        ]
+        drifted = 0
+        with transaction.atomic(using=alias):
+            for queryset, field, children, group in checks:
+                rows = (
+                    queryset.annotate(expected=count_subquery(children, group))
+                    .exclude(**{field: F('expected')})
+                    .values_list('pk', field, 'expected')
+                )
+                repaired = []
+                for pk, stored, expected in rows:
+                    drifted += 1
+                    self.stdout.write(
+                        f"{queryset.model._meta.model_name} {pk} {field}: {stored} -> {expected}"
+                    )
+                    repaired.append(queryset.model(pk=pk, **{field: expected}))
+                if not verify:
+                    queryset.model.objects.bulk_update(repaired, [field], batch_size=500)
+        return drifted
@@ -0,0 +1,116 @@
+"""
+Project membership resolver.
+
+Answer "is user U a contributor / the author of project P" from the cache.
+One entry per project holds the author id and the set of contributor ids; it is
+loaded with a single query and invalidated by the Project / Contributor signals
+(see tracking_projects.signals). It is loaded from the primary: a replica lagging
+behind the invalidation would cache the old membership again.
+
+Invalidation only reaches the other worker processes through a shared cache
+(REDIS_URL): with the per process LocMemCache, entries live a few seconds only
+(see config.caches).
+"""
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from config.caches import invalidated_timeout
+from tracking_projects import sharding
+from tracking_projects.models import Project
+
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 10
+
+
+def cache_key(project_id):
+    return f'tracking_projects:membership:{project_id}'
+
+
+def cache_timeout():
+    """Return the lifetime of an entry, short when the cache is not shared between processes"""
+    return invalidated_timeout(MEMBERSHIP_CACHE_TIMEOUT)
+
+
+def _project_id(value):
+    """Return value as a project id, None if it is not a valid id"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_membership(project_id):
+    """
+    Return (author_id, contributor_ids) of project.
+    Return None if project does not exist.
+    """
+    project_id = _project_id(project_id)
+    if project_id is None:
+        return None
+
+    key = cache_key(project_id)
+    membership = cache.get(key)
+    if membership is None:
+        membership = _from_rows(list(_rows(project_id)))
+        if membership is None:
+            return None
+        cache.set(key, membership, cache_timeout())
+    return membership
+
+
+async def aget_membership(project_id):
+    """get_membership() for async views"""
+    project_id = _project_id(project_id)
+    if project_id is None:
+        return None
+
+    key = cache_key(project_id)
+    membership = await cache.aget(key)
+    if membership is None:
+        membership = _from_rows([row async for row in _rows(project_id)])
+        if membership is None:
+            return None
+        await cache.aset(key, membership, cache_timeout())
+    return membership
+
+
+def _rows(project_id):
+    return (
+        Project.objects.using(sharding.db_for_project(project_id) or DEFAULT_DB_ALIAS)
+        .filter(pk=project_id).values_list('author_id', 'contributors__user_id')
+    )
+
+
+def _from_rows(rows):
+    """Return (author_id, contributor_ids) from (author_id, contributor id) rows"""
+    if not rows:
+        return None
+    author_id = rows[0][0]
+    return author_id, frozenset(user_id for _, user_id in rows if user_id is not None)
+
+
+def is_contributor(user, project_id):
+    """Return True if user is a contributor of project"""
+    membership = get_membership(project_id)
+    return membership is not None and user.pk in membership[1]
+
+
+async def ais_contributor(user, project_id):
+    """is_contributor() for async views"""
+    membership = await aget_membership(project_id)
+    return membership is not None and user.pk in membership[1]
+
+
+def is_author(user, project_id):
+    """Return True if user is the author of project"""
+    membership = get_membership(project_id)
+    return membership is not None and membership[0] == user.pk
+
+
+def invalidate(project_id):
+    """
+    Drop the cached membership of project.
+    Dropped again on commit: a concurrent read may have cached the old rows meanwhile.
+    """
+    key = cache_key(project_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from tracking_projects import search
+
+# SQLite FTS5 indexes of issues and comments, kept in sync by triggers.
+# Their DDL is tracking_projects.search's: later migrations remaking the issue /
+# comment tables create it again, as restore_index() does after each migrate.
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking_projects', '0004_project_version_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(search.CREATE_SQL + search.REBUILD_SQL), _run(search.DROP_SQL)),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+COUNTED_FIELDS = ('status', 'priority', 'tag')
+
+
+def populate_counters(apps, schema_editor):
+    """Create the counters of existing projects from their rows"""
+    Project = apps.get_model('tracking_projects', 'Project')
+    Contributor = apps.get_model('tracking_projects', 'Contributor')
+    Issue = apps.get_model('tracking_projects', 'Issue')
+    Comment = apps.get_model('tracking_projects', 'Comment')
+    ProjectCounter = apps.get_model('tracking_projects', 'ProjectCounter')
+
+    names = ['issues', 'comments', 'contributors'] + [
+        f'{field}:{value}'
+        for field in COUNTED_FIELDS for value, _ in Issue._meta.get_field(field).choices
+    ]
+    counters = {pk: dict.fromkeys(names, 0) for pk in Project.objects.values_list('pk', flat=True)}
+    for project_id, total in Issue.objects.values_list('project_id').annotate(models.Count('pk')).order_by():
+        counters[project_id]['issues'] = total
+    for project_id, total in Contributor.objects.values_list('project_id').annotate(models.Count('pk')).order_by():
+        counters[project_id]['contributors'] = total
+    for project_id, total in Comment.objects.values_list('issue__project_id').annotate(models.Count('pk')).order_by():
+        counters[project_id]['comments'] = total
+    for field in COUNTED_FIELDS:
+        rows = Issue.objects.values_list('project_id', field).annotate(models.Count('pk')).order_by()
+        for project_id, value, total in rows:
+            counters[project_id][f'{field}:{value}'] = total
+    ProjectCounter.objects.bulk_create(
+        [
+            ProjectCounter(project_id=project_id, name=name, value=value)
+            for project_id, values in counters.items() for name, value in values.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking_projects', '0006_issue_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('value', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counters', to='tracking_projects.project')),
+            ],
+            options={
+                'unique_together': {('project', 'name')},
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from tracking_projects import search
+
+
+def count_of(queryset, field):
+    """Return a correlated COUNT(*) of queryset rows grouped on field"""
+    counted = queryset.order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted), 0)
+
+
+def recreate_search_index(apps, schema_editor):
+    """Adding columns remakes tracking_projects_issue on SQLite, dropping its FTS triggers"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in search.DROP_SQL + search.CREATE_SQL + search.REBUILD_SQL:
+        schema_editor.execute(statement)
+
+
+def populate_counts(apps, schema_editor):
+    Project = apps.get_model('tracking_projects', 'Project')
+    Contributor = apps.get_model('tracking_projects', 'Contributor')
+    Issue = apps.get_model('tracking_projects', 'Issue')
+    Comment = apps.get_model('tracking_projects', 'Comment')
+    Issue.objects.update(
+        comments_count=count_of(Comment.objects.filter(issue=OuterRef('pk')), 'issue'),
+    )
+    Project.objects.update(
+        contributors_count=count_of(Contributor.objects.filter(project=OuterRef('pk')), 'project'),
+        issues_count=count_of(Issue.objects.filter(project=OuterRef('pk')), 'project'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking_projects', '0007_project_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='comments_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='contributors_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='issues_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(recreate_search_index, migrations.RunPython.noop),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
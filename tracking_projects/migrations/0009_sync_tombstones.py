@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-18 11:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def contributor_updated_at(apps, schema_editor):
+    """Existing contributors have not changed since they were added"""
+    Contributor = apps.get_model('tracking_projects', 'Contributor')
+    Contributor.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking_projects', '0008_denormalized_counts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('project', 'Projet'), ('contributor', 'Contributeur'), ('issue', 'Issue'), ('comment', 'Commentaire')], max_length=20)),
+                ('object_id', models.CharField(max_length=36)),
+                ('project_id', models.IntegerField()),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['deleted_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='contributor',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(contributor_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['issue', 'updated_at'], name='tracking_pr_issue_i_b173d5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributor',
+            index=models.Index(fields=['project', 'updated_at'], name='tracking_pr_project_8e5efb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributor',
+            index=models.Index(fields=['user', 'created_at'], name='tracking_pr_user_id_a6ad3c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['project', 'updated_at'], name='tracking_pr_project_c0073a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['project_id', 'deleted_at'], name='tracking_pr_project_98cd7e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user_id', 'deleted_at'], name='tracking_pr_user_id_06a5da_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at'], name='tracking_pr_deleted_dacbae_idx'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from tracking_projects import search
+
+SEQUENCES = ('project', 'contributor', 'issue')
+
+
+def recreate_search_index(apps, schema_editor):
+    """Altering the author foreign keys remakes the issue / comment tables on SQLite, dropping the FTS triggers"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in search.DROP_SQL + search.CREATE_SQL + search.REBUILD_SQL:
+        schema_editor.execute(statement)
+
+
+def populate_membership_index(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Contributor = apps.get_model('tracking_projects', 'Contributor')
+    MembershipIndex = apps.get_model('tracking_projects', 'MembershipIndex')
+    rows = Contributor.objects.using(db_alias).values_list('user_id', 'project_id', 'project__created_at', 'created_at')
+    MembershipIndex.objects.using(db_alias).bulk_create(
+        [
+            MembershipIndex(user_id=user_id, project_id=project_id, created_at=created_at, joined_at=joined_at)
+            for user_id, project_id, created_at, joined_at in rows.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+def seed_id_sequences(apps, schema_editor):
+    """Global ids continue after the existing rows"""
+    db_alias = schema_editor.connection.alias
+    IdSequence = apps.get_model('tracking_projects', 'IdSequence')
+    for model_name in SEQUENCES:
+        model = apps.get_model('tracking_projects', model_name)
+        last_id = model.objects.using(db_alias).aggregate(last_id=models.Max('pk'))['last_id'] or 0
+        IdSequence.objects.using(db_alias).create(name=f'tracking_projects.{model_name}', next_id=last_id + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking_projects', '0010_activity_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('next_id', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='authored_comments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='contributor',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='contributions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='issue',
+            name='assigned_to',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_issues', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='issue',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='issues', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='authored_projects', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='MembershipIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project_id', models.IntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('joined_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='membership_index', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='tracking_pr_user_id_d61fe9_idx'), models.Index(fields=['project_id'], name='tracking_pr_project_10d030_idx')],
+                'unique_together': {('user', 'project_id')},
+            },
+        ),
+        migrations.RunPython(recreate_search_index, migrations.RunPython.noop),
+        migrations.RunPython(populate_membership_index, migrations.RunPython.noop),
+        migrations.RunPython(seed_id_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Totals now read from the counts of Project
+TOTAL_COUNTERS = ('issues', 'comments', 'contributors')
+
+
+def populate_comments_count(apps, schema_editor):
+    Project = apps.get_model('tracking_projects', 'Project')
+    Comment = apps.get_model('tracking_projects', 'Comment')
+    db_alias = schema_editor.connection.alias
+    counted = (
+        Comment.objects.filter(issue__project=OuterRef('pk')).order_by()
+        .values('issue__project').annotate(total=Count('pk')).values('total')
+    )
+    Project.objects.using(db_alias).update(comments_count=Coalesce(Subquery(counted), 0))
+
+
+def delete_total_counters(apps, schema_editor):
+    ProjectCounter = apps.get_model('tracking_projects', 'ProjectCounter')
+    ProjectCounter.objects.using(schema_editor.connection.alias).filter(name__in=TOTAL_COUNTERS).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking_projects', '0011_sharding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='comments_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_comments_count, migrations.RunPython.noop),
+        migrations.RunPython(delete_total_counters, migrations.RunPython.noop),
+    ]
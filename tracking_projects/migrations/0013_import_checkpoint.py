@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking_projects', '0012_project_comments_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('line', models.IntegerField(default=0)),
+                ('issue_ids', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_checkpoints', to='tracking_projects.project')),
+            ],
+            options={
+                'unique_together': {('project', 'source')},
+            },
+        ),
+    ]
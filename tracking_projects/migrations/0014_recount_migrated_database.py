@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTED_FIELDS = ('status', 'priority', 'tag')
+
+
+def count_of(queryset, field):
+    """Return a correlated COUNT(*) of queryset rows grouped on field"""
+    counted = queryset.order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted), 0)
+
+
+def recount_counts(apps, schema_editor):
+    """Counts of 0008 / 0012, from the rows of the database being migrated (a shard or 'default')"""
+    Project = apps.get_model('tracking_projects', 'Project')
+    Contributor = apps.get_model('tracking_projects', 'Contributor')
+    Issue = apps.get_model('tracking_projects', 'Issue')
+    Comment = apps.get_model('tracking_projects', 'Comment')
+    db_alias = schema_editor.connection.alias
+    Issue.objects.using(db_alias).update(
+        comments_count=count_of(Comment.objects.filter(issue=OuterRef('pk')), 'issue'),
+    )
+    Project.objects.using(db_alias).update(
+        contributors_count=count_of(Contributor.objects.filter(project=OuterRef('pk')), 'project'),
+        issues_count=count_of(Issue.objects.filter(project=OuterRef('pk')), 'project'),
+        comments_count=count_of(Comment.objects.filter(issue__project=OuterRef('pk')), 'issue__project'),
+    )
+
+
+def recount_counters(apps, schema_editor):
+    """Breakdown counters of 0007, rebuilt from the rows of the database being migrated"""
+    Project = apps.get_model('tracking_projects', 'Project')
+    Issue = apps.get_model('tracking_projects', 'Issue')
+    ProjectCounter = apps.get_model('tracking_projects', 'ProjectCounter')
+    db_alias = schema_editor.connection.alias
+
+    names = [
+        f'{field}:{value}'
+        for field in COUNTED_FIELDS for value, _ in Issue._meta.get_field(field).choices
+    ]
+    counters = {pk: dict.fromkeys(names, 0) for pk in Project.objects.using(db_alias).values_list('pk', flat=True)}
+    for field in COUNTED_FIELDS:
+        rows = Issue.objects.using(db_alias).values_list('project_id', field).annotate(models.Count('pk')).order_by()
+        for project_id, value, total in rows:
+            counters[project_id][f'{field}:{value}'] = total
+    ProjectCounter.objects.using(db_alias).all().delete()
+    ProjectCounter.objects.using(db_alias).bulk_create(
+        [
+            ProjectCounter(project_id=project_id, name=name, value=value)
+            for project_id, values in counters.items() for name, value in values.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    0007 / 0008 queried without a database: with shards, they now run on the
+    database being migrated (see tracking_projects.sharding.begin_migration).
+    Their data is derived again here for databases migrated before.
+    """
+
+    dependencies = [
+        ('tracking_projects', '0013_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_counts, migrations.RunPython.noop),
+        migrations.RunPython(recount_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from tracking_projects import search
+
+# The FTS5 index of comments first created by 0005 was keyed on the implicit
+# rowid of tracking_projects_comment (uuid primary key), which a VACUUM may
+# renumber. Databases migrated before get the index of tracking_projects.search,
+# keyed on the search ids of tracking_projects_comment_fts_key.
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking_projects', '0014_recount_migrated_database'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run(search.DROP_SQL + search.CREATE_SQL + search.REBUILD_SQL), migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking_projects', '0015_comment_search_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contributor',
+            index=models.Index(fields=['project', 'created_at', 'id'], name='tracking_pr_project_472421_idx'),
+        ),
+    ]
@@ -1,10 +1,55 @@
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch
+from django.utils import timezone
 import uuid
 from config import settings
+from tracking_projects import sharding
 
 
-class Issue(models.Model):
+class MaintainedFieldsMixin:
+    """Leave columns maintained by atomic UPDATEs out of instance saves"""
+    MAINTAINED_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
+class ShardedMixin:
+    """
+    Save in the shard of the project, with an id unique across shards
+    (see tracking_projects.sharding).
+    """
+
+    def save(self, *args, **kwargs):
+        if sharding.enabled():
+            if self.pk is None:
+                self.pk = sharding.allocate_ids(self._meta.label_lower, 1)[0]
+                kwargs['force_insert'] = True
+            kwargs['using'] = sharding.db_for_instance(self) or kwargs.get('using')
+        super().save(*args, **kwargs)
+
+
+class IssueQuerySet(models.QuerySet):
+    """QuerySet for Issue"""
+
+    def with_previews(self, size):
+        """Prefetch the `size` latest comments in latest_comments"""
+        latest_comments = (
+            sharding.with_users(Comment.objects.all(), 'author')
+            .order_by('-created_at', '-uuid')[:size]
+        )
+        return self.prefetch_related(
+            Prefetch('comments', queryset=latest_comments, to_attr='latest_comments')
+        )
+
+
+class Issue(ShardedMixin, MaintainedFieldsMixin, models.Model):
     """Problem / Task in project"""
     PRIORITY_CHOICES = [
         ('LOW', 'Basse'),
@@ -44,10 +89,12 @@ class Issue(models.Model):
         on_delete=models.CASCADE,
         related_name='issues',
     )
+    # Users stay in 'default' when projects are sharded: no database constraint
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='issues',
+        db_constraint=False,
     )
     assigned_to = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -55,21 +102,56 @@ class Issue(models.Model):
         null=True,
         blank=True,
         related_name='assigned_issues',
+        db_constraint=False,
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by tracking_projects.signals, repaired by `manage.py repair_counts`
+    comments_count = models.IntegerField(default=0, editable=False)
+
+    MAINTAINED_FIELDS = ('comments_count',)
+
+    objects = IssueQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['project', '-created_at']),
+            models.Index(fields=['project', 'status', '-created_at']),
+            models.Index(fields=['project', 'priority', '-created_at']),
+            models.Index(fields=['project', 'tag', '-created_at']),
+            models.Index(fields=['project', 'assigned_to', '-created_at']),
+            models.Index(fields=['project', 'updated_at']),
             models.Index(fields=['author']),
-            models.Index(fields=['assigned_to']),
+            models.Index(fields=['assigned_to', 'status']),
             models.Index(fields=['status']),
         ]
 
     def __str__(self):
         return f"[{self.tag}] {self.title}"
 
+    # Fields counted by project statistics (see tracking_projects.statistics)
+    COUNTED_FIELDS = ('status', 'priority', 'tag')
+
+    def save(self, *args, **kwargs):
+        """
+        Read the counted values of the row being overwritten, locked in the transaction
+        of the save: statistics deltas (see tracking_projects.signals) are computed from
+        the row, not from the values this instance was loaded with.
+        """
+        update_fields = kwargs.get('update_fields')
+        fields = [field for field in self.COUNTED_FIELDS if update_fields is None or field in update_fields]
+        if self._state.adding or not fields:
+            self._previous_counted_values = None
+            return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(Issue, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            self._previous_counted_values = (
+                Issue._base_manager.using(using).select_for_update().filter(pk=self.pk)
+                .values(*fields).first()
+            )
+            super().save(*args, **kwargs)
+
     def clean(self):
         """Validate that assigned_to is a contributor of the project"""
         super().clean()
@@ -82,7 +164,7 @@ class Issue(models.Model):
                 })
 
 
-class Comment(models.Model):
+class Comment(ShardedMixin, models.Model):
     """comment in Issue"""
     uuid = models.UUIDField(
         default=uuid.uuid4,
@@ -100,20 +182,47 @@ class Comment(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='authored_comments',
+        db_constraint=False,
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['created_at']
         indexes = [
             models.Index(fields=['issue', '-created_at']),
+            models.Index(fields=['issue', 'updated_at']),
         ]
 
     def __str__(self):
         return f"Comment {self.uuid} sur {self.issue.title}"
 
 
-class Project(models.Model):
+class ProjectQuerySet(models.QuerySet):
+    """QuerySet for Project"""
+
+    def visible_to(self, user):
+        """Filter projects where user is a contributor (EXISTS, no join to dedupe)"""
+        membership = Contributor.objects.filter(project=OuterRef('pk'), user=user)
+        return self.filter(Exists(membership))
+
+    def with_previews(self, size):
+        """Prefetch the `size` latest contributors and issues in latest_contributors / latest_issues"""
+        latest_contributors = (
+            sharding.with_users(Contributor.objects.all(), 'user')
+            .order_by('-created_at', '-pk')[:size]
+        )
+        latest_issues = (
+            sharding.with_users(Issue.objects.all(), 'author')
+            .order_by('-created_at', '-pk')[:size]
+        )
+        return self.prefetch_related(
+            Prefetch('contributors', queryset=latest_contributors, to_attr='latest_contributors'),
+            Prefetch('issues', queryset=latest_issues, to_attr='latest_issues'),
+        )
+
+
+class Project(ShardedMixin, MaintainedFieldsMixin, models.Model):
     """Project model."""
     TYPE_CHOICES = [
         ('back-end', 'Back-end'),
@@ -128,9 +237,21 @@ class Project(models.Model):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='authored_projects'
+        related_name='authored_projects',
+        db_constraint=False,
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped on any write to the project, its issues, comments or contributors
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # Maintained by tracking_projects.signals, repaired by `manage.py repair_counts`
+    contributors_count = models.IntegerField(default=0, editable=False)
+    issues_count = models.IntegerField(default=0, editable=False)
+    comments_count = models.IntegerField(default=0, editable=False)
+
+    MAINTAINED_FIELDS = ('version', 'contributors_count', 'issues_count', 'comments_count')
+
+    objects = ProjectQuerySet.as_manager()
 
     class Meta:
         ordering = ['created_at']
@@ -150,15 +271,25 @@ class Project(models.Model):
             self.add_contributor(self.author)
 
     def add_contributor(self, user):
-        Contributor.objects.get_or_create(project=self, user=user)
+        self.contributors.get_or_create(user=user)
+
+    @classmethod
+    def bump_version(cls, counts=None, **filters):
+        """Atomically increment version, and counts ({field: delta}), of projects matching filters"""
+        cls.objects.filter(**filters).update(
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+            **{field: F(field) + delta for field, delta in (counts or {}).items()},
+        )
 
 
-class Contributor(models.Model):
+class Contributor(ShardedMixin, models.Model):
     """Contributor model. Connection between user and project. """
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='contributions'
+        related_name='contributions',
+        db_constraint=False,
     )
     project = models.ForeignKey(
         Project,
@@ -166,13 +297,147 @@ class Contributor(models.Model):
         related_name='contributors'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('user', 'project')
         ordering = ['created_at']
         indexes = [
             models.Index(fields=['project', 'user']),
+            models.Index(fields=['project', 'updated_at']),
+            models.Index(fields=['project', 'created_at', 'id']),
+            models.Index(fields=['user', 'created_at']),
         ]
 
     def __str__(self):
         return f"{self.user.username} contribue {self.project.name}"
+
+
+class ProjectCounter(models.Model):
+    """
+    Counter of a project statistic, maintained incrementally on writes
+    (see tracking_projects.statistics).
+    Names: '<field>:<value>' for Issue.COUNTED_FIELDS, totals are the counts of Project.
+    """
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='counters'
+    )
+    name = models.CharField(max_length=50)
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('project', 'name')
+
+    def __str__(self):
+        return f"{self.project_id} {self.name}: {self.value}"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of an NDJSON import into a project, saved in the transaction of each
+    batch (see tracking_projects.management.commands.import_ndjson).
+    """
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name='import_checkpoints'
+    )
+    source = models.CharField(max_length=255)
+    offset = models.BigIntegerField(default=0)
+    line = models.IntegerField(default=0)
+    # Source issue id -> imported issue id, of the last two batches
+    issue_ids = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('project', 'source')
+
+    def __str__(self):
+        return f"{self.project_id} {self.source}: ligne {self.line}"
+
+
+class Tombstone(models.Model):
+    """
+    Deleted project / contributor / issue / comment, kept for the changes feed
+    (see tracking_projects.sync).
+    Shown to the contributors of project_id, or only to user_id when set.
+    """
+    KIND_CHOICES = [
+        ('project', 'Projet'),
+        ('contributor', 'Contributeur'),
+        ('issue', 'Issue'),
+        ('comment', 'Commentaire'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.CharField(max_length=36)
+    # Plain ids: tombstones outlive the project and the user
+    project_id = models.IntegerField()
+    user_id = models.IntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(fields=['project_id', 'deleted_at']),
+            models.Index(fields=['user_id', 'deleted_at']),
+            models.Index(fields=['deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} supprimé"
+
+
+class ActivityEvent(models.Model):
+    """
+    Issue / comment event of a project, written in the transaction of the change
+    and read by the event hub of each worker (see tracking_projects.events).
+    """
+    project_id = models.IntegerField()
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.payload.get('type')} {self.payload.get('action')} ({self.project_id})"
+
+
+class MembershipIndex(models.Model):
+    """
+    Global index of contributors, in 'default' when projects are sharded
+    (see tracking_projects.sharding): projects of a user without visiting shards.
+    Maintained by tracking_projects.signals.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='membership_index',
+    )
+    # Plain id: the project may live in another database
+    project_id = models.IntegerField()
+    # Creation of the project, to list projects in ProjectPagination order
+    created_at = models.DateTimeField()
+    joined_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'project_id')
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['project_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} contribue {self.project_id}"
+
+
+class IdSequence(models.Model):
+    """Global id sequence of a sharded model, reserved by blocks (see tracking_projects.sharding)"""
+    name = models.CharField(max_length=100, primary_key=True)
+    next_id = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_id}"
@@ -0,0 +1,64 @@
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over (created_at, pk).
+
+    Pages are fetched with `created_at < last seen` on the (parent, -created_at)
+    indexes instead of OFFSET scans, without COUNT(*). pk breaks created_at ties
+    so the order is stable.
+    Page size can be set by clients with ?page_size= up to max_page_size.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = ('-created_at', '-pk')
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views: same cursors, page fetched with the async ORM"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, current_position = self.cursor or (0, False, None)
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            order = self.ordering[0]
+            lookup = 'lt' if self.cursor.reverse != order.startswith('-') else 'gt'
+            queryset = queryset.filter(**{f"{order.lstrip('-')}__{lookup}": current_position})
+
+        results = [obj async for obj in queryset[offset:offset + self.page_size + 1]]
+        self.page = results[:self.page_size]
+        has_following_position = len(results) > len(self.page)
+        following_position = None
+        if has_following_position:
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = has_following_position
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position, self.previous_position = following_position, current_position
+        return self.page
+
+
+class ProjectPagination(KeysetPagination):
+    ordering = ('created_at', 'pk')
+
+
+class ContributorPagination(KeysetPagination):
+    ordering = ('created_at', 'pk')
+
+
+class IssuePagination(KeysetPagination):
+    ordering = ('-created_at', '-pk')
+
+
+class CommentPagination(KeysetPagination):
+    ordering = ('created_at', 'pk')
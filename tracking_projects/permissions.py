@@ -1,7 +1,8 @@
 from rest_framework import permissions
 
 
-from tracking_projects.models import Project, Issue, Comment
+from tracking_projects import membership
+from tracking_projects.models import Project
 
 
 class IsContributor(permissions.BasePermission):
@@ -11,8 +12,7 @@ class IsContributor(permissions.BasePermission):
     def has_permission(self, request, view):
         if view.kwargs.get('project_pk'):
             project_id = view.kwargs.get('project_pk')
-            project = Project.objects.get(pk=project_id)
-            return project.contributors.filter(user=request.user).exists()
+            return membership.is_contributor(request.user, project_id)
 
         if not view.kwargs.get('project_pk'):
             return True
@@ -25,16 +25,16 @@ class IsContributor(permissions.BasePermission):
         For Comment cas, search Comment.issue.project
         """
 
-        if hasattr(obj, 'project'):
-            project = obj.project
+        if hasattr(obj, 'project_id'):
+            project_id = obj.project_id
         elif hasattr(obj, 'issue'):
-            project = obj.issue.project
+            project_id = obj.issue.project_id
         elif type(obj) is Project:
-            project = obj
+            project_id = obj.pk
         else:
             return False
 
-        return project.contributors.filter(user=request.user).exists()
+        return membership.is_contributor(request.user, project_id)
 
 
 class IsAuthor(permissions.BasePermission):
@@ -43,39 +43,32 @@ class IsAuthor(permissions.BasePermission):
     message = "Vous devez être l'auteur de cette ressource pour modifier / supprimer"
 
     def has_permission(self, request, view):
-        kwargs = view.kwargs
-
+        """Issue / Comment are loaded once by view.get_target_object() and reused by get_object()"""
 
         # Cas Comment
         if getattr(view, 'basename', None) == 'projects-issues-comments':
-            comments_pk = view.kwargs.get('pk')
-            comments = Comment.objects.get(pk=comments_pk)
-            return comments.author == request.user
+            return view.get_target_object().author_id == request.user.pk
 
         # Cas contributor
         if getattr(view, 'basename', None) == 'project-contributors':
             project_id = view.kwargs.get('project_pk')
-            project = Project.objects.get(pk=project_id)
-            return project.author == request.user
+            return membership.is_author(request.user, project_id)
 
         # Cas Issue
         if getattr(view, 'basename', None) == 'projects-issues':
-            issues_pk = view.kwargs.get('pk')
-            issues = Issue.objects.get(pk=issues_pk)
-            return issues.author == request.user
+            return view.get_target_object().author_id == request.user.pk
 
 
         # Cas Project
         if getattr(view, 'basename', None) == 'projects':
             project_id = view.kwargs.get('pk')
-            project = Project.objects.get(pk=project_id)
-            return project.author == request.user
+            return membership.is_author(request.user, project_id)
         return False
 
     def has_object_permission(self, request, view, obj):
-        if hasattr(obj, 'author'):
-            return obj.author == request.user
-        elif hasattr(obj, 'project'):
-            return obj.project.author == request.user
+        if hasattr(obj, 'author_id'):
+            return obj.author_id == request.user.pk
+        elif hasattr(obj, 'project_id'):
+            return membership.is_author(request.user, obj.project_id)
         else:
             return False
@@ -0,0 +1,276 @@
+"""
+Full-text search over issues and comments of the projects of a user.
+
+On SQLite, queries go through FTS5 indexes kept in sync by triggers, and return
+results ranked by bm25 with a snippet: HTML escaped user text, matches wrapped
+in <mark>. Other databases fall back to an unindexed icontains lookup. Sharded,
+each shard holding projects of the user is searched and the results merged by rank.
+
+The index DDL lives here, used by the migrations and rebuild_search_index.
+SQLite drops the triggers of a table when a migration remakes it (AddField,
+AlterField...): restore_index() creates the index again after each migrate
+(see tracking_projects.signals).
+"""
+import re
+from html import escape
+
+from django.db import connection, connections, transaction
+from django.db.models import Q
+
+from tracking_projects import sharding
+from tracking_projects.models import Project, Issue, Comment
+
+##########################################################################
+#                            Index DDL
+##########################################################################
+
+# The issue index is an external content table keyed on the issue id. Comments
+# (uuid primary key) get a search id in tracking_projects_comment_fts_key, an
+# INTEGER PRIMARY KEY never renumbered by a VACUUM, and their index stores its
+# own content under it.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE tracking_projects_issue_fts USING fts5(
+        title, description,
+        content='tracking_projects_issue', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER tracking_projects_issue_fts_insert AFTER INSERT ON tracking_projects_issue BEGIN
+        INSERT INTO tracking_projects_issue_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER tracking_projects_issue_fts_delete AFTER DELETE ON tracking_projects_issue BEGIN
+        INSERT INTO tracking_projects_issue_fts(tracking_projects_issue_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER tracking_projects_issue_fts_update
+    AFTER UPDATE OF title, description ON tracking_projects_issue BEGIN
+        INSERT INTO tracking_projects_issue_fts(tracking_projects_issue_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tracking_projects_issue_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TABLE tracking_projects_comment_fts_key (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        uuid char(32) NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE tracking_projects_comment_fts USING fts5(
+        description,
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER tracking_projects_comment_fts_insert AFTER INSERT ON tracking_projects_comment BEGIN
+        INSERT INTO tracking_projects_comment_fts_key(uuid) VALUES (new.uuid);
+        INSERT INTO tracking_projects_comment_fts(rowid, description)
+        VALUES ((SELECT id FROM tracking_projects_comment_fts_key WHERE uuid = new.uuid), new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER tracking_projects_comment_fts_delete AFTER DELETE ON tracking_projects_comment BEGIN
+        DELETE FROM tracking_projects_comment_fts
+        WHERE rowid = (SELECT id FROM tracking_projects_comment_fts_key WHERE uuid = old.uuid);
+        DELETE FROM tracking_projects_comment_fts_key WHERE uuid = old.uuid;
+    END
+    """,
+    """
+    CREATE TRIGGER tracking_projects_comment_fts_update
+    AFTER UPDATE OF description ON tracking_projects_comment BEGIN
+        UPDATE tracking_projects_comment_fts SET description = new.description
+        WHERE rowid = (SELECT id FROM tracking_projects_comment_fts_key WHERE uuid = new.uuid);
+    END
+    """,
+]
+
+# Index every issue and comment again, comments under new search ids
+REBUILD_SQL = [
+    "INSERT INTO tracking_projects_issue_fts(tracking_projects_issue_fts) VALUES ('rebuild')",
+    "DELETE FROM tracking_projects_comment_fts",
+    "DELETE FROM tracking_projects_comment_fts_key",
+    "INSERT INTO tracking_projects_comment_fts_key(uuid) SELECT uuid FROM tracking_projects_comment",
+    """
+    INSERT INTO tracking_projects_comment_fts(rowid, description)
+    SELECT search_key.id, comment.description
+    FROM tracking_projects_comment_fts_key search_key
+    JOIN tracking_projects_comment comment ON comment.uuid = search_key.uuid
+    """,
+]
+
+# Tables and triggers of CREATE_SQL
+INDEX_OBJECTS = {
+    'tracking_projects_issue_fts', 'tracking_projects_issue_fts_insert',
+    'tracking_projects_issue_fts_delete', 'tracking_projects_issue_fts_update',
+    'tracking_projects_comment_fts_key', 'tracking_projects_comment_fts',
+    'tracking_projects_comment_fts_insert', 'tracking_projects_comment_fts_delete',
+    'tracking_projects_comment_fts_update',
+}
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS tracking_projects_issue_fts_insert",
+    "DROP TRIGGER IF EXISTS tracking_projects_issue_fts_delete",
+    "DROP TRIGGER IF EXISTS tracking_projects_issue_fts_update",
+    "DROP TRIGGER IF EXISTS tracking_projects_comment_fts_insert",
+    "DROP TRIGGER IF EXISTS tracking_projects_comment_fts_delete",
+    "DROP TRIGGER IF EXISTS tracking_projects_comment_fts_update",
+    "DROP TABLE IF EXISTS tracking_projects_issue_fts",
+    "DROP TABLE IF EXISTS tracking_projects_comment_fts",
+    "DROP TABLE IF EXISTS tracking_projects_comment_fts_key",
+]
+
+
+def restore_index(alias=None):
+    """
+    Create the index of the database alias again if a table or trigger is missing,
+    and index every row. Return True if it was restored.
+    """
+    database = connections[alias] if alias else connection
+    if database.vendor != 'sqlite':
+        return False
+    with transaction.atomic(using=alias), database.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {name for name, in cursor.fetchall()}
+        if 'tracking_projects_comment' not in existing or INDEX_OBJECTS <= existing:
+            return False
+        for statement in DROP_SQL + CREATE_SQL + REBUILD_SQL:
+            cursor.execute(statement)
+    return True
+
+
+##########################################################################
+#                            Queries
+##########################################################################
+
+SNIPPET_START, SNIPPET_END = '<mark>', '</mark>'
+# Private use characters around matches in FTS5 snippets, marked once the text is escaped
+MATCH_START, MATCH_END = '\ue000', '\ue001'
+SNIPPET_TOKENS = 12
+
+ISSUE_SQL = f"""
+    SELECT issue.id, issue.project_id, issue.title,
+           snippet(tracking_projects_issue_fts, -1, '{MATCH_START}', '{MATCH_END}', '…', {SNIPPET_TOKENS}),
+           bm25(tracking_projects_issue_fts, 5.0, 1.0) AS rank
+    FROM tracking_projects_issue_fts
+    JOIN tracking_projects_issue issue ON issue.id = tracking_projects_issue_fts.rowid
+    WHERE tracking_projects_issue_fts MATCH %s
+      AND issue.project_id IN (
+          SELECT project_id FROM tracking_projects_contributor WHERE user_id = %s
+      )
+      {{project_filter}}
+    ORDER BY rank
+    LIMIT %s
+"""
+
+COMMENT_SQL = f"""
+    SELECT comment.uuid, comment.issue_id, issue.project_id, issue.title,
+           snippet(tracking_projects_comment_fts, 0, '{MATCH_START}', '{MATCH_END}', '…', {SNIPPET_TOKENS}),
+           bm25(tracking_projects_comment_fts) AS rank
+    FROM tracking_projects_comment_fts
+    JOIN tracking_projects_comment_fts_key search_key ON search_key.id = tracking_projects_comment_fts.rowid
+    JOIN tracking_projects_comment comment ON comment.uuid = search_key.uuid
+    JOIN tracking_projects_issue issue ON issue.id = comment.issue_id
+    WHERE tracking_projects_comment_fts MATCH %s
+      AND issue.project_id IN (
+          SELECT project_id FROM tracking_projects_contributor WHERE user_id = %s
+      )
+      {{project_filter}}
+    ORDER BY rank
+    LIMIT %s
+"""
+
+
+def build_match(text):
+    """
+    Turn user text into an FTS5 query: every word must match, as a prefix.
+    Words are quoted so FTS5 operators typed by users are not interpreted.
+    """
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def highlight(snippet):
+    """Return an FTS5 snippet as HTML: its text escaped, its matches marked"""
+    return escape(snippet).replace(MATCH_START, SNIPPET_START).replace(MATCH_END, SNIPPET_END)
+
+
+def search(user, text, limit=20, project_id=None):
+    """Return up to limit issues / comments matching text, best first"""
+    if project_id is not None:
+        aliases = [sharding.db_for_project(project_id)]
+    else:
+        aliases = sharding.shards_of(user)
+    results = []
+    for alias in aliases:
+        results += _search_database(alias, user, text, limit, project_id)
+    results.sort(key=lambda result: result['rank'])
+    return results[:limit]
+
+
+def _search_database(alias, user, text, limit, project_id):
+    """Return up to limit results of the database alias (None: default connection)"""
+    database = connections[alias] if alias else connection
+    if database.vendor != 'sqlite':
+        return _search_unindexed(alias, user, text, limit, project_id)
+
+    match = build_match(text)
+    if not match:
+        return []
+    project_filter, project_params = '', []
+    if project_id is not None:
+        project_filter, project_params = 'AND issue.project_id = %s', [project_id]
+
+    results = []
+    with database.cursor() as cursor:
+        cursor.execute(
+            ISSUE_SQL.format(project_filter=project_filter),
+            [match, user.pk, *project_params, limit],
+        )
+        for issue_id, project, title, snippet, rank in cursor.fetchall():
+            results.append({
+                'type': 'issue', 'id': issue_id, 'project': project, 'issue': issue_id,
+                'title': title, 'snippet': highlight(snippet), 'rank': rank,
+            })
+        cursor.execute(
+            COMMENT_SQL.format(project_filter=project_filter),
+            [match, user.pk, *project_params, limit],
+        )
+        for comment_uuid, issue_id, project, title, snippet, rank in cursor.fetchall():
+            results.append({
+                'type': 'comment', 'id': str(Comment._meta.pk.to_python(comment_uuid)),
+                'project': project, 'issue': issue_id,
+                'title': title, 'snippet': highlight(snippet), 'rank': rank,
+            })
+    return results
+
+
+def _search_unindexed(alias, user, text, limit, project_id):
+    projects = Project.objects.using(alias).visible_to(user)
+    issues = Issue.objects.using(alias).filter(project__in=projects).filter(
+        Q(title__icontains=text) | Q(description__icontains=text)
+    )
+    comments = Comment.objects.using(alias).filter(
+        issue__project__in=projects, description__icontains=text
+    ).select_related('issue')
+    if project_id is not None:
+        issues = issues.filter(project_id=project_id)
+        comments = comments.filter(issue__project_id=project_id)
+    results = [
+        {'type': 'issue', 'id': issue.pk, 'project': issue.project_id, 'issue': issue.pk,
+         'title': issue.title, 'snippet': escape(issue.description[:100]), 'rank': 0}
+        for issue in issues[:limit]
+    ] + [
+        {'type': 'comment', 'id': str(comment.pk), 'project': comment.issue.project_id,
+         'issue': comment.issue_id, 'title': comment.issue.title,
+         'snippet': escape(comment.description[:100]), 'rank': 0}
+        for comment in comments[:limit]
+    ]
+    return results[:limit]
@@ -1,12 +1,55 @@
+from django.conf import settings
 from django.urls import reverse
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer, Serializer
 from django.contrib.auth import get_user_model
+from tracking_projects import membership
 from tracking_projects.models import Project, Contributor
 from tracking_projects.models import Issue, Comment
 
 User = get_user_model()
 
+NESTED_PREVIEW_SIZE = getattr(settings, 'NESTED_PREVIEW_SIZE', 5)
+# Maximum number of items of a bulk request
+BULK_MAX_ITEMS = 1000
+
+
+class NestedPreviewField(serializers.Field):
+    """
+    Embed the latest children of an object instead of the whole collection.
+
+    Renders {'count', 'next', 'results'}: the total number of children, the URL
+    of the full (paginated) collection when some are not embedded, and the
+    children prefetched by the view in `items_attr`.
+    """
+
+    def __init__(self, serializer_class, items_attr, count_attr, view_name, url_kwargs, **kwargs):
+        self.serializer_class = serializer_class
+        self.items_attr = items_attr
+        self.count_attr = count_attr
+        self.view_name = view_name
+        self.url_kwargs = url_kwargs
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        items = getattr(obj, self.items_attr)
+        count = getattr(obj, self.count_attr)
+        next_url = None
+        if count > len(items):
+            next_url = reverse(self.view_name, kwargs={
+                kwarg: getattr(obj, attr) for kwarg, attr in self.url_kwargs.items()
+            })
+            request = self.context.get('request')
+            if request:
+                next_url = request.build_absolute_uri(next_url)
+        return {
+            'count': count,
+            'next': next_url,
+            'results': self.serializer_class(items, many=True, context=self.context).data,
+        }
+
 
 ##########################################################################
 #                            Serializers Comments
@@ -37,8 +80,8 @@ class CommentDetailSerializer(serializers.ModelSerializer):
         """Return the URL to the parent issue"""
         request = self.context.get('request')
         url = reverse('tracking_project:projects-issues-detail', kwargs={
-            'project_pk': obj.issue.project.id,
-            'pk': obj.issue.id
+            'project_pk': obj.issue.project_id,
+            'pk': obj.issue_id
         })
         if request:
             return request.build_absolute_uri(url)
@@ -56,7 +99,13 @@ class CreateCommentSerializer(serializers.ModelSerializer):
 #                            Serializers Issues
 ##########################################################################
 class IssueDetailSerializer(serializers.ModelSerializer):
-    comments = CommentListSerializer(many=True, read_only=True)
+    comments = NestedPreviewField(
+        CommentListSerializer,
+        items_attr='latest_comments',
+        count_attr='comments_count',
+        view_name='tracking_project:projects-issues-comments-list',
+        url_kwargs={'project_pk': 'project_id', 'issue_pk': 'pk'},
+    )
     project_name = serializers.CharField(source='project.name', read_only=True)
     author_name = serializers.CharField(source='author.username', read_only=True)
     assigned_to_name = serializers.CharField(
@@ -75,7 +124,6 @@ class IssueDetailSerializer(serializers.ModelSerializer):
 
 
 class IssueListSerializer(serializers.ModelSerializer):
-    comments_count = serializers.IntegerField(source='comments.count', read_only=True)
     author_name = serializers.CharField(source='author.username', read_only=True)
 
     class Meta:
@@ -97,17 +145,30 @@ class CreateIssueSerializer(serializers.ModelSerializer):
     def validate_assigned_to(self, value):
         """Validate that assigned user is a contributor of the project"""
         if value:
-            project = self.context.get('project')
-            if project and not Contributor.objects.filter(
-                    project=project,
-                    user=value
-            ).exists():
+            project_id = self.context.get('project_id')
+            if project_id and not membership.is_contributor(value, project_id):
                 raise serializers.ValidationError(
                     "L'utilisateur assigné doit être un contributeur du projet."
                 )
         return value
 
 
+class BulkCreateIssueSerializer(CreateIssueSerializer):
+    """
+    Item of a bulk issue creation.
+    Assignee is an id checked against context['contributor_ids'], preloaded once for all items.
+    """
+    assigned_to = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate_assigned_to(self, value):
+        """Validate that assigned user is a contributor of the project"""
+        if value is not None and value not in self.context['contributor_ids']:
+            raise serializers.ValidationError(
+                "L'utilisateur assigné doit être un contributeur du projet."
+            )
+        return value
+
+
 ##########################################################################
 #                            Serializers Contributors
 ##########################################################################
@@ -166,14 +227,67 @@ class CreateContributorSerializer(Serializer):
         return contributor
 
 
+class BulkContributorSerializer(Serializer):
+    """
+    Add / remove a list of contributors.
+    Users to add are resolved with one IN query, the author is read from
+    context['author_id']. Current memberships are left to the view, which
+    reads them in its transaction.
+    """
+    add = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list, max_length=BULK_MAX_ITEMS,
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list, max_length=BULK_MAX_ITEMS,
+    )
+
+    def validate_add(self, value):
+        value = set(value)
+        existing = set(User.objects.filter(pk__in=value).values_list('pk', flat=True))
+        unknown = value - existing
+        if unknown:
+            raise serializers.ValidationError(
+                f"Ces utilisateurs n'existent pas : {sorted(unknown)}"
+            )
+        return value
+
+    def validate_remove(self, value):
+        value = set(value)
+        if self.context['author_id'] in value:
+            raise serializers.ValidationError(
+                "L'auteur du projet ne peut pas être retiré des contributeurs."
+            )
+        return value
+
+    def validate(self, attrs):
+        """Reject users both added and removed"""
+        if attrs['add'] & attrs['remove']:
+            raise serializers.ValidationError(
+                "Un utilisateur ne peut pas être ajouté et retiré en même temps."
+            )
+        return attrs
+
+
 ##########################################################################
 #                            Serializers Projects
 ##########################################################################
 class ProjectDetailSerializer(ModelSerializer):
     """ Serializer for project detail """
     author = serializers.StringRelatedField(read_only=True)
-    contributors = ContributorListSerializer(many=True, read_only=True)
-    issues = IssueListSerializer(many=True, read_only=True)
+    contributors = NestedPreviewField(
+        ContributorListSerializer,
+        items_attr='latest_contributors',
+        count_attr='contributors_count',
+        view_name='tracking_project:project-contributors-list',
+        url_kwargs={'project_pk': 'pk'},
+    )
+    issues = NestedPreviewField(
+        IssueListSerializer,
+        items_attr='latest_issues',
+        count_attr='issues_count',
+        view_name='tracking_project:projects-issues-list',
+        url_kwargs={'project_pk': 'pk'},
+    )
 
     class Meta:
         model = Project
@@ -186,8 +300,6 @@ class ProjectDetailSerializer(ModelSerializer):
 
 class ProjectListSerializer(ModelSerializer):
     """ Serializer for Project objects (list & create)"""
-    contributors_count = serializers.SerializerMethodField()
-    issues_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Project
@@ -197,14 +309,6 @@ class ProjectListSerializer(ModelSerializer):
         ]
         read_only_fields = ['id', 'contributors_count', 'issues_count', 'created_at']
 
-    def get_contributors_count(self, obj):
-        """ Return number of contributors """
-        return obj.contributors.count()
-
-    def get_issues_count(self, obj):
-        """ Return number of issues """
-        return obj.issues.count()
-
 
 class CreateProjectSerializer(ModelSerializer):
     class Meta:
@@ -212,3 +316,26 @@ class CreateProjectSerializer(ModelSerializer):
         fields = [
             'name', 'description', 'type',
         ]
+
+
+##########################################################################
+#                            Serializers Sync
+##########################################################################
+class SyncProjectSerializer(ProjectListSerializer):
+    class Meta(ProjectListSerializer.Meta):
+        fields = ProjectListSerializer.Meta.fields + ['author', 'updated_at']
+
+
+class SyncContributorSerializer(ContributorListSerializer):
+    class Meta(ContributorListSerializer.Meta):
+        fields = ContributorListSerializer.Meta.fields + ['project', 'updated_at']
+
+
+class SyncIssueSerializer(IssueListSerializer):
+    class Meta(IssueListSerializer.Meta):
+        fields = IssueListSerializer.Meta.fields + ['description', 'created_at', 'updated_at']
+
+
+class SyncCommentSerializer(CommentListSerializer):
+    class Meta(CommentListSerializer.Meta):
+        fields = CommentListSerializer.Meta.fields + ['issue', 'updated_at']
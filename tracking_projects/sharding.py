@@ -0,0 +1,293 @@
+"""
+Partitioning of the tracking data by project across databases.
+
+With DATABASE_SHARDS set (DATABASES aliases starting with 'shard'), the rows of
+a project, its contributors, issues, comments, counters and import checkpoints
+live in the shard `shard_for(project_id)`. Users and the global tables
+(MembershipIndex, IdSequence, Tombstone, ActivityEvent) stay in 'default'.
+
+ProjectShardRouter routes a saved / deleted instance from its project and a
+query from the project of the current context: project views enter it from the
+URL (`project_pk` / `pk`), model signal handlers from their instance (see
+tracking_projects.signals). Reading a sharded model outside any project raises
+ShardNotSelected instead of silently reading 'default'.
+
+Writes to the global tables that follow a change of a shard (index, tombstones,
+events) run when the shard transaction commits (on_commit()), so a rolled back
+change publishes nothing. Deleting a user deletes its rows in every shard
+first (see tracking_projects.signals).
+
+Ids of projects, contributors and issues come from a global allocator so they
+stay unique across shards. "My projects" listings read the global
+MembershipIndex, then load the page from the shards holding it.
+
+Without shards every function here is a no-op and routing is left to the other
+routers.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+
+SHARDED_MODELS = {'project', 'contributor', 'issue', 'comment', 'projectcounter', 'importcheckpoint'}
+# Ids reserved per allocator round-trip
+ID_BLOCK_SIZE = 100
+
+_current_shard = ContextVar('tracking_projects_shard', default=None)
+
+
+class ShardNotSelected(RuntimeError):
+    """Sharded model read outside the context of a project"""
+
+
+def shard_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('shard')]
+
+
+def enabled():
+    return bool(shard_aliases())
+
+
+def _project_id(value):
+    """Return value as a project id, None if it is not a valid id"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def shard_for(project_id):
+    """Return the alias of the shard holding project_id"""
+    aliases = shard_aliases()
+    return aliases[int(project_id) % len(aliases)]
+
+
+def db_for_project(project_id):
+    """Return the shard of project_id, None (left to the routers) without shards"""
+    project_id = _project_id(project_id)
+    if project_id is None or not enabled():
+        return None
+    return shard_for(project_id)
+
+
+def databases():
+    """Return the aliases to visit for every project: the shards, or [None] without shards"""
+    return shard_aliases() or [None]
+
+
+def group_by_shard(project_ids):
+    """Return {shard: [project ids]}, {None: project_ids} without shards"""
+    if not enabled():
+        return {None: list(project_ids)}
+    groups = defaultdict(list)
+    for project_id in project_ids:
+        groups[shard_for(project_id)].append(project_id)
+    return dict(groups)
+
+
+##########################################################################
+#                            Context
+##########################################################################
+
+@contextmanager
+def using_shard(alias):
+    """Route queries of sharded models to alias inside the block"""
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def for_project(project_id):
+    """Route queries of sharded models to the shard of project_id inside the block"""
+    alias = db_for_project(project_id)
+    return using_shard(alias) if alias else nullcontext()
+
+
+def instance_project_id(instance):
+    """Return the project of a sharded instance, None if it is unknown without a query"""
+    meta = instance._meta
+    if meta.app_label != 'tracking_projects' or meta.model_name not in SHARDED_MODELS:
+        return None
+    if meta.model_name == 'project':
+        return instance.pk
+    if meta.model_name == 'comment':
+        issue = meta.get_field('issue')
+        return instance.issue.project_id if issue.is_cached(instance) else None
+    return instance.project_id
+
+
+def db_for_instance(instance):
+    """Return the shard of instance, None without shards or if its project is unknown"""
+    return db_for_project(instance_project_id(instance))
+
+
+def for_instance(instance):
+    """for_project() of the project of instance, the current context if it is unknown"""
+    alias = db_for_instance(instance)
+    return using_shard(alias) if alias else nullcontext()
+
+
+_migration_tokens = {}
+
+
+def begin_migration(alias):
+    """Route queries of sharded models to alias while it is migrated: data migrations have no project"""
+    if enabled():
+        _migration_tokens[alias] = _current_shard.set(alias)
+
+
+def end_migration(alias):
+    token = _migration_tokens.pop(alias, None)
+    if token is not None:
+        _current_shard.reset(token)
+
+
+def on_commit(function):
+    """
+    Run function, a write to the global tables, once the shard of the current
+    project commits; at once without shards, in the transaction of the change.
+    """
+    alias = _current_shard.get()
+    if alias is None:
+        function()
+    else:
+        transaction.on_commit(function, using=alias)
+
+
+def with_users(queryset, *fields):
+    """Load user foreign keys: joined in one database, prefetched from 'default' across shards"""
+    if enabled():
+        return queryset.prefetch_related(*fields)
+    return queryset.select_related(*fields)
+
+
+##########################################################################
+#                            Router
+##########################################################################
+
+class ProjectShardRouter:
+    """Sharded models to the shard of their project, everything else to 'default'"""
+
+    def _shard(self, model, hints):
+        instance = hints.get('instance')
+        if instance is not None:
+            alias = db_for_instance(instance)
+            if alias:
+                return alias
+            if self._is_sharded(type(instance)) and instance._state.db:
+                # Loaded rows of a project all come from its shard
+                return instance._state.db
+        return _current_shard.get()
+
+    def _is_sharded(self, model):
+        return model._meta.app_label == 'tracking_projects' and model._meta.model_name in SHARDED_MODELS
+
+    def db_for_read(self, model, **hints):
+        if not enabled():
+            return None
+        if not self._is_sharded(model):
+            # Global tracking tables are left to the replica router, users are not in shards
+            return None if model._meta.app_label == 'tracking_projects' else DEFAULT_DB_ALIAS
+        alias = self._shard(model, hints)
+        if alias is None:
+            raise ShardNotSelected(f"{model.__name__} read outside of a project (sharding.for_project())")
+        return alias
+
+    def db_for_write(self, model, **hints):
+        """
+        Without a project in context, leave it to the default: Manager.create()
+        asks before the instance exists, its save() routes it (see models.ShardedMixin).
+        """
+        if not enabled():
+            return None
+        if not self._is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        return self._shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Rows of a shard reference users of 'default'"""
+        return True if enabled() else None
+
+
+##########################################################################
+#                            Global ids
+##########################################################################
+
+_reserved = {}
+_reserved_lock = threading.Lock()
+
+
+def _reserve(name, size):
+    """Reserve `size` ids of sequence name in 'default', return (first, end)"""
+    from tracking_projects.models import IdSequence
+
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        sequence = IdSequence.objects.filter(name=name)
+        if not sequence.update(next_id=F('next_id') + size):
+            IdSequence.objects.create(name=name, next_id=1 + size)
+        end = sequence.values_list('next_id', flat=True).get()
+    return end - size, end
+
+
+def allocate_ids(name, count):
+    """Return `count` ids of sequence name, unique across shards and processes"""
+    with _reserved_lock:
+        first, end = _reserved.get(name, (0, 0))
+        if end - first < count:
+            first, end = _reserve(name, max(count, ID_BLOCK_SIZE))
+        _reserved[name] = first + count, end
+    return range(first, first + count)
+
+
+def assign_ids(objs):
+    """Give objs global ids before a bulk_create(), when sharded"""
+    if enabled() and objs:
+        for obj, pk in zip(objs, allocate_ids(objs[0]._meta.label_lower, len(objs))):
+            obj.pk = pk
+    return objs
+
+
+##########################################################################
+#                            Projects of a user
+##########################################################################
+
+def memberships(user):
+    """Return the MembershipIndex rows of user, paged as ProjectPagination on (user, created_at), sharded or not"""
+    from tracking_projects.models import MembershipIndex
+
+    return MembershipIndex.objects.filter(user=user)
+
+
+def shards_of(user):
+    """Return the shards holding projects of user, [None] without shards"""
+    if not enabled():
+        return [None]
+    return list(group_by_shard(memberships(user).values_list('project_id', flat=True)))
+
+
+def _projects_queryset(alias, project_ids):
+    from tracking_projects.models import Project
+
+    return Project.objects.using(alias).filter(pk__in=project_ids)
+
+
+def load_projects(project_ids):
+    """Return the projects of project_ids, in that order, one query per shard"""
+    projects = {}
+    for alias, ids in group_by_shard(project_ids).items():
+        projects.update((project.pk, project) for project in _projects_queryset(alias, ids))
+    return [projects[pk] for pk in project_ids if pk in projects]
+
+
+async def aload_projects(project_ids):
+    """load_projects() for async views"""
+    projects = {}
+    for alias, ids in group_by_shard(project_ids).items():
+        projects.update([(project.pk, project) async for project in _projects_queryset(alias, ids)])
+    return [projects[pk] for pk in project_ids if pk in projects]
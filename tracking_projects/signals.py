@@ -0,0 +1,486 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Case, F, QuerySet, Value, When
+from django.db.models.deletion import Collector
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_delete, pre_migrate, pre_save
+from django.dispatch import receiver, Signal
+from django.utils import timezone
+
+from tracking_projects import caching, events, membership, search, sharding, statistics
+
+from tracking_projects.models import Project, Contributor, Issue, Comment, Tombstone, MembershipIndex
+
+
+# bulk_create() does not send model signals and per-object handlers are muted in
+# bulk_write() blocks: bulk writes send these once with the project they touched.
+bulk_created = Signal()  # sender=model, project_id, instances
+bulk_deleted = Signal()  # sender=model, project_id, instances
+
+_bulk_write = ContextVar('tracking_projects_bulk_write', default=False)
+
+
+@contextmanager
+def bulk_write():
+    """Mute per-object handlers inside the block"""
+    token = _bulk_write.set(True)
+    try:
+        yield
+    finally:
+        _bulk_write.reset(token)
+
+
+def per_object(handler):
+    """Skip handler inside bulk_write() blocks, run it in the shard of the instance"""
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if _bulk_write.get():
+            return None
+        with sharding.for_instance(kwargs['instance']):
+            return handler(*args, **kwargs)
+    return wrapper
+
+
+def _origin_model(origin):
+    """Return the model of the object / queryset whose delete() started a deletion"""
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def _deleted_with_parent(instance, origin):
+    """
+    Return True if instance is deleted with its project / issue, whose own handlers
+    cover it. Children deleted with a user account are handled one by one.
+    """
+    model = _origin_model(origin)
+    return model is Project or (model is Issue and not isinstance(instance, Issue))
+
+
+##########################################################################
+#                            Migrations
+##########################################################################
+
+@receiver(pre_migrate)
+def route_migration_queries(sender, using, **kwargs):
+    if sender.name == 'tracking_projects':
+        sharding.begin_migration(using)
+
+
+@receiver(post_migrate)
+def end_migration_queries(sender, using, **kwargs):
+    if sender.name == 'tracking_projects':
+        sharding.end_migration(using)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    """Table remakes of SQLite drop the FTS triggers: create the missing ones again"""
+    if sender.name != 'tracking_projects':
+        return
+    applied = MigrationRecorder(connections[using]).applied_migrations()
+    if ('tracking_projects', '0005_search_index') in applied:
+        search.restore_index(using)
+
+
+##########################################################################
+#                            User accounts
+##########################################################################
+
+# Rows deleted with their user by the database cascade, out of its reach in the shards
+USER_CASCADES = [(Project, 'author'), (Contributor, 'user'), (Issue, 'author'), (Comment, 'author')]
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def delete_user_rows_in_shards(sender, instance, origin=None, **kwargs):
+    """Users are in 'default': delete / unassign their rows in each shard as the cascade does"""
+    for alias in sharding.shard_aliases():
+        with sharding.using_shard(alias), transaction.atomic(using=alias):
+            Issue.objects.filter(assigned_to_id=instance.pk).update(assigned_to=None)
+            collector = Collector(using=alias, origin=origin)
+            for model, field in USER_CASCADES:
+                collector.collect(model.objects.filter(**{field: instance.pk}))
+            collector.delete()
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def remember_stored_username(sender, instance, update_fields=None, **kwargs):
+    """Keep the username in the database, compared once the user is saved"""
+    if instance._state.adding or (update_fields is not None and 'username' not in update_fields):
+        instance._stored_username = instance.username
+    else:
+        instance._stored_username = (
+            sender._base_manager.using(instance._state.db).filter(pk=instance.pk)
+            .values_list('username', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def bump_renamed_user_projects(sender, instance, created, **kwargs):
+    """Responses show usernames (author_name, assigned_to_name...): a rename changes the projects of the user"""
+    if created or getattr(instance, '_stored_username', instance.username) == instance.username:
+        return
+    for alias in sharding.databases():
+        with sharding.using_shard(alias):
+            # One indexed lookup per relation, instead of OR-ing across the joined rows
+            project_ids = Project.objects.filter(author=instance.pk).order_by().values('pk').union(
+                Contributor.objects.filter(user=instance.pk).order_by().values('project_id'),
+                Issue.objects.filter(author=instance.pk).order_by().values('project_id'),
+                Issue.objects.filter(assigned_to=instance.pk).order_by().values('project_id'),
+                Comment.objects.filter(author=instance.pk).order_by().values('issue__project_id'),
+            )
+            Project.bump_version(pk__in=project_ids)
+
+
+##########################################################################
+#                            Membership cache
+##########################################################################
+
+@receiver([post_save, post_delete], sender=Project)
+@per_object
+def invalidate_project_membership(sender, instance, **kwargs):
+    """Project author may have changed"""
+    membership.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Contributor)
+@per_object
+def invalidate_contributor_membership(sender, instance, **kwargs):
+    """Contributor added / removed"""
+    membership.invalidate(instance.project_id)
+
+
+##########################################################################
+#                            Membership index
+##########################################################################
+
+def _membership_index(contributors):
+    """Return the MembershipIndex rows of contributors"""
+    created_at = {
+        contributor.project_id: contributor.project.created_at
+        for contributor in contributors if Contributor.project.is_cached(contributor)
+    }
+    missing = {contributor.project_id for contributor in contributors} - created_at.keys()
+    if missing:
+        created_at.update(Project.objects.filter(pk__in=missing).values_list('pk', 'created_at'))
+    return [
+        MembershipIndex(
+            user_id=contributor.user_id, project_id=contributor.project_id,
+            created_at=created_at[contributor.project_id], joined_at=contributor.created_at,
+        )
+        for contributor in contributors
+    ]
+
+
+@receiver(post_save, sender=Contributor)
+@per_object
+def index_saved_contributor(sender, instance, created, **kwargs):
+    if created:
+        sharding.on_commit(partial(
+            MembershipIndex.objects.bulk_create, _membership_index([instance]), ignore_conflicts=True,
+        ))
+
+
+@receiver(post_delete, sender=Contributor)
+@per_object
+def unindex_deleted_contributor(sender, instance, origin=None, **kwargs):
+    """Contributors deleted with their project are unindexed at once"""
+    if not _deleted_with_parent(instance, origin):
+        sharding.on_commit(
+            MembershipIndex.objects.filter(user_id=instance.user_id, project_id=instance.project_id).delete
+        )
+
+
+@receiver(post_delete, sender=Project)
+@per_object
+def unindex_deleted_project(sender, instance, **kwargs):
+    sharding.on_commit(MembershipIndex.objects.filter(project_id=instance.pk).delete)
+
+
+@receiver([bulk_created, bulk_deleted], sender=Contributor)
+def index_bulk_contributors(sender, signal, project_id, instances, **kwargs):
+    if signal is bulk_created:
+        sharding.on_commit(partial(
+            MembershipIndex.objects.bulk_create, _membership_index(instances), ignore_conflicts=True,
+        ))
+    else:
+        sharding.on_commit(MembershipIndex.objects.filter(
+            project_id=project_id, user_id__in=[contributor.user_id for contributor in instances],
+        ).delete)
+
+
+##########################################################################
+#                            Project version
+##########################################################################
+
+@receiver(post_save, sender=Project)
+@per_object
+def bump_project_version(sender, instance, **kwargs):
+    Project.bump_version(pk=instance.pk)
+
+
+# Denormalized children counts, moved in the same UPDATE as the version
+PROJECT_COUNTS = {Contributor: 'contributors_count', Issue: 'issues_count', Comment: 'comments_count'}
+
+
+def _count_delta(signal, created):
+    """Return +1 for a created row, -1 for a deleted row, 0 for an update"""
+    if signal is post_delete:
+        return -1
+    return 1 if created else 0
+
+
+@receiver(pre_delete, sender=Issue)
+@per_object
+def count_issue_comments_before_delete(sender, instance, origin=None, **kwargs):
+    """Comments deleted with the issue do not count themselves (see _deleted_with_parent)"""
+    if _origin_model(origin) is Issue:
+        instance._deleted_comments = instance.comments.count()
+
+
+@receiver([post_save, post_delete], sender=Contributor)
+@receiver([post_save, post_delete], sender=Issue)
+@per_object
+def bump_parent_project_version(sender, instance, signal, created=False, origin=None, **kwargs):
+    """Children deleted with their project do not bump it"""
+    if _deleted_with_parent(instance, origin):
+        return
+    delta = _count_delta(signal, created)
+    counts = {PROJECT_COUNTS[sender]: delta} if delta else {}
+    if delta and sender is Issue:
+        # Set by count_issue_comments_before_delete when its comments do not count themselves
+        counts['comments_count'] = -getattr(instance, '_deleted_comments', 0)
+    Project.bump_version(counts, pk=instance.project_id)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+@per_object
+def bump_comment_project_version(sender, instance, signal, created=False, origin=None, **kwargs):
+    """Comments deleted with their issue are covered by the issue bump"""
+    if _deleted_with_parent(instance, origin):
+        return
+    delta = _count_delta(signal, created)
+    if delta:
+        Issue.objects.filter(pk=instance.issue_id).update(
+            comments_count=F('comments_count') + delta, updated_at=timezone.now(),
+        )
+    Project.bump_version({'comments_count': delta} if delta else None, issues__pk=instance.issue_id)
+
+
+##########################################################################
+#                            Detail cache
+##########################################################################
+
+@receiver([post_save, post_delete], sender=Project)
+@per_object
+def evict_project_detail(sender, instance, **kwargs):
+    caching.evict(caching.project_detail_key(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Contributor)
+@per_object
+def evict_contributor_project_detail(sender, instance, origin=None, **kwargs):
+    if _deleted_with_parent(instance, origin):
+        return
+    caching.evict(caching.project_detail_key(instance.project_id))
+
+
+@receiver([post_save, post_delete], sender=Issue)
+@per_object
+def evict_issue_detail(sender, instance, origin=None, **kwargs):
+    if _deleted_with_parent(instance, origin):
+        return
+    caching.evict(
+        caching.issue_detail_key(instance.pk),
+        caching.project_detail_key(instance.project_id),
+    )
+
+
+@receiver([post_save, post_delete], sender=Comment)
+@per_object
+def evict_comment_issue_detail(sender, instance, origin=None, **kwargs):
+    """Project detail embeds comments_count: left to the project version check"""
+    if _deleted_with_parent(instance, origin):
+        return
+    caching.evict(caching.issue_detail_key(instance.issue_id))
+
+
+##########################################################################
+#                            Bulk writes
+##########################################################################
+
+@receiver([bulk_created, bulk_deleted])
+def project_bulk_written(sender, signal, project_id, instances, **kwargs):
+    sign = 1 if signal is bulk_created else -1
+    if sender is Contributor:
+        membership.invalidate(project_id)
+    if sender is Comment:
+        per_issue = Counter(comment.issue_id for comment in instances)
+        Issue.objects.filter(pk__in=per_issue).update(
+            comments_count=F('comments_count') + Case(
+                *[When(pk=issue_id, then=Value(sign * total)) for issue_id, total in per_issue.items()],
+                default=Value(0),
+            ),
+            updated_at=timezone.now(),
+        )
+    counts = {PROJECT_COUNTS[sender]: sign * len(instances)}
+    Project.bump_version(counts, pk=project_id)
+    caching.evict(caching.project_detail_key(project_id))
+
+
+##########################################################################
+#                            Project statistics
+##########################################################################
+
+def _comment_project_id(comment):
+    if Comment.issue.is_cached(comment):
+        return comment.issue.project_id
+    return Issue.objects.filter(pk=comment.issue_id).values_list('project_id', flat=True).first()
+
+
+def _counted_values(issue):
+    return {field: getattr(issue, field) for field in Issue.COUNTED_FIELDS}
+
+
+@receiver(post_save, sender=Project)
+@per_object
+def create_project_counters(sender, instance, created, **kwargs):
+    if created:
+        statistics.create_counters([instance.pk])
+
+
+@receiver(post_save, sender=Issue)
+@per_object
+def count_saved_issue(sender, instance, created, **kwargs):
+    """Count a new issue, or move its counters when status / priority / tag change"""
+    if created:
+        deltas = statistics.add_issues({}, [_counted_values(instance)])
+    else:
+        # Values of the overwritten row, read by Issue.save() in the transaction of the write
+        previous = getattr(instance, '_previous_counted_values', None)
+        if not previous:
+            return
+        current = {field: getattr(instance, field) for field in previous}
+        deltas = statistics.add_issues(statistics.add_issues({}, [previous], -1), [current])
+    statistics.increment(instance.project_id, deltas)
+
+
+@receiver(post_delete, sender=Issue)
+@per_object
+def count_deleted_issue(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_parent(instance, origin):
+        statistics.increment(instance.project_id, statistics.add_issues({}, [_counted_values(instance)], -1))
+
+
+@receiver([bulk_created, bulk_deleted], sender=Issue)
+def count_bulk_issues(sender, signal, project_id, instances, **kwargs):
+    sign = 1 if signal is bulk_created else -1
+    statistics.increment(project_id, statistics.add_issues({}, [_counted_values(issue) for issue in instances], sign))
+
+
+##########################################################################
+#                            Tombstones
+##########################################################################
+
+def _contributor_tombstones(contributors):
+    """The contributor leaves the project, and the project leaves the feed of the removed user"""
+    tombstones = []
+    for contributor in contributors:
+        tombstones.append(Tombstone(
+            kind='contributor', object_id=contributor.pk, project_id=contributor.project_id,
+        ))
+        tombstones.append(Tombstone(
+            kind='project', object_id=contributor.project_id, project_id=contributor.project_id,
+            user_id=contributor.user_id,
+        ))
+    return tombstones
+
+
+@receiver(pre_delete, sender=Project)
+@per_object
+def write_project_tombstones(sender, instance, **kwargs):
+    """One per contributor: contributors are deleted before the project"""
+    user_ids = Contributor.objects.filter(project_id=instance.pk).values_list('user_id', flat=True)
+    sharding.on_commit(partial(Tombstone.objects.bulk_create, [
+        Tombstone(kind='project', object_id=instance.pk, project_id=instance.pk, user_id=user_id)
+        for user_id in user_ids
+    ]))
+
+
+@receiver(post_delete, sender=Contributor)
+@per_object
+def write_contributor_tombstones(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_parent(instance, origin):
+        sharding.on_commit(partial(Tombstone.objects.bulk_create, _contributor_tombstones([instance])))
+
+
+@receiver(post_delete, sender=Issue)
+@per_object
+def write_issue_tombstone(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_parent(instance, origin):
+        sharding.on_commit(partial(
+            Tombstone.objects.create, kind='issue', object_id=instance.pk, project_id=instance.project_id,
+        ))
+
+
+@receiver(post_delete, sender=Comment)
+@per_object
+def write_comment_tombstone(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_parent(instance, origin):
+        sharding.on_commit(partial(
+            Tombstone.objects.create, kind='comment', object_id=instance.pk,
+            project_id=_comment_project_id(instance),
+        ))
+
+
+@receiver(bulk_deleted)
+def write_bulk_tombstones(sender, project_id, instances, **kwargs):
+    if sender is Contributor:
+        tombstones = _contributor_tombstones(instances)
+    else:
+        kind = sender._meta.model_name
+        tombstones = [Tombstone(kind=kind, object_id=obj.pk, project_id=project_id) for obj in instances]
+    sharding.on_commit(partial(Tombstone.objects.bulk_create, tombstones))
+
+
+##########################################################################
+#                            Activity events
+##########################################################################
+
+@receiver(post_save, sender=Issue)
+@per_object
+def publish_issue_saved(sender, instance, created, **kwargs):
+    events.publish([events.issue_event(instance, 'created' if created else 'updated')])
+
+
+@receiver(post_delete, sender=Issue)
+@per_object
+def publish_issue_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_parent(instance, origin):
+        events.publish([events.issue_event(instance, 'deleted')])
+
+
+@receiver(post_save, sender=Comment)
+@per_object
+def publish_comment_saved(sender, instance, created, **kwargs):
+    action = 'created' if created else 'updated'
+    events.publish([events.comment_event(instance, _comment_project_id(instance), action)])
+
+
+@receiver(post_delete, sender=Comment)
+@per_object
+def publish_comment_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_parent(instance, origin):
+        events.publish([events.comment_event(instance, _comment_project_id(instance), 'deleted')])
+
+
+@receiver([bulk_created, bulk_deleted])
+def publish_bulk_events(sender, signal, project_id, instances, **kwargs):
+    action = 'created' if signal is bulk_created else 'deleted'
+    if sender is Issue:
+        events.publish([events.issue_event(issue, action) for issue in instances])
+    elif sender is Comment:
+        events.publish([events.comment_event(comment, project_id, action) for comment in instances])
@@ -0,0 +1,93 @@
+"""
+Per-project statistics served from ProjectCounter rows.
+
+Issues per status / priority / tag are counters created with the project and
+updated by the model / bulk signals (see tracking_projects.signals) with one
+atomic UPDATE per write, so reading statistics does not aggregate issues.
+Totals are the counts stored on the project (repaired by `manage.py
+repair_counts`). `manage.py rebuild_project_statistics` recomputes the
+counters from the tables and reports drift.
+"""
+from django.db.models import Case, Count, F, Value, When
+
+from tracking_projects.models import Project, Issue, ProjectCounter
+
+# Statistics name: Project column
+TOTALS = {'issues': 'issues_count', 'comments': 'comments_count', 'contributors': 'contributors_count'}
+
+
+def _choices(field):
+    return [value for value, _ in Issue._meta.get_field(field).choices]
+
+
+COUNTER_NAMES = [f'{field}:{value}' for field in Issue.COUNTED_FIELDS for value in _choices(field)]
+
+
+def issue_counters(values):
+    """Return counter names of an issue from its {field: value}"""
+    return [f'{field}:{values[field]}' for field in Issue.COUNTED_FIELDS if field in values]
+
+
+def create_counters(project_ids):
+    """Create missing zero counters of projects"""
+    ProjectCounter.objects.bulk_create(
+        [
+            ProjectCounter(project_id=project_id, name=name)
+            for project_id in project_ids for name in COUNTER_NAMES
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def increment(project_id, deltas):
+    """Apply {counter name: delta} to project counters in one UPDATE"""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ProjectCounter.objects.filter(project_id=project_id, name__in=deltas).update(
+        value=F('value') + Case(
+            *[When(name=name, then=Value(delta)) for name, delta in deltas.items()],
+            default=Value(0),
+        )
+    )
+
+
+def add_issues(deltas, issues_values, sign=1):
+    """Add the counters of issues ({field: value} each) to deltas"""
+    for values in issues_values:
+        for name in issue_counters(values):
+            deltas[name] = deltas.get(name, 0) + sign
+    return deltas
+
+
+def get_statistics(project):
+    """Return statistics of project from its counts and counters"""
+    counters = dict(
+        ProjectCounter.objects.filter(project_id=project.pk).values_list('name', 'value')
+    )
+    statistics = {name: getattr(project, column) for name, column in TOTALS.items()}
+    for field in Issue.COUNTED_FIELDS:
+        statistics[field] = {
+            value: counters.get(f'{field}:{value}', 0) for value in _choices(field)
+        }
+    return statistics
+
+
+def compute_counters(project_ids=None):
+    """Return {project_id: {counter name: value}} computed from the tables"""
+    projects = Project.objects.all()
+    if project_ids is not None:
+        projects = projects.filter(pk__in=project_ids)
+    computed = {pk: dict.fromkeys(COUNTER_NAMES, 0) for pk in projects.values_list('pk', flat=True)}
+
+    def add(queryset, project_field, name_of):
+        queryset = queryset.filter(**{f'{project_field}__in': list(computed)})
+        for row in queryset:
+            computed[row[project_field]][name_of(row)] = row['total']
+
+    for field in Issue.COUNTED_FIELDS:
+        add(
+            Issue.objects.values('project_id', field).annotate(total=Count('pk')).order_by(),
+            'project_id', lambda row, field=field: f'{field}:{row[field]}',
+        )
+    return computed
@@ -0,0 +1,200 @@
+"""
+Changes feed of the projects of a user, for offline clients.
+
+changes(user, since) returns the rows of the user's projects created or updated
+since the cursor (`updated_at`, indexed per parent) and the tombstones written
+on deletes since then (see tracking_projects.signals), so a sync costs the
+amount of change rather than the size of the projects. Projects the user joined
+since the cursor are sent whole; without a cursor everything is sent.
+
+A response holds at most SYNC_PAGE_SIZE rows: projects, contributors, issues,
+comments then deletions, each kind in (`updated_at`, id) order. With more left,
+`more` is true and `cursor` continues the same sync: it keeps the moment the
+sync started and the last row sent (keyset). Rows written meanwhile are left to
+the next sync, whose cursor is returned with the last page.
+
+Memberships come from the global MembershipIndex; sharded, each shard holding
+projects of the user is read and the rows merged by `updated_at`.
+
+The next cursor trails the clock by SYNC_OVERLAP: rows committed late by a
+concurrent transaction are sent again rather than missed. Clients apply changes
+as idempotent upserts / deletes by id.
+"""
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from tracking_projects import sharding
+from tracking_projects.models import Project, Contributor, Issue, Comment, Tombstone
+from tracking_projects.serializers import (
+    SyncProjectSerializer, SyncContributorSerializer, SyncIssueSerializer, SyncCommentSerializer,
+)
+
+SYNC_OVERLAP = timedelta(seconds=5)
+# Older tombstones are purged (manage.py purge_tombstones): older cursors need a full sync
+TOMBSTONE_RETENTION = timedelta(days=30)
+# Rows (changes and deletions) per response
+SYNC_PAGE_SIZE = 500
+
+# Kinds of rows in feed order: queryset, project lookup, serializer, user foreign key
+SOURCES = {
+    'projects': (Project.objects.all(), 'pk', SyncProjectSerializer, None),
+    'contributors': (Contributor.objects.all(), 'project_id', SyncContributorSerializer, 'user'),
+    'issues': (Issue.objects.all(), 'project_id', SyncIssueSerializer, 'author'),
+    'comments': (Comment.objects.all(), 'issue__project_id', SyncCommentSerializer, 'author'),
+}
+DELETED = 'deleted'
+KINDS = [*SOURCES, DELETED]
+
+
+class CursorExpired(Exception):
+    """Cursor older than the tombstone retention"""
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def encode_cursor(moment):
+    """Cursor of the next sync: changes since moment"""
+    return _encode(moment.isoformat())
+
+
+def encode_page_cursor(since, until, kind, after):
+    """Cursor continuing a sync after the row keyed `after` (moment, id) of kind, at its start if None"""
+    return _encode(json.dumps({
+        'since': since and since.isoformat(), 'until': until.isoformat(),
+        'kind': kind, 'after': after and [after[0].isoformat(), str(after[1])],
+    }))
+
+
+def _moment(value, cursor):
+    moment = datetime.fromisoformat(value)
+    if timezone.is_naive(moment):
+        raise ValueError(cursor)
+    return moment
+
+
+def decode_cursor(cursor):
+    """
+    Return (since, page) of cursor, page being None or {'until', 'kind', 'after'}
+    for a cursor continuing a sync. Raise ValueError if it is malformed.
+    """
+    try:
+        text = base64.urlsafe_b64decode(cursor.encode()).decode()
+        if not text.startswith('{'):
+            return _moment(text, cursor), None
+        state = json.loads(text)
+        since = _moment(state['since'], cursor) if state['since'] else None
+        kind, after = state['kind'], None
+        if kind not in KINDS:
+            raise ValueError(cursor)
+        if state['after'] is not None:
+            moment, object_id = state['after']
+            object_id = uuid.UUID(object_id) if kind == 'comments' else int(object_id)
+            after = (_moment(moment, cursor), object_id)
+        page = {'until': _moment(state['until'], cursor), 'kind': kind, 'after': after}
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError) as e:
+        raise ValueError(cursor) from e
+    return since, page
+
+
+def _after(field, after):
+    """Rows after the keyset (moment, id) in (field, pk) order"""
+    if after is None:
+        return Q()
+    moment, object_id = after
+    return Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'pk__gt': object_id})
+
+
+def changes(user, since=None, context=None, page=None, limit=None):
+    """
+    Return {'cursor', 'more', 'changes': {kind: [rows]}, 'deleted': {kind: [ids]}}
+    of the projects of user since the `since` moment (None: everything), from
+    where `page` stopped (see decode_cursor()).
+    """
+    limit = limit or SYNC_PAGE_SIZE
+    now = timezone.now()
+    if since is not None and since < now - TOMBSTONE_RETENTION:
+        raise CursorExpired()
+    until = page['until'] if page else now
+
+    memberships = list(sharding.memberships(user).values_list('project_id', 'joined_at'))
+    project_ids = [project_id for project_id, _ in memberships]
+    joined = {project_id for project_id, joined_at in memberships if since is not None and joined_at >= since}
+
+    def changed(queryset, project_field, ids):
+        in_projects = Q(**{f'{project_field}__in': ids})
+        if since is None:
+            return queryset.filter(in_projects)
+        joined_projects = Q(**{f'{project_field}__in': joined.intersection(ids)})
+        return queryset.filter((in_projects & Q(updated_at__gte=since)) | joined_projects)
+
+    def changed_rows(name, after, count):
+        """Return up to count rows of kind name after the keyset, merged across shards"""
+        queryset, project_field, _, user_field = SOURCES[name]
+        rows = []
+        for alias, ids in sharding.group_by_shard(project_ids).items():
+            shard_rows = changed(queryset.using(alias), project_field, ids).filter(
+                _after('updated_at', after), updated_at__lte=until,
+            )
+            if user_field:
+                shard_rows = sharding.with_users(shard_rows, user_field)
+            rows += shard_rows.order_by('updated_at', 'pk')[:count]
+        return sorted(rows, key=lambda row: (row.updated_at, row.pk))[:count]
+
+    def deleted_rows(after, count):
+        if since is None:
+            return []
+        tombstones = Tombstone.objects.filter(
+            Q(project_id__in=project_ids, user_id=None) | Q(user_id=user.pk),
+            _after('deleted_at', after), deleted_at__gte=since, deleted_at__lte=until,
+        )
+        rows = tombstones.order_by('deleted_at', 'pk').values_list('deleted_at', 'pk', 'kind', 'object_id')
+        return list(rows[:count])
+
+    result = {
+        'changes': {name: [] for name in SOURCES},
+        'deleted': {f'{kind}s': [] for kind, _ in Tombstone.KIND_CHOICES},
+        'more': False,
+    }
+    first = KINDS.index(page['kind']) if page else 0
+    remaining = limit
+    for index, kind in enumerate(KINDS[first:], start=first):
+        after = page['after'] if page and index == first else None
+        # One row more tells whether the kind has rows left after this page
+        if kind == DELETED:
+            rows = deleted_rows(after, remaining + 1)
+            keys = [(deleted_at, pk) for deleted_at, pk, _, _ in rows]
+            for _, _, tombstone_kind, object_id in rows[:remaining]:
+                result['deleted'][f'{tombstone_kind}s'].append(
+                    object_id if tombstone_kind == 'comment' else int(object_id)
+                )
+        else:
+            rows = changed_rows(kind, after, remaining + 1)
+            keys = [(row.updated_at, row.pk) for row in rows]
+            result['changes'][kind] = SOURCES[kind][2](rows[:remaining], many=True, context=context).data
+        if len(rows) > remaining:
+            result['more'] = True
+            last = keys[remaining - 1] if remaining else after
+            result['cursor'] = encode_page_cursor(since, until, kind, last)
+            return result
+        remaining -= len(rows)
+
+    next_cursor = until - SYNC_OVERLAP
+    if since is not None:
+        next_cursor = max(next_cursor, since)
+    result['cursor'] = encode_cursor(next_cursor)
+    return result
+
+
+def purge_tombstones(before=None):
+    """Delete tombstones older than the retention, return how many were deleted"""
+    before = before or timezone.now() - TOMBSTONE_RETENTION
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=before).delete()
+    return deleted
@@ -1,3 +1,1806 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from unittest import mock, skipUnless
+from datetime import date
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.authentication import CachedUserJWTAuthentication, verified_tokens
+from config import caches, routers, sqlite
+from tracking_projects.async_views import AsyncReadView
+from tracking_projects import caching, compiled, events, membership, search, sharding, statistics, sync
+from tracking_projects.models import (
+    Project, Issue, Comment, Contributor, ProjectCounter, ActivityEvent, MembershipIndex, IdSequence,
+)
+from tracking_projects.management.commands.import_ndjson import Command as ImportCommand
+from tracking_projects.pagination import ContributorPagination, ProjectPagination
+from tracking_projects.serializers import IssueDetailSerializer, IssueListSerializer
+
+User = get_user_model()
+
+
+class TrackingProjectsTestCase(APITestCase):
+    """Base test case with an author and a contributor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username="author",
+            email="author@test",
+            password="password",
+            date_of_birth=date(2000, 1, 1),
+        )
+        cls.contributor = User.objects.create_user(
+            username="contributor",
+            email="contributor@test",
+            password="password",
+            date_of_birth=date(2000, 1, 1),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.author)
+
+    def create_project(self, name="Projet", contributors=()):
+        project = Project.objects.create(
+            name=name, description="description", type='back-end', author=self.author,
+        )
+        for user in contributors:
+            project.add_contributor(user)
+        return project
+
+    def create_issue(self, project, title="Issue", **kwargs):
+        return Issue.objects.create(
+            title=title, project=project, author=self.author, **kwargs
+        )
+
+    def create_comment(self, issue, description="Commentaire"):
+        return Comment.objects.create(description=description, issue=issue, author=self.author)
+
+    def count_queries(self, url):
+        """Return number of queries of a GET on url, caches being warm"""
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+
+class ProjectListTestCase(TrackingProjectsTestCase):
+
+    def test_list_counts(self):
+        """Test list exposes annotated contributors and issues counts"""
+        project = self.create_project(contributors=[self.contributor])
+        self.create_issue(project)
+        self.create_issue(project)
+
+        response = self.client.get(reverse('tracking_project:projects-list'))
+
+        self.assertEqual(response.status_code, 200)
+        result = response.data['results'][0]
+        self.assertEqual(result['contributors_count'], 2)
+        self.assertEqual(result['issues_count'], 2)
+
+    def test_list_query_count_is_constant(self):
+        """Test list runs the same number of queries whatever the page size: validators, index page, projects"""
+        for index in range(2):
+            self.create_project(name=f"Projet {index}", contributors=[self.contributor])
+        with self.assertNumQueries(3):
+            self.client.get(reverse('tracking_project:projects-list'))
+
+        for index in range(4):
+            self.create_project(name=f"Autre {index}", contributors=[self.contributor])
+        with self.assertNumQueries(3):
+            self.client.get(reverse('tracking_project:projects-list'))
+
+    def test_pages_read_indexes_in_order(self):
+        """Test project and contributor pages are read in index order, without sorting"""
+        project = self.create_project()
+        after = timezone.now() - timezone.timedelta(days=1)
+        pages = [
+            sharding.memberships(self.author).filter(created_at__gt=after).order_by(*ProjectPagination.ordering),
+            Contributor.objects.filter(project=project, created_at__gt=after).order_by(*ContributorPagination.ordering),
+        ]
+        for page in pages:
+            plan = page[:7].explain()
+            self.assertIn('USING INDEX', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_list_only_contributor_projects(self):
+        """Test list hides projects where user is not a contributor"""
+        self.create_project()
+        self.client.force_authenticate(self.contributor)
+
+        response = self.client.get(reverse('tracking_project:projects-list'))
+
+        self.assertEqual(response.data['results'], [])
+
+
+class NestedQueryCountTestCase(TrackingProjectsTestCase):
+    """Test nested endpoints run a constant number of queries"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.issue = self.create_issue(self.project)
+
+    def test_issue_endpoints(self):
+        """Test issue list and detail do not query per row"""
+        list_url = reverse('tracking_project:projects-issues-list', args=[self.project.pk])
+        detail_url = reverse('tracking_project:projects-issues-detail', args=[self.project.pk, self.issue.pk])
+        self.create_comment(self.issue)
+        list_queries, detail_queries = self.count_queries(list_url), self.count_queries(detail_url)
+
+        for index in range(4):
+            issue = self.create_issue(self.project, title=f"Issue {index}", assigned_to=self.contributor)
+            self.create_comment(issue)
+            self.create_comment(self.issue)
+
+        self.assertEqual(self.count_queries(list_url), list_queries)
+        self.assertEqual(self.count_queries(detail_url), detail_queries)
+
+    def test_comment_and_contributor_lists(self):
+        """Test comment and contributor lists do not query per row"""
+        comments_url = reverse(
+            'tracking_project:projects-issues-comments-list', args=[self.project.pk, self.issue.pk]
+        )
+        contributors_url = reverse('tracking_project:project-contributors-list', args=[self.project.pk])
+        self.create_comment(self.issue)
+        comment_queries, contributor_queries = (
+            self.count_queries(comments_url), self.count_queries(contributors_url)
+        )
+
+        for index in range(4):
+            self.create_comment(self.issue)
+            self.project.add_contributor(User.objects.create_user(
+                username=f"user{index}", password="password", date_of_birth=date(2000, 1, 1)
+            ))
+
+        self.assertEqual(self.count_queries(comments_url), comment_queries)
+        self.assertEqual(self.count_queries(contributors_url), contributor_queries)
+
+
+class NestedPreviewTestCase(TrackingProjectsTestCase):
+    """Test detail endpoints embed a bounded preview of their children"""
+
+    def test_project_detail_preview(self):
+        """Test project detail embeds the latest issues, their total and a link"""
+        project = self.create_project(contributors=[self.contributor])
+        url = reverse('tracking_project:projects-detail', args=[project.pk])
+        self.create_issue(project)
+        queries = self.count_queries(url)
+
+        for index in range(6):
+            self.create_issue(project, title=f"Issue {index}")
+
+        self.assertEqual(self.count_queries(url), queries)
+        issues = self.client.get(url).data['issues']
+        self.assertEqual(issues['count'], 7)
+        self.assertEqual(len(issues['results']), 5)
+        self.assertEqual(issues['results'][0]['title'], "Issue 5")
+        self.assertTrue(issues['next'].endswith(f'/api/v1/projects/{project.pk}/issues/'))
+        contributors = self.client.get(url).data['contributors']
+        self.assertEqual(contributors['count'], 2)
+        self.assertIsNone(contributors['next'])
+
+    def test_issue_detail_preview(self):
+        """Test issue detail embeds the latest comments and their total"""
+        project = self.create_project()
+        issue = self.create_issue(project)
+        for index in range(6):
+            self.create_comment(issue, description=f"Commentaire {index}")
+
+        response = self.client.get(
+            reverse('tracking_project:projects-issues-detail', args=[project.pk, issue.pk])
+        )
+
+        comments = response.data['comments']
+        self.assertEqual(comments['count'], 6)
+        self.assertEqual(len(comments['results']), 5)
+        self.assertIsNotNone(comments['next'])
+
+
+class MembershipTestCase(TrackingProjectsTestCase):
+    """Test cached project membership"""
+
+    def test_membership_is_cached(self):
+        """Test membership is loaded once then served from cache"""
+        project = self.create_project()
+        with self.assertNumQueries(1):
+            self.assertTrue(membership.is_author(self.author, project.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(membership.is_contributor(self.author, project.pk))
+            self.assertFalse(membership.is_contributor(self.contributor, project.pk))
+
+    def test_membership_is_invalidated(self):
+        """Test contributor and project writes invalidate the cache"""
+        project = self.create_project()
+        self.assertFalse(membership.is_contributor(self.contributor, project.pk))
+
+        project.add_contributor(self.contributor)
+        self.assertTrue(membership.is_contributor(self.contributor, project.pk))
+
+        Contributor.objects.get(project=project, user=self.contributor).delete()
+        self.assertFalse(membership.is_contributor(self.contributor, project.pk))
+
+        project.author = self.contributor
+        project.save()
+        self.assertTrue(membership.is_author(self.contributor, project.pk))
+
+    def test_local_cache_timeout(self):
+        """Test entries of a per process cache expire quickly, those of a shared cache do not"""
+        self.assertEqual(membership.cache_timeout(), caches.LOCAL_CACHE_TIMEOUT)
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir(),
+        }}
+        with self.settings(CACHES=shared):
+            self.assertEqual(membership.cache_timeout(), membership.MEMBERSHIP_CACHE_TIMEOUT)
+
+    def test_unknown_project(self):
+        """Test nested routes of an unknown project are forbidden"""
+        response = self.client.get(reverse('tracking_project:projects-issues-list', args=[999]))
+        self.assertEqual(response.status_code, 403)
+
+
+class WriteQueryCountTestCase(TrackingProjectsTestCase):
+    """Test write requests load the addressed rows once"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.issue = self.create_issue(self.project)
+        membership.get_membership(self.project.pk)
+
+    def test_update_issue(self):
+        """
+        Test issue update loads the issue once, reads its locked row, updates it,
+        bumps the project version and its counters, logs the event
+        """
+        url = reverse('tracking_project:projects-issues-detail', args=[self.project.pk, self.issue.pk])
+        with self.assertNumQueries(6):
+            response = self.client.patch(url, {'status': 'Finished'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_issue(self):
+        """Test issue create does not load the project"""
+        url = reverse('tracking_project:projects-issues-list', args=[self.project.pk])
+        with self.assertNumQueries(4):
+            response = self.client.post(url, {'title': "Nouvelle issue"})
+        self.assertEqual(response.status_code, 201)
+
+    def test_comment_on_issue_of_other_project(self):
+        """Test comments are only created on issues of the project in URL"""
+        other_project = self.create_project(name="Autre")
+        url = reverse('tracking_project:projects-issues-comments-list', args=[other_project.pk, self.issue.pk])
+        response = self.client.post(url, {'description': "Commentaire"})
+        self.assertEqual(response.status_code, 404)
+
+
+class KeysetPaginationTestCase(TrackingProjectsTestCase):
+    """Test cursor pagination of nested lists"""
+
+    def test_walk_issue_pages(self):
+        """Test every issue is returned once, newest first, with client page size"""
+        project = self.create_project()
+        issues = [self.create_issue(project, title=f"Issue {index}") for index in range(7)]
+        Issue.objects.filter(pk__in=[issues[2].pk, issues[3].pk]).update(created_at=issues[2].created_at)
+
+        url = reverse('tracking_project:projects-issues-list', args=[project.pk]) + '?page_size=3'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen += [issue['id'] for issue in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(sorted(seen), sorted(issue.pk for issue in issues))
+        self.assertEqual(seen[0], issues[-1].pk)
+
+    def test_page_size_is_capped(self):
+        """Test page_size cannot exceed max_page_size"""
+        project = self.create_project()
+        issue = self.create_issue(project)
+        Comment.objects.bulk_create(
+            Comment(description=f"Commentaire {index}", issue=issue, author=self.author)
+            for index in range(55)
+        )
+
+        response = self.client.get(
+            reverse('tracking_project:projects-issues-comments-list', args=[project.pk, issue.pk]),
+            {'page_size': 100},
+        )
+
+        self.assertEqual(len(response.data['results']), 50)
+
+
+class ConditionalRequestTestCase(TrackingProjectsTestCase):
+    """Test ETag / Last-Modified validators"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project()
+        self.issue = self.create_issue(self.project)
+        self.url = reverse('tracking_project:projects-issues-detail', args=[self.project.pk, self.issue.pk])
+
+    def test_not_modified(self):
+        """Test GET answers 304 until something changes in the project"""
+        etag = self.client.get(self.url)['ETag']
+        self.assertIsNotNone(etag)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.create_comment(self.issue)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_project_list_not_modified(self):
+        """Test project list validator changes when a visible project changes"""
+        url = reverse('tracking_project:projects-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.create_issue(self.project)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_match(self):
+        """Test PATCH with a stale If-Match answers 412"""
+        etag = self.client.get(self.url)['ETag']
+        self.create_issue(self.project)
+
+        response = self.client.patch(self.url, {'status': 'Finished'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.patch(self.url, {'status': 'Finished'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_per_representation(self):
+        """Test query parameters and renderer give their own ETag"""
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotEqual(self.client.get(self.url, {'format': 'api'})['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, {'format': 'api'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        url = reverse('tracking_project:projects-issues-list', args=[self.project.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_renamed_user_changes_project(self):
+        """Test a username change bumps the projects showing it"""
+        self.issue.assigned_to = self.contributor
+        self.issue.save()
+        etag = self.client.get(self.url)['ETag']
+
+        self.contributor.username = "renamed"
+        self.contributor.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['assigned_to_name'], "renamed")
+
+        etag = response['ETag']
+        self.contributor.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_renamed_comment_author_changes_project(self):
+        """Test renaming the author of a comment only bumps the project of the comment"""
+        other = Project.objects.create(name="Autre", description="description", type='iOS', author=self.author)
+        Comment.objects.create(description="Commentaire", issue=self.issue, author=self.contributor)
+        versions = dict(Project.objects.values_list('pk', 'version'))
+
+        self.contributor.username = "renamed"
+        self.contributor.save()
+
+        self.assertEqual(Project.objects.get(pk=self.project.pk).version, versions[self.project.pk] + 1)
+        self.assertEqual(Project.objects.get(pk=other.pk).version, versions[other.pk])
+
+    def test_deleted_account_changes_project(self):
+        """Test deleting a contributor's account bumps the project and evicts its details"""
+        self.project.add_contributor(self.contributor)
+        issue = Issue.objects.create(title="Issue", project=self.project, author=self.contributor)
+        Comment.objects.create(description="Commentaire", issue=self.issue, author=self.contributor)
+        project_url = reverse('tracking_project:projects-detail', args=[self.project.pk])
+        etag = self.client.get(self.url)['ETag']
+        self.client.get(project_url)
+
+        self.contributor.delete()
+        self.assertFalse(Issue.objects.filter(pk=issue.pk).exists())
+        self.assertIsNone(cache.get(caching.issue_detail_key(self.issue.pk)))
+        self.assertIsNone(cache.get(caching.project_detail_key(self.project.pk)))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DetailCacheTestCase(TrackingProjectsTestCase):
+    """Test project and issue detail response cache"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project()
+        self.issue = self.create_issue(self.project)
+
+    def test_issue_detail_is_cached_and_evicted(self):
+        """Test a hit skips serialization queries and a comment evicts the entry"""
+        url = reverse('tracking_project:projects-issues-detail', args=[self.project.pk, self.issue.pk])
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        self.create_comment(self.issue)
+        self.assertIsNone(cache.get(caching.issue_detail_key(self.issue.pk)))
+        self.assertEqual(self.client.get(url).data['comments']['count'], 1)
+
+    def test_project_detail_follows_project_version(self):
+        """Test project detail is rebuilt after a write in the project"""
+        url = reverse('tracking_project:projects-detail', args=[self.project.pk])
+        self.assertEqual(self.client.get(url).data['issues']['results'][0]['comments_count'], 0)
+
+        self.create_comment(self.issue)
+        self.assertEqual(self.client.get(url).data['issues']['results'][0]['comments_count'], 1)
+
+    def test_cached_detail_checks_membership(self):
+        """Test a cached entry is not served to a non contributor"""
+        url = reverse('tracking_project:projects-detail', args=[self.project.pk])
+        etag = self.client.get(url)['ETag']
+        self.client.force_authenticate(self.contributor)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_cache_attributes_required(self):
+        """Test a view without key or stub is rejected when defined"""
+        with self.assertRaises(ImproperlyConfigured):
+            type('View', (caching.DetailCacheMixin,), {'detail_cache_key': staticmethod(caching.issue_detail_key)})
+
+    def test_concurrent_misses_build_once(self):
+        """Test concurrent misses of a key are coalesced"""
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'built': True}
+
+        threads = [
+            threading.Thread(target=caching.get_or_build, args=('key', 'etag', 'origin', build))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(caching.get_or_build('key', 'etag', 'origin', build), {'built': True})
+
+
+class BulkIssueTestCase(TrackingProjectsTestCase):
+    """Test bulk issue creation"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.url = reverse('tracking_project:projects-issues-bulk-create', args=[self.project.pk])
+
+    def test_bulk_create(self):
+        """Test issues are inserted with a constant number of queries"""
+        items = [
+            {'title': f"Issue {index}", 'assigned_to': self.contributor.pk, 'priority': 'HIGH'}
+            for index in range(50)
+        ]
+        membership.get_membership(self.project.pk)
+        version = Project.objects.get().version
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, items, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(Issue.objects.filter(project=self.project, assigned_to=self.contributor).count(), 50)
+        self.assertEqual(Project.objects.get().version, version + 1)
+
+    def test_bulk_create_reports_errors_by_item(self):
+        """Test invalid items are reported by index and nothing is created"""
+        outsider = User.objects.create_user(username="outsider", password="password")
+        items = [{'title': "Issue"}, {'title': "Issue", 'assigned_to': outsider.pk}, {'priority': 'HIGH'}]
+
+        response = self.client.post(self.url, items, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('assigned_to', errors[1])
+        self.assertIn('title', errors[2])
+        self.assertFalse(Issue.objects.exists())
+
+
+class BulkContributorTestCase(TrackingProjectsTestCase):
+    """Test bulk contributor add / remove"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.url = reverse('tracking_project:project-contributors-bulk-membership', args=[self.project.pk])
+        self.users = User.objects.bulk_create(
+            User(username=f"user{index}", email=f"user{index}@test") for index in range(30)
+        )
+
+    def test_bulk_add_and_remove(self):
+        """Test users are added / removed with a constant number of queries"""
+        data = {
+            'add': [user.pk for user in self.users] + [self.contributor.pk],
+            'remove': [self.contributor.pk + 1000],
+        }
+        with self.assertNumQueries(10):
+            response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['added']), 30)
+        self.assertEqual(response.data['removed'], [])
+        self.assertTrue(membership.is_contributor(self.users[0], self.project.pk))
+
+        response = self.client.post(self.url, {'remove': [self.contributor.pk, self.users[0].pk]}, format='json')
+        self.assertEqual(response.data['removed'], sorted([self.contributor.pk, self.users[0].pk]))
+        self.assertEqual(Contributor.objects.filter(project=self.project).count(), 30)
+        self.assertFalse(membership.is_contributor(self.users[0], self.project.pk))
+
+    def test_bulk_reads_memberships_in_transaction(self):
+        """Test a stale membership cache neither reports nor counts existing contributors as added"""
+        membership.get_membership(self.project.pk)
+        # Added by another process: the cache of this one still misses it
+        self.project.add_contributor(self.users[0])
+        cache.set(membership.cache_key(self.project.pk), (self.author.pk, frozenset([self.author.pk])))
+        count = Project.objects.get(pk=self.project.pk).contributors_count
+
+        response = self.client.post(self.url, {'add': [self.users[0].pk, self.users[1].pk]}, format='json')
+
+        self.assertEqual(response.data['added'], [self.users[1].pk])
+        self.assertEqual(Project.objects.get(pk=self.project.pk).contributors_count, count + 1)
+
+    def test_bulk_rejects_unknown_users_and_author(self):
+        """Test unknown users and removal of the author are rejected"""
+        response = self.client.post(self.url, {'add': [999], 'remove': [self.author.pk]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('add', response.data)
+        self.assertIn('remove', response.data)
+
+    def test_bulk_rejects_added_and_removed_users(self):
+        """Test a user both added and removed is rejected, contributor or not"""
+        user_ids = [user.pk for user in self.users[:2]]
+        response = self.client.post(self.url, {'add': user_ids, 'remove': user_ids}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Contributor.objects.filter(user_id__in=user_ids).exists())
+
+    def test_bulk_only_author(self):
+        """Test only the project author can change contributors"""
+        self.client.force_authenticate(self.contributor)
+        response = self.client.post(self.url, {'add': [self.users[0].pk]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class StatisticsTestCase(TrackingProjectsTestCase):
+    """Test per-project statistics counters"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.url = reverse('tracking_project:projects-statistics', args=[self.project.pk])
+
+    def assertNoDrift(self):
+        out = io.StringIO()
+        call_command('rebuild_project_statistics', verify=True, stdout=out)
+        self.assertIn("No drift", out.getvalue())
+
+    def test_counters_follow_writes(self):
+        """Test counters are updated on create, update and delete"""
+        issue = self.create_issue(self.project, priority='HIGH', tag='BUG')
+        self.create_issue(self.project)
+        self.create_comment(issue)
+        self.create_comment(issue)
+
+        issue = Issue.objects.get(pk=issue.pk)
+        issue.status = 'Finished'
+        issue.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['issues'], 2)
+        self.assertEqual(response.data['comments'], 2)
+        self.assertEqual(response.data['contributors'], 2)
+        self.assertEqual(response.data['status'], {'To Do': 1, 'In Progress': 0, 'Finished': 1})
+        self.assertEqual(response.data['priority']['HIGH'], 1)
+        self.assertEqual(response.data['tag']['BUG'], 1)
+        self.assertNoDrift()
+
+        issue.delete()
+        Contributor.objects.get(user=self.contributor).delete()
+        statistics_ = statistics.get_statistics(Project.objects.get(pk=self.project.pk))
+        self.assertEqual(statistics_['issues'], 1)
+        self.assertEqual(statistics_['comments'], 0)
+        self.assertEqual(statistics_['contributors'], 1)
+        self.assertEqual(statistics_['status']['Finished'], 0)
+        self.assertNoDrift()
+
+    def test_counters_follow_concurrent_copies(self):
+        """Test deltas come from the overwritten row, not from the values a copy was loaded with"""
+        issue = self.create_issue(self.project)
+        first, second = Issue.objects.get(pk=issue.pk), Issue.objects.get(pk=issue.pk)
+        first.status = 'In Progress'
+        first.save()
+        second.status = 'Finished'
+        second.save()
+
+        statistics_ = statistics.get_statistics(Project.objects.get(pk=self.project.pk))
+        self.assertEqual(statistics_['status'], {'To Do': 0, 'In Progress': 0, 'Finished': 1})
+        self.assertNoDrift()
+
+    def test_counters_follow_account_deletion(self):
+        """Test issues and comments deleted with a user account are uncounted"""
+        issue = self.create_issue(self.project, tag='BUG')
+        own_issue = Issue.objects.create(title="Issue", project=self.project, author=self.contributor, tag='BUG')
+        Comment.objects.create(description="Commentaire", issue=issue, author=self.contributor)
+        self.create_comment(own_issue)
+
+        self.contributor.delete()
+        statistics_ = self.client.get(self.url).data
+        self.assertEqual(
+            (statistics_['issues'], statistics_['comments'], statistics_['contributors']), (1, 0, 1),
+        )
+        self.assertEqual(statistics_['tag']['BUG'], 1)
+        self.assertNoDrift()
+
+    def test_totals_are_project_counts(self):
+        """Test totals are read from the project row, not from counters"""
+        self.create_comment(self.create_issue(self.project))
+        self.assertFalse(ProjectCounter.objects.filter(name__in=statistics.TOTALS).exists())
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertEqual((project.issues_count, project.comments_count, project.contributors_count), (1, 1, 2))
+        Project.objects.filter(pk=self.project.pk).update(comments_count=5)
+        self.assertEqual(self.client.get(self.url).data['comments'], 5)
+
+    def test_counters_follow_bulk_writes(self):
+        """Test bulk endpoints update counters"""
+        url = reverse('tracking_project:projects-issues-bulk-create', args=[self.project.pk])
+        self.client.post(url, [{'title': "Issue", 'tag': 'BUG'}] * 3, format='json')
+        url = reverse('tracking_project:project-contributors-bulk-membership', args=[self.project.pk])
+        self.client.post(url, {'remove': [self.contributor.pk]}, format='json')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['issues'], 3)
+        self.assertEqual(response.data['tag']['BUG'], 3)
+        self.assertEqual(response.data['contributors'], 1)
+        self.assertNoDrift()
+
+    def test_read_does_not_depend_on_issues(self):
+        """Test statistics are read with a constant number of queries"""
+        for index in range(20):
+            self.create_issue(self.project, title=f"Issue {index}")
+        self.assertEqual(self.count_queries(self.url), 2)
+
+    def test_rebuild_fixes_drift(self):
+        """Test the command reports and repairs drifted counters"""
+        self.create_issue(self.project)
+        ProjectCounter.objects.filter(project=self.project, name='status:To Do').update(value=42)
+
+        out = io.StringIO()
+        call_command('rebuild_project_statistics', verify=True, stdout=out)
+        self.assertIn("status:To Do: 42 -> 1", out.getvalue())
+        call_command('rebuild_project_statistics', project=[self.project.pk], stdout=io.StringIO())
+        self.assertNoDrift()
+
+    def test_only_contributors(self):
+        """Test statistics are hidden from non contributors"""
+        outsider = User.objects.create_user(username="outsider", password="password")
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class DenormalizedCountsTestCase(TrackingProjectsTestCase):
+    """Test counts stored on projects and issues"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+
+    def assertCounts(self, contributors, issues):
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertEqual((project.contributors_count, project.issues_count), (contributors, issues))
+
+    def test_counts_follow_writes(self):
+        """Test counts are moved on create and delete, not on update"""
+        issue = self.create_issue(self.project)
+        self.create_issue(self.project)
+        comment = self.create_comment(issue)
+        self.create_comment(issue)
+        issue.title = "Renommée"
+        issue.save()
+        self.assertCounts(contributors=2, issues=2)
+        self.assertEqual(Issue.objects.get(pk=issue.pk).comments_count, 2)
+
+        comment.delete()
+        self.assertEqual(Issue.objects.get(pk=issue.pk).comments_count, 1)
+        issue.delete()
+        Contributor.objects.get(user=self.contributor).delete()
+        self.assertCounts(contributors=1, issues=1)
+
+    def test_counts_follow_account_deletion(self):
+        """Test children deleted with a user account move the counts"""
+        issue = self.create_issue(self.project)
+        own_issue = Issue.objects.create(title="Issue", project=self.project, author=self.contributor)
+        Comment.objects.create(description="Commentaire", issue=issue, author=self.contributor)
+        self.create_comment(own_issue)
+        self.assertCounts(contributors=2, issues=2)
+
+        self.contributor.delete()
+        self.assertCounts(contributors=1, issues=1)
+        self.assertEqual(Issue.objects.get(pk=issue.pk).comments_count, 0)
+        out = io.StringIO()
+        call_command('repair_counts', verify=True, stdout=out)
+        self.assertIn("No drift", out.getvalue())
+
+    def test_counts_follow_bulk_writes(self):
+        """Test bulk endpoints move counts"""
+        url = reverse('tracking_project:projects-issues-bulk-create', args=[self.project.pk])
+        self.client.post(url, [{'title': "Issue"}] * 3, format='json')
+        url = reverse('tracking_project:project-contributors-bulk-membership', args=[self.project.pk])
+        self.client.post(url, {'remove': [self.contributor.pk]}, format='json')
+        self.assertCounts(contributors=1, issues=3)
+
+    def test_lists_read_columns(self):
+        """Test list queries do not count children"""
+        self.create_comment(self.create_issue(self.project))
+        urls = {
+            reverse('tracking_project:projects-list'): '"tracking_projects_issue"',
+            reverse('tracking_project:projects-issues-list', args=[self.project.pk]): '"tracking_projects_comment"',
+        }
+        for url, children in urls.items():
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.data['results'][0].get('comments_count', 1), 1)
+            self.assertFalse([query for query in context if children in query['sql']])
+
+    def test_repair_counts(self):
+        """Test the command reports and repairs drifted counts"""
+        issue = self.create_issue(self.project)
+        Project.objects.filter(pk=self.project.pk).update(issues_count=7, comments_count=3)
+        Issue.objects.filter(pk=issue.pk).update(comments_count=-1)
+
+        out = io.StringIO()
+        call_command('repair_counts', verify=True, stdout=out)
+        self.assertIn(f"project {self.project.pk} issues_count: 7 -> 1", out.getvalue())
+        self.assertIn(f"project {self.project.pk} comments_count: 3 -> 0", out.getvalue())
+        self.assertIn(f"issue {issue.pk} comments_count: -1 -> 0", out.getvalue())
+        self.assertCounts(contributors=2, issues=7)
+
+        call_command('repair_counts', project=[self.project.pk], stdout=io.StringIO())
+        self.assertCounts(contributors=2, issues=1)
+        self.assertEqual(Issue.objects.get(pk=issue.pk).comments_count, 0)
+
+
+class SyncTestCase(TrackingProjectsTestCase):
+    """Test the changes feed"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.issue = self.create_issue(self.project)
+        self.other_issue = self.create_issue(self.project, title="Autre")
+        self.comment = self.create_comment(self.issue)
+        self.url = reverse('tracking_project:sync-list')
+
+    def changes_since(self, cursor):
+        response = self.client.get(self.url, {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, data, kind):
+        key = 'uuid' if kind == 'comments' else 'id'
+        return [row[key] for row in data['changes'][kind]]
+
+    def test_full_sync(self):
+        """Test no cursor returns every row of the user's projects"""
+        self.create_project(name="Autre").contributors.filter(user=self.author).delete()
+
+        data = self.client.get(self.url).data
+
+        self.assertEqual(self.ids(data, 'projects'), [self.project.pk])
+        self.assertEqual(sorted(self.ids(data, 'issues')), sorted([self.issue.pk, self.other_issue.pk]))
+        self.assertEqual(len(data['changes']['contributors']), 2)
+        self.assertEqual(self.ids(data, 'comments'), [str(self.comment.pk)])
+        self.assertTrue(data['cursor'])
+
+    def test_changes_since_cursor(self):
+        """Test only rows written since the cursor and deletions are returned"""
+        cursor = sync.encode_cursor(timezone.now())
+        self.issue.status = 'Finished'
+        self.issue.save()
+        new_comment = self.create_comment(self.issue, "Nouveau")
+        comment_pk, issue_pk = self.comment.pk, self.other_issue.pk
+        self.comment.delete()
+        self.other_issue.delete()
+
+        data = self.changes_since(cursor)
+
+        self.assertEqual(self.ids(data, 'issues'), [self.issue.pk])
+        self.assertEqual(self.ids(data, 'comments'), [str(new_comment.pk)])
+        self.assertEqual(data['changes']['contributors'], [])
+        self.assertEqual(data['deleted']['issues'], [issue_pk])
+        self.assertEqual(data['deleted']['comments'], [str(comment_pk)])
+
+    def test_queries_do_not_depend_on_size(self):
+        """Test a sync runs a constant number of queries"""
+        for index in range(10):
+            self.create_comment(self.create_issue(self.project, title=f"Issue {index}"))
+        cursor = sync.encode_cursor(timezone.now())
+        with self.assertNumQueries(6):
+            self.changes_since(cursor)
+
+    def test_removed_contributor(self):
+        """Test a removed contributor gets the project deleted, the others the contributor"""
+        cursor = sync.encode_cursor(timezone.now())
+        contributor = Contributor.objects.get(project=self.project, user=self.contributor)
+        contributor_pk = contributor.pk
+        contributor.delete()
+
+        self.assertEqual(self.changes_since(cursor)['deleted']['contributors'], [contributor_pk])
+        self.client.force_authenticate(self.contributor)
+        data = self.changes_since(cursor)
+        self.assertEqual(data['deleted']['projects'], [self.project.pk])
+        self.assertEqual(data['deleted']['contributors'], [])
+
+    def test_deleted_project(self):
+        """Test a deleted project is sent to each contributor, without its children"""
+        cursor = sync.encode_cursor(timezone.now())
+        project_id = self.project.pk
+        self.project.delete()
+
+        for user in (self.author, self.contributor):
+            self.client.force_authenticate(user)
+            data = self.changes_since(cursor)
+            self.assertEqual(data['deleted']['projects'], [project_id])
+            self.assertEqual(data['deleted']['issues'], [])
+
+    def test_joined_project_sent_whole(self):
+        """Test a project joined since the cursor is sent with all its rows"""
+        outsider = User.objects.create_user(username="outsider", password="password")
+        cursor = sync.encode_cursor(timezone.now())
+        self.project.add_contributor(outsider)
+
+        self.client.force_authenticate(outsider)
+        data = self.changes_since(cursor)
+        self.assertEqual(self.ids(data, 'projects'), [self.project.pk])
+        self.assertEqual(len(data['changes']['issues']), 2)
+
+    def sync_pages(self, cursor=None):
+        """Return the responses of a sync, following the cursor while there is more"""
+        pages = []
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            pages.append(self.client.get(self.url, params).data)
+            cursor = pages[-1]['cursor']
+            if not pages[-1]['more']:
+                return pages
+
+    def test_paged_sync(self):
+        """Test a sync is sent by pages of SYNC_PAGE_SIZE rows, each row once"""
+        for index in range(3):
+            self.create_issue(self.project, title=f"Issue {index}")
+        cursor = sync.encode_cursor(timezone.now())
+        deleted = [self.create_comment(self.issue).pk for _ in range(3)]
+
+        with mock.patch.object(sync, 'SYNC_PAGE_SIZE', 2):
+            pages = self.sync_pages()
+            self.assertEqual(len(pages), 6)  # 1 project, 2 contributors, 5 issues, 4 comments
+            issues = [row['id'] for page in pages for row in page['changes']['issues']]
+            self.assertEqual(sorted(issues), sorted(Issue.objects.values_list('pk', flat=True)))
+            self.assertIsNone(sync.decode_cursor(pages[-1]['cursor'])[1])
+
+            Comment.objects.filter(pk__in=deleted).delete()
+            pages = self.sync_pages(cursor)
+            self.assertEqual(
+                sorted(pk for page in pages for pk in page['deleted']['comments']),
+                sorted(str(pk) for pk in deleted),
+            )
+            for page in pages:
+                rows = [*page['changes'].values(), *page['deleted'].values()]
+                self.assertLessEqual(sum(len(kind_rows) for kind_rows in rows), 2)
+
+    def test_invalid_and_expired_cursors(self):
+        """Test malformed cursors are rejected and expired ones require a full sync"""
+        self.assertEqual(self.client.get(self.url, {'cursor': "nope"}).status_code, 400)
+        expired = sync.encode_cursor(timezone.now() - sync.TOMBSTONE_RETENTION * 2)
+        self.assertEqual(self.client.get(self.url, {'cursor': expired}).status_code, 410)
+
+
+class ExportTestCase(TrackingProjectsTestCase):
+    """Test streaming export of a project"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project()
+        self.issues = [self.create_issue(self.project, title=f"Issue {index}") for index in range(3)]
+        for issue in self.issues:
+            self.create_comment(issue)
+            self.create_comment(issue)
+        self.url = reverse('tracking_project:projects-export', args=[self.project.pk])
+
+    def test_export_ndjson(self):
+        """Test issues are followed by their comments, in constant queries per chunk"""
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        with self.assertNumQueries(3):
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual([line['type'] for line in lines], ['issue', 'comment', 'comment'] * 3)
+        self.assertEqual(lines[0]['author_name'], "author")
+        self.assertEqual(lines[1]['issue'], lines[0]['id'])
+
+    def test_export_csv(self):
+        """Test CSV export has a header and one row per issue / comment"""
+        response = self.client.get(self.url, {'format': 'csv'})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 9)
+        self.assertEqual(rows[0]['type'], 'issue')
+
+    def test_export_defaults_to_ndjson(self):
+        """Test clients asking for JSON or any format get the NDJSON stream"""
+        for response in [
+            self.client.get(self.url, HTTP_ACCEPT='application/json'),
+            self.client.get(self.url, {'format': 'json'}),
+            self.client.get(self.url, HTTP_ACCEPT='*/*'),
+        ]:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        response = self.client.get(self.url, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+    def test_export_timestamps_match(self):
+        """Test NDJSON and CSV write the same timestamps, as the JSON responses"""
+        response = self.client.get(self.url)
+        line = json.loads(b''.join(response.streaming_content).splitlines()[0])
+        response = self.client.get(self.url, {'format': 'csv'})
+        row = next(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+        self.assertEqual(row['created_at'], line['created_at'])
+        self.assertEqual(row['updated_at'], line['updated_at'])
+        self.assertEqual(line['created_at'], DjangoJSONEncoder().default(self.issues[0].created_at))
+
+    def test_export_only_contributors(self):
+        """Test non contributors cannot export"""
+        self.client.force_authenticate(self.contributor)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ImportTestCase(TrackingProjectsTestCase):
+    """Test NDJSON import command"""
+
+    def setUp(self):
+        super().setUp()
+        source = self.create_project(name="Source")
+        for index in range(3):
+            issue = self.create_issue(source, title=f"Issue {index}")
+            self.create_comment(issue, description=f"Commentaire {index}")
+        response = self.client.get(reverse('tracking_project:projects-export', args=[source.pk]))
+        content = b''.join(response.streaming_content)
+        Comment.objects.all().delete()
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'export.ndjson')
+        with open(self.path, 'wb') as stream:
+            stream.write(content)
+            stream.write(b'{"type": "comment", "issue": 999, "description": "Orphelin"}\n')
+        self.target = self.create_project(name="Cible")
+
+    def import_file(self, *args):
+        call_command(
+            'import_ndjson', self.path, '--project', str(self.target.pk), '--batch-size', '2',
+            *args, stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+
+    def test_import(self):
+        """Test issues and comments are imported by batches, comments linked to imported issues"""
+        self.import_file()
+
+        issues = Issue.objects.filter(project=self.target)
+        self.assertEqual(issues.count(), 3)
+        self.assertEqual(Comment.objects.filter(issue__project=self.target).count(), 3)
+        issue = issues.get(title="Issue 1")
+        self.assertEqual(issue.comments.get().description, "Commentaire 1")
+
+    def test_resume_after_completion(self):
+        """Test a resumed import starts from the checkpoint"""
+        self.import_file()
+        self.import_file('--resume')
+
+        self.assertEqual(Issue.objects.filter(project=self.target).count(), 3)
+        self.assertEqual(Comment.objects.filter(issue__project=self.target).count(), 3)
+
+    def test_resume_after_interrupted_batch(self):
+        """Test a batch failing before its checkpoint is rolled back, then imported once on resume"""
+        save_checkpoint = ImportCommand.save_checkpoint
+        calls = []
+
+        def fail_second_checkpoint(command, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("interrupted")
+            save_checkpoint(command, *args)
+
+        with mock.patch.object(ImportCommand, 'save_checkpoint', fail_second_checkpoint):
+            with self.assertRaises(RuntimeError):
+                self.import_file()
+        self.assertEqual(Issue.objects.filter(project=self.target).count(), 1)
+
+        self.import_file('--resume')
+
+        self.assertEqual(Issue.objects.filter(project=self.target).count(), 3)
+        self.assertEqual(Comment.objects.filter(issue__project=self.target).count(), 3)
+
+    def test_replay_skips_imported_comments(self):
+        """Test comments already imported are neither inserted nor counted again"""
+        self.import_file()
+        self.import_file()
+
+        self.target.refresh_from_db()
+        self.assertEqual(Comment.objects.filter(issue__project=self.target).count(), 3)
+        self.assertEqual(self.target.comments_count, 3)
+        self.assertEqual(statistics.get_statistics(self.target)['comments'], 3)
+
+    def test_comment_on_existing_issue(self):
+        """Test comments are added to existing issues of the project, not to issues of other projects"""
+        issue = self.create_issue(self.target, title="Locale")
+        other_issue = self.create_issue(self.create_project(name="Autre"), title="Autre")
+        with open(self.path, 'w') as stream:
+            for issue_id in (issue.pk, other_issue.pk):
+                stream.write(json.dumps({
+                    'type': 'comment', 'issue': issue_id, 'description': "Complément",
+                    'author_name': self.author.username,
+                }) + '\n')
+
+        self.import_file()
+
+        self.assertEqual(issue.comments.get().description, "Complément")
+        self.assertFalse(other_issue.comments.exists())
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.comments_count, 1)
+
+    def test_imported_issue_id_takes_precedence(self):
+        """Test a comment following an imported issue goes to it, even if a project issue has the source id"""
+        issue = self.create_issue(self.target, title="Locale")
+        with open(self.path, 'w') as stream:
+            stream.write(json.dumps({
+                'type': 'issue', 'id': issue.pk, 'title': "Importée", 'author_name': self.author.username,
+            }) + '\n')
+            stream.write(json.dumps({
+                'type': 'comment', 'issue': issue.pk, 'description': "Commentaire",
+                'author_name': self.author.username,
+            }) + '\n')
+
+        self.import_file()
+
+        self.assertFalse(issue.comments.exists())
+        self.assertEqual(Issue.objects.get(title="Importée").comments.count(), 1)
+
+
+class SearchTestCase(TrackingProjectsTestCase):
+    """Test full-text search"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project()
+        self.issue = self.create_issue(self.project, title="Crash au démarrage", description="L'application plante")
+        self.create_issue(self.project, title="Nouvelle page")
+        self.create_comment(self.issue, description="Le crash vient du cache")
+        other_project = Project.objects.create(
+            name="Autre", description="description", type='iOS', author=self.contributor,
+        )
+        Issue.objects.create(title="Crash privé", project=other_project, author=self.contributor)
+        self.url = reverse('tracking_project:search-list')
+
+    def test_search_issues_and_comments(self):
+        """Test matching issues and comments of user projects are returned with snippets"""
+        response = self.client.get(self.url, {'q': 'crash'})
+
+        results = response.data['results']
+        self.assertEqual({result['type'] for result in results}, {'issue', 'comment'})
+        self.assertEqual({result['issue'] for result in results}, {self.issue.pk})
+        self.assertIn('<mark>', results[0]['snippet'])
+
+    def test_search_follows_updates(self):
+        """Test index is kept in sync with writes"""
+        self.issue.title = "Lenteur"
+        self.issue.save()
+        self.create_issue(self.project, title="Démarrage lent")
+
+        results = self.client.get(self.url, {'q': 'demarrage'}).data['results']
+
+        self.assertEqual([result['title'] for result in results], ["Démarrage lent"])
+
+    def test_search_requires_text(self):
+        """Test q parameter is required"""
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+    def test_snippet_is_escaped(self):
+        """Test user text of snippets is escaped, only the matches are marked"""
+        self.create_comment(self.issue, description="<script>alert('panne')</script>")
+
+        results = self.client.get(self.url, {'q': 'panne'}).data['results']
+
+        self.assertEqual(
+            results[0]['snippet'], "&lt;script&gt;alert(&#x27;<mark>panne</mark>&#x27;)&lt;/script&gt;",
+        )
+
+    def test_comment_index_follows_writes_and_rebuild(self):
+        """Test the comment index is keyed on the comment, not on the rowid of its table"""
+        comment = self.create_comment(self.issue, description="Fuite mémoire")
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        results = self.client.get(self.url, {'q': 'fuite'}).data['results']
+        self.assertEqual([result['id'] for result in results], [str(comment.pk)])
+
+        comment.description = "Résolu"
+        comment.save()
+        self.assertEqual(self.client.get(self.url, {'q': 'fuite'}).data['results'], [])
+        comment.delete()
+        self.assertEqual(self.client.get(self.url, {'q': 'resolu'}).data['results'], [])
+
+
+    def test_triggers_restored_after_migrate(self):
+        """Test triggers dropped by a table remake are created again after migrate, rows indexed"""
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER tracking_projects_issue_fts_insert")
+        self.create_issue(self.project, title="Fuite pendant la migration")
+
+        emit_post_migrate_signal(0, False, 'default')
+
+        self.create_issue(self.project, title="Fuite après la migration")
+        results = self.client.get(self.url, {'q': 'fuite'}).data['results']
+        self.assertEqual(len(results), 2)
+        self.assertFalse(search.restore_index())
+
+
+class IssueFilterTestCase(TrackingProjectsTestCase):
+    """Test issue list filters and ordering"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.create_issue(self.project, title="A", status='Finished', priority='HIGH', tag='BUG')
+        self.create_issue(self.project, title="B", status='To Do', assigned_to=self.contributor)
+        self.create_issue(self.project, title="C", status='In Progress', priority='HIGH')
+        self.url = reverse('tracking_project:projects-issues-list', args=[self.project.pk])
+
+    def titles(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [issue['title'] for issue in response.data['results']]
+
+    def test_filters(self):
+        """Test filters combine and accept comma separated values"""
+        self.assertEqual(self.titles(priority='HIGH'), ["C", "A"])
+        self.assertEqual(self.titles(priority='HIGH', status='Finished,To Do'), ["A"])
+        self.assertEqual(self.titles(assigned_to=self.contributor.pk), ["B"])
+        self.assertEqual(self.titles(assigned_to='none', tag='TASK'), ["C"])
+
+    def test_ordering(self):
+        """Test ordering on created_at"""
+        self.assertEqual(self.titles(ordering='created_at'), ["A", "B", "C"])
+        self.assertEqual(self.titles(), ["C", "B", "A"])
+
+    def test_invalid_filter(self):
+        """Test unknown values are rejected"""
+        response = self.client.get(self.url, {'status': 'Done', 'assigned_to': 'someone'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', response.data)
+        self.assertIn('assigned_to', response.data)
+
+    def test_filter_uses_composite_index(self):
+        """Test project + status filter ordered by date is an index scan"""
+        plan = Issue.objects.filter(project=self.project, status='To Do').order_by('-created_at').explain()
+        self.assertIn('USING INDEX tracking_pr_project_61a04f_idx', plan)
+
+
+class AsyncReadTestCase(TrackingProjectsTestCase):
+    """Test the async read path returns the same data as the sync API"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.issue = self.create_issue(self.project, assigned_to=self.contributor, tag='BUG')
+        self.create_issue(self.project, title="Autre")
+        self.comment = self.create_comment(self.issue)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.author)}"}
+
+    async def get(self, url, **params):
+        response = await self.async_client.get(url, params, headers=self.headers)
+        return response.status_code, json.loads(response.content)
+
+    def test_queryset_required(self):
+        """Test a read view without queryset is rejected when defined"""
+        with self.assertRaises(ImproperlyConfigured):
+            type('View', (AsyncReadView,), {})
+
+    async def test_same_data_as_sync_api(self):
+        """Test list / retrieve of each resource match their sync counterpart"""
+        project, issue = self.project.pk, self.issue.pk
+        routes = [
+            ('projects-list', []),
+            ('projects-detail', [project]),
+            ('project-contributors-list', [project]),
+            ('projects-issues-list', [project]),
+            ('projects-issues-detail', [project, issue]),
+            ('projects-issues-comments-list', [project, issue]),
+            ('projects-issues-comments-detail', [project, issue, self.comment.pk]),
+        ]
+        for name, args in routes:
+            status_code, data = await self.get(reverse(f'tracking_project:async-{name}', args=args))
+            expected = (await self.async_client.get(
+                reverse(f'tracking_project:{name}', args=args), headers=self.headers,
+            )).json()
+            self.assertEqual(status_code, 200, name)
+            self.assertEqual(data.get('results', data), expected.get('results', expected), name)
+
+    async def test_pagination_and_filters(self):
+        """Test cursors and issue filters of the sync list apply"""
+        url = reverse('tracking_project:async-projects-issues-list', args=[self.project.pk])
+        _, page = await self.get(url, page_size=1)
+        self.assertEqual([result['title'] for result in page['results']], ["Autre"])
+        _, page = await self.get(page['next'])
+        self.assertEqual([result['title'] for result in page['results']], ["Issue"])
+        self.assertIsNone(page['next'])
+
+        _, page = await self.get(url, tag='BUG', assigned_to=self.contributor.pk)
+        self.assertEqual(len(page['results']), 1)
+        status_code, _ = await self.get(url, status='Unknown')
+        self.assertEqual(status_code, 400)
+
+    async def test_permissions(self):
+        """Test anonymous users and non contributors are rejected"""
+        outsider = await User.objects.acreate(username="outsider")
+        url = reverse('tracking_project:async-projects-issues-list', args=[self.project.pk])
+
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 401)
+
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(outsider)}"}
+        self.assertEqual((await self.get(url))[0], 403)
+        self.assertEqual((await self.get(
+            reverse('tracking_project:async-projects-detail', args=[self.project.pk])
+        ))[0], 404)
+
+
+@mock.patch.object(events, 'POLL_INTERVAL', 0.01)
+class EventStreamTestCase(TrackingProjectsTestCase):
+    """Test activity events are pushed to contributors"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.other_project = self.create_project(name="Autre")
+        self.url = reverse('tracking_project:async-events')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.contributor)}"}
+
+    async def open_stream(self, **headers):
+        response = await self.async_client.get(self.url, headers={**self.headers, **headers})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b": connected\n\n")
+        return stream
+
+    async def next_event(self, stream):
+        message = (await asyncio.wait_for(anext(stream), timeout=5)).decode()
+        fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+        return fields['event'], json.loads(fields['data'])
+
+    async def test_events_of_user_projects(self):
+        """Test issue and comment writes are pushed, other projects are filtered out"""
+        stream = await self.open_stream()
+        await sync_to_async(self.create_issue)(self.other_project, title="Invisible")
+        issue = await sync_to_async(self.create_issue)(self.project, title="Nouvelle")
+        comment = await sync_to_async(self.create_comment)(issue)
+
+        event, data = await self.next_event(stream)
+        self.assertEqual(event, 'issue.created')
+        self.assertEqual((data['id'], data['title']), (issue.pk, "Nouvelle"))
+        event, data = await self.next_event(stream)
+        self.assertEqual(event, 'comment.created')
+        self.assertEqual((data['uuid'], data['issue']), (str(comment.pk), issue.pk))
+
+    async def test_resume_with_last_event_id(self):
+        """Test a reconnecting client gets the events it missed"""
+        first = await sync_to_async(self.create_issue)(self.project, title="Vue")
+        last_event_id = (await ActivityEvent.objects.alast()).pk
+        await sync_to_async(first.delete)()
+
+        stream = await self.open_stream(**{'Last-Event-ID': str(last_event_id)})
+        event, data = await self.next_event(stream)
+        self.assertEqual(event, 'issue.deleted')
+
+    async def test_slow_client_is_reset(self):
+        """Test a connection whose queue is full is sent a reset event"""
+        with mock.patch.object(events, 'QUEUE_SIZE', 2):
+            stream = await self.open_stream()
+            for index in range(5):
+                await sync_to_async(self.create_issue)(self.project, title=f"Issue {index}")
+            await asyncio.sleep(0.1)
+            messages = [message.decode() async for message in stream]
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith("event: reset"))
+
+    async def test_requires_authentication(self):
+        """Test anonymous connections are rejected"""
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+
+class ReplicaRoutingTestCase(TrackingProjectsTestCase):
+    """Test reads go to replicas unless the request or its user wrote recently"""
+
+    def setUp(self):
+        super().setUp()
+        self.router = routers.PrimaryReplicaRouter()
+        self.router.replicas = ['replica1', 'replica2']
+        token = AccessToken.for_user(self.author)
+        self.factory = RequestFactory(headers={'Authorization': f"Bearer {token}"})
+
+    def route_outside_transaction(self, model):
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            return self.router.db_for_read(model)
+
+    def test_router(self):
+        """Test tracking reads go to a replica, writes and pinned reads to the primary"""
+        self.assertIn(self.route_outside_transaction(Issue), ['replica1', 'replica2'])
+        self.assertIsNone(self.route_outside_transaction(User))
+        self.assertEqual(self.router.db_for_write(Issue), 'default')
+        with routers.use_primary():
+            self.assertEqual(self.route_outside_transaction(Issue), 'default')
+        self.assertEqual(self.router.db_for_read(Issue), 'default')  # in the test transaction
+
+    def test_sticky_primary_after_write(self):
+        """Test a write pins the next reads of its user to the primary for the window"""
+        pinned = []
+
+        def get_response(request):
+            pinned.append(self.route_outside_transaction(Issue) == 'default')
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        with mock.patch.object(routers, 'replica_aliases', return_value=['replica1']):
+            middleware = routers.primary_sticky_middleware(get_response)
+        middleware(self.factory.get('/'))
+        middleware(self.factory.post('/'))
+        middleware(self.factory.get('/'))
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(pinned, [False, True, True, False])
+
+        cache.delete(routers.sticky_key(self.author.pk))
+        middleware(self.factory.get('/'))
+        self.assertEqual(pinned[-1], False)
+
+    def test_token_validated_once(self):
+        """Test the view authenticates with the token validated by the middleware"""
+        verified_tokens.clear()
+
+        def get_response(request):
+            user, _ = CachedUserJWTAuthentication().authenticate(request)
+            return HttpResponse(user.username)
+
+        with mock.patch.object(routers, 'replica_aliases', return_value=['replica1']):
+            middleware = routers.primary_sticky_middleware(get_response)
+        self.assertEqual(middleware(self.factory.get('/')).content.decode(), self.author.username)
+        self.assertEqual(verified_tokens.stats(), {'hits': 0, 'misses': 1, 'size': 1})
+
+    def test_cached_data_read_from_primary(self):
+        """Test cached membership and users are not loaded from a lagging replica"""
+        project = self.create_project()
+        with mock.patch.object(routers.PrimaryReplicaRouter, 'db_for_read', return_value='replica1'):
+            self.assertEqual(membership._rows(project.pk).db, 'default')
+            with self.assertNumQueries(1, using='default'):
+                CachedUserJWTAuthentication().get_user(AccessToken.for_user(self.author))
+
+
+class SQLiteProfileTestCase(TrackingProjectsTestCase):
+    """Test the production profile queues writes in one transaction, with a bounded wait"""
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+
+    def get_middleware(self, get_response):
+        with override_settings(DATABASE_PROFILE='production'):
+            return sqlite.serialized_writes_middleware(get_response)
+
+    @override_settings(DATABASE_PROFILE='development')
+    def test_disabled_outside_production(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            sqlite.serialized_writes_middleware(lambda request: HttpResponse())
+
+    def test_writes_queued(self):
+        """Test reads skip the queue, a write waiting too long gets a 503"""
+        middleware = self.get_middleware(lambda request: HttpResponse(status=201))
+        with sqlite._write_lock, override_settings(SQLITE_WRITE_QUEUE_TIMEOUT=0.01):
+            self.assertEqual(middleware(self.factory.get('/')).status_code, 201)
+            response = middleware(self.factory.post('/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(sqlite.RETRY_AFTER))
+        self.assertEqual(middleware(self.factory.post('/')).status_code, 201)
+        self.assertFalse(sqlite._write_lock.locked())
+
+    def test_server_error_rolls_back(self):
+        project = self.create_project()
+
+        def get_response(request):
+            self.create_issue(project)
+            return HttpResponse(status=500)
+
+        self.get_middleware(get_response)(self.factory.post('/'))
+        self.assertFalse(project.issues.exists())
+
+    async def test_async_server_error_rolls_back(self):
+        """Test async write requests run in one transaction too"""
+        project = await sync_to_async(self.create_project)()
+
+        async def get_response(request):
+            await sync_to_async(self.create_issue)(project)
+            return HttpResponse(status=500)
+
+        await self.get_middleware(get_response)(self.factory.post('/'))
+        self.assertFalse(await project.issues.aexists())
+
+    async def test_cancelled_async_write_releases_lock(self):
+        """Test an async write cancelled while queued does not keep the lock"""
+        async def get_response(request):
+            return HttpResponse(status=201)
+
+        middleware = self.get_middleware(get_response)
+        sqlite._write_lock.acquire()
+        task = asyncio.ensure_future(middleware(self.factory.post('/')))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        sqlite._write_lock.release()
+        # The queued request takes the lock, runs and releases it
+        await asyncio.sleep(0.2)
+        self.assertFalse(sqlite._write_lock.locked())
+
+    def test_busy_database(self):
+        """Test the write lock of another process timing out gives a 503"""
+        middleware = self.get_middleware(lambda request: HttpResponse(status=201))
+        with mock.patch.object(sqlite.transaction, 'atomic', side_effect=OperationalError("database is locked")):
+            self.assertEqual(middleware(self.factory.post('/')).status_code, 503)
+        with mock.patch.object(sqlite.transaction, 'atomic', side_effect=OperationalError("no such table")):
+            with self.assertRaises(OperationalError):
+                middleware(self.factory.post('/'))
+
+    def test_connection_options(self):
+        """Test the profile options open the database in WAL mode with the pragmas"""
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_dict = {
+            **connection.settings_dict,
+            'NAME': os.path.join(directory, 'production.sqlite3'),
+            'OPTIONS': settings.SQLITE_PRODUCTION_OPTIONS,
+        }
+        wrapper = DatabaseWrapper(settings_dict, alias='production')
+        try:
+            with wrapper.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+                cursor.execute('PRAGMA synchronous')
+                self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], settings.SQLITE_BUSY_TIMEOUT * 1000)
+            self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+        finally:
+            wrapper.close()
+
+
+class ShardRoutingTestCase(TrackingProjectsTestCase):
+    """Test project rows are routed to the shard of their project"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(sharding, 'shard_aliases', return_value=['shard1', 'shard2'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = sharding.ProjectShardRouter()
+
+    def test_router(self):
+        """Test instances route by project, queries by the project in context, users to default"""
+        self.assertEqual(sharding.shard_for(1), 'shard2')
+        self.assertEqual(self.router.db_for_write(Issue, instance=Issue(project_id=4)), 'shard1')
+        self.assertEqual(self.router.db_for_read(Contributor, instance=Project(pk=3)), 'shard2')
+        with self.assertRaises(sharding.ShardNotSelected):
+            self.router.db_for_read(Issue)
+        with sharding.for_project(3):
+            self.assertEqual(self.router.db_for_read(Comment), 'shard2')
+            self.assertEqual(self.router.db_for_read(User), 'default')
+            self.assertIsNone(self.router.db_for_read(ActivityEvent))
+            self.assertEqual(self.router.db_for_write(MembershipIndex), 'default')
+        self.assertEqual(sharding.group_by_shard([1, 2, 3]), {'shard2': [1, 3], 'shard1': [2]})
+
+    def test_allocate_ids(self):
+        """Test ids are reserved by blocks and never handed out twice"""
+        self.addCleanup(sharding._reserved.pop, 'tests.sequence', None)
+        with mock.patch.object(sharding, 'ID_BLOCK_SIZE', 3):
+            first = list(sharding.allocate_ids('tests.sequence', 2))
+            with self.assertNumQueries(0):
+                second = list(sharding.allocate_ids('tests.sequence', 1))
+            third = list(sharding.allocate_ids('tests.sequence', 5))
+        self.assertEqual(first + second + third, list(range(1, 4)) + list(range(4, 9)))
+        self.assertEqual(IdSequence.objects.get(name='tests.sequence').next_id, 9)
+
+
+class MembershipIndexTestCase(TrackingProjectsTestCase):
+    """Test the global membership index follows contributors"""
+
+    def indexed(self, project):
+        return set(MembershipIndex.objects.filter(project_id=project.pk).values_list('user_id', flat=True))
+
+    def test_index_follows_contributors(self):
+        project = self.create_project(contributors=[self.contributor])
+        self.assertEqual(self.indexed(project), {self.author.pk, self.contributor.pk})
+        self.assertEqual(MembershipIndex.objects.filter(project_id=project.pk).first().created_at, project.created_at)
+
+        Contributor.objects.get(project=project, user=self.contributor).delete()
+        self.assertEqual(self.indexed(project), {self.author.pk})
+
+        url = reverse('tracking_project:project-contributors-bulk-membership', args=[project.pk])
+        self.client.post(url, {'add': [self.contributor.pk]}, format='json')
+        self.assertEqual(self.indexed(project), {self.author.pk, self.contributor.pk})
+
+        project_pk = project.pk
+        project.delete()
+        self.assertFalse(MembershipIndex.objects.filter(project_id=project_pk).exists())
+
+
+class ShardedApiTestCase(TrackingProjectsTestCase):
+    """Test the sharded code paths with 'default' as the only shard"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(sharding, 'shard_aliases', return_value=['default'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Reservations of other tests were rolled back with their transaction
+        sharding._reserved.clear()
+
+    def test_project_ids_come_from_the_allocator(self):
+        response = self.client.post(
+            reverse('tracking_project:projects-list'),
+            {'name': "Projet", 'description': "description", 'type': 'back-end'},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(IdSequence.objects.get(name='tracking_projects.project').next_id, 1 + sharding.ID_BLOCK_SIZE)
+        self.assertEqual(Project.objects.using('default').get().contributors_count, 1)
+
+    def test_list_reads_the_membership_index(self):
+        """Test projects are paged from the index in creation order, with conditional requests"""
+        # Index rows are written when the shard commits
+        with self.captureOnCommitCallbacks(execute=True):
+            projects = [self.create_project(name=f"Projet {index}") for index in range(3)]
+            self.create_project(name="Autre").contributors.filter(user=self.author).delete()
+        url = reverse('tracking_project:projects-list')
+
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual([row['id'] for row in response.data['results']], [p.pk for p in projects[:2]])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], [projects[2].pk])
+
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.create_issue(projects[0])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_nested_routes_export_and_sync(self):
+        """Test user foreign keys are prefetched from default rather than joined"""
+        with self.captureOnCommitCallbacks(execute=True):
+            project = self.create_project(contributors=[self.contributor])
+            issue = self.create_issue(project)
+            self.create_comment(issue)
+
+        response = self.client.get(reverse('tracking_project:projects-issues-detail', args=[project.pk, issue.pk]))
+        self.assertEqual(response.data['author_name'], "author")
+        self.assertEqual(response.data['comments']['count'], 1)
+
+        lines = b''.join(self.client.get(reverse('tracking_project:projects-export', args=[project.pk])).streaming_content)
+        self.assertEqual([json.loads(line)['author_name'] for line in lines.splitlines()], ["author"] * 2)
+
+        data = self.client.get(reverse('tracking_project:sync-list')).data
+        self.assertEqual([row['id'] for row in data['changes']['issues']], [issue.pk])
+        self.assertEqual(len(data['changes']['contributors']), 2)
+
+        response = self.client.get(reverse('tracking_project:search-list'), {'q': "Issue"})
+        self.assertEqual([result['id'] for result in response.data['results']], [issue.pk])
+
+
+@skipUnless(len(sharding.shard_aliases()) > 1, "DATABASE_SHARDS=shard1.sqlite3,shard2.sqlite3")
+class MultiShardTestCase(TrackingProjectsTestCase):
+    """Test projects spread over the shards of DATABASE_SHARDS"""
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        sharding._reserved.clear()
+
+    @contextmanager
+    def shard_commits(self):
+        """Run the writes to the global tables deferred to the shard commits at the end of the block"""
+        with ExitStack() as stack:
+            for alias in sharding.shard_aliases():
+                stack.enter_context(self.captureOnCommitCallbacks(using=alias, execute=True))
+            yield
+
+    def create_projects(self, count=2):
+        url = reverse('tracking_project:projects-list')
+        data = {'description': "description", 'type': 'back-end'}
+        for index in range(count):
+            with self.shard_commits():
+                self.client.post(url, {**data, 'name': f"Projet {index}"})
+        return list(MembershipIndex.objects.filter(user=self.author).values_list('project_id', flat=True))
+
+    def test_projects_spread_over_shards(self):
+        url = reverse('tracking_project:projects-list')
+        project_ids = self.create_projects()
+        for project_id in project_ids:
+            self.assertTrue(Project.objects.using(sharding.shard_for(project_id)).filter(pk=project_id).exists())
+        self.assertEqual(len({sharding.shard_for(pk) for pk in project_ids}), 2)
+
+        for project_id in project_ids:
+            issues_url = reverse('tracking_project:projects-issues-list', args=[project_id])
+            with self.shard_commits():
+                self.assertEqual(self.client.post(issues_url, {'title': "Issue"}).status_code, 201)
+            self.assertEqual(len(self.client.get(issues_url).data['results']), 1)
+
+        self.assertEqual(sorted(row['id'] for row in self.client.get(url).data['results']), sorted(project_ids))
+        async_projects = self.client.get(
+            reverse('tracking_project:async-projects-list'),
+            headers={'Authorization': f"Bearer {AccessToken.for_user(self.author)}"},
+        ).json()['results']
+        self.assertEqual(sorted(row['id'] for row in async_projects), sorted(project_ids))
+        results = self.client.get(reverse('tracking_project:search-list'), {'q': "Issue"}).data['results']
+        self.assertEqual(sorted(result['project'] for result in results), sorted(project_ids))
+        changes = self.client.get(reverse('tracking_project:sync-list')).data['changes']
+        self.assertEqual(sorted(row['project'] for row in changes['issues']), sorted(project_ids))
+
+        with self.shard_commits():
+            self.client.delete(reverse('tracking_project:projects-detail', args=[project_ids[0]]))
+        self.assertFalse(Project.objects.using(sharding.shard_for(project_ids[0])).filter(pk=project_ids[0]).exists())
+        self.assertEqual([row['id'] for row in self.client.get(url).data['results']], project_ids[1:])
+
+    def test_global_writes_follow_shard_commit(self):
+        """Test events of a shard change are written when the shard commits"""
+        project_id = self.create_projects(count=1)[0]
+        alias = sharding.shard_for(project_id)
+        events_count = ActivityEvent.objects.count()
+        with self.captureOnCommitCallbacks(using=alias) as callbacks:
+            with sharding.for_project(project_id):
+                self.create_issue(Project.objects.get(pk=project_id))
+        self.assertEqual(ActivityEvent.objects.count(), events_count)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(ActivityEvent.objects.count(), events_count + 1)
+
+    def test_user_deletion_reaches_shards(self):
+        """Test deleting a user deletes or unassigns its rows in every shard"""
+        project_ids = self.create_projects()
+        for project_id in project_ids:
+            with self.shard_commits(), sharding.for_project(project_id):
+                project = Project.objects.get(pk=project_id)
+                project.add_contributor(self.contributor)
+                issue = Issue.objects.create(title="Issue", project=project, author=self.contributor)
+                Comment.objects.create(description="Commentaire", issue=issue, author=self.contributor)
+                Issue.objects.create(title="Assignée", project=project, author=self.author, assigned_to=self.contributor)
+
+        with self.shard_commits():
+            self.contributor.delete()
+
+        for project_id in project_ids:
+            with sharding.for_project(project_id):
+                project = Project.objects.get(pk=project_id)
+                self.assertEqual(list(project.issues.values_list('title', 'assigned_to')), [("Assignée", None)])
+                self.assertFalse(Comment.objects.filter(issue__project=project).exists())
+                self.assertEqual(
+                    (project.contributors_count, project.issues_count, project.comments_count), (1, 1, 0),
+                )
+
+        with self.shard_commits():
+            self.author.delete()
+        for project_id in project_ids:
+            self.assertFalse(Project.objects.using(sharding.shard_for(project_id)).filter(pk=project_id).exists())
+        self.assertFalse(MembershipIndex.objects.exists())
+
+
+class CompiledSerializerTestCase(TrackingProjectsTestCase):
+    """Test compiled list serializers render the same bytes as the DRF serializers"""
+
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project(contributors=[self.contributor])
+        self.create_project(name="Autre projet")
+        self.issue = self.create_issue(self.project, assigned_to=self.contributor, tag='BUG')
+        for index in range(3):
+            self.create_issue(self.project, title=f"Issue {index}", status='In Progress')
+        for index in range(3):
+            self.create_comment(self.issue, description=f"Commentaire {index} é")
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.author)}"}
+
+    def get_pages(self, url, compiled_lists, **params):
+        """Return the bodies of every page of the list at url"""
+        pages = []
+        with override_settings(COMPILED_LIST_SERIALIZERS=compiled_lists):
+            response = self.client.get(url, {'page_size': 2, **params}, headers=self.headers)
+            while True:
+                self.assertEqual(response.status_code, 200)
+                pages.append(response.content)
+                next_url = response.json()['next']
+                if not next_url:
+                    return pages
+                response = self.client.get(next_url, headers=self.headers)
+
+    def assert_same_lists(self, prefix=''):
+        project, issue = self.project.pk, self.issue.pk
+        routes = [
+            ('projects-list', [], {}),
+            ('project-contributors-list', [project], {}),
+            ('projects-issues-list', [project], {}),
+            ('projects-issues-list', [project], {'ordering': 'created_at', 'status': 'In Progress'}),
+            ('projects-issues-comments-list', [project, issue], {}),
+        ]
+        for name, args, params in routes:
+            url = reverse(f'tracking_project:{prefix}{name}', args=args)
+            self.assertEqual(self.get_pages(url, True, **params), self.get_pages(url, False, **params), url)
+
+    def test_same_json(self):
+        self.assert_same_lists()
+
+    def test_same_json_async(self):
+        self.assert_same_lists(prefix='async-')
+
+    def test_same_json_sharded(self):
+        """Test usernames are read apart from the rows when sharded"""
+        with mock.patch.object(sharding, 'shard_aliases', return_value=['default']):
+            serializer = compiled.compile_serializer(IssueListSerializer)
+            self.assertEqual(serializer.columns[7].related[1], 'username')
+            self.assert_same_lists()
+
+    def test_plan(self):
+        """Test rows are read as tuples of the lookups, joined without shards"""
+        serializer = compiled.compile_serializer(IssueListSerializer)
+        self.assertIn('author__username', serializer.lookups)
+        rows = serializer.rows(Issue.objects.filter(pk=self.issue.pk), 'created_at')
+        self.issue.refresh_from_db()
+        self.assertEqual(serializer.serialize(rows), IssueListSerializer([self.issue], many=True).data)
+        self.assertEqual(rows[0].created_at, self.issue.created_at)
+
+    def test_unsupported_serializer(self):
+        with self.assertRaises(ImproperlyConfigured):
+            compiled.compile_serializer(IssueDetailSerializer)
+
+    def test_benchmark_command(self):
+        """Test the benchmark compares both serializers and leaves no rows behind"""
+        out = io.StringIO()
+        call_command('benchmark_serializers', rows=5, repeat=1, stdout=out)
+        self.assertIn("IssueListSerializer (5 rows)", out.getvalue())
+        self.assertFalse(Project.objects.filter(name="Benchmark").exists())
@@ -1,12 +1,17 @@
 from django.urls import path, include
 from rest_framework_nested import routers
 from tracking_projects.views import IssuesViewset, CommentsViewset
-from tracking_projects.views import ProjectViewset, ContributorViewset
+from tracking_projects.views import ProjectViewset, ContributorViewset, SearchViewset, SyncViewset
+from tracking_projects.async_views import (
+    ProjectAsyncView, ContributorAsyncView, IssueAsyncView, CommentAsyncView, EventStreamView,
+)
 
 app_name = 'tracking_project'
 
 router = routers.DefaultRouter()
 router.register('projects', ProjectViewset, basename='projects')
+router.register('search', SearchViewset, basename='search')
+router.register('sync', SyncViewset, basename='sync')
 
 contributors_router = routers.NestedDefaultRouter(router, 'projects', lookup='project')
 contributors_router.register('contributors', ContributorViewset, basename='project-contributors')
@@ -23,3 +28,26 @@ urlpatterns = [
     path('', include(issues_router.urls)),
     path('', include(comments_router.urls)),
 ]
+
+# Async read path (ASGI), see tracking_projects.async_views
+async_urlpatterns = [
+    path('events/', EventStreamView.as_view(), name='async-events'),
+    path('projects/', ProjectAsyncView.as_view(), name='async-projects-list'),
+    path('projects/<int:pk>/', ProjectAsyncView.as_view(), name='async-projects-detail'),
+    path('projects/<int:project_pk>/contributors/',
+         ContributorAsyncView.as_view(), name='async-project-contributors-list'),
+    path('projects/<int:project_pk>/contributors/<int:pk>/',
+         ContributorAsyncView.as_view(), name='async-project-contributors-detail'),
+    path('projects/<int:project_pk>/issues/',
+         IssueAsyncView.as_view(), name='async-projects-issues-list'),
+    path('projects/<int:project_pk>/issues/<int:pk>/',
+         IssueAsyncView.as_view(), name='async-projects-issues-detail'),
+    path('projects/<int:project_pk>/issues/<int:issue_pk>/comments/',
+         CommentAsyncView.as_view(), name='async-projects-issues-comments-list'),
+    path('projects/<int:project_pk>/issues/<int:issue_pk>/comments/<uuid:pk>/',
+         CommentAsyncView.as_view(), name='async-projects-issues-comments-detail'),
+]
+
+urlpatterns += [
+    path('async/', include(async_urlpatterns)),
+]
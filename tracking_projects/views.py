@@ -1,18 +1,83 @@
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.viewsets import ModelViewSet
-
-from tracking_projects.models import Project, Contributor, Issue, Comment
+from rest_framework.response import Response
+from rest_framework.viewsets import ModelViewSet, ViewSet
+
+from tracking_projects import export, membership, search, sharding, statistics, sync
+
+from tracking_projects.caching import DetailCacheMixin, project_detail_key, issue_detail_key
+from tracking_projects.compiled import CompiledListMixin
+from tracking_projects.conditional import ConditionalMixin
+from tracking_projects.filters import IssueFilterBackend, CreatedAtOrderingFilter
+from tracking_projects.models import Project, Contributor, Issue, Comment, MembershipIndex
+from tracking_projects.pagination import (
+    ProjectPagination, ContributorPagination, IssuePagination, CommentPagination
+)
 from tracking_projects.permissions import IsContributor, IsAuthor
+from tracking_projects.signals import bulk_created, bulk_deleted, bulk_write
 from tracking_projects.serializers import (
     ProjectListSerializer, ProjectDetailSerializer, ContributorListSerializer,
     ContributorDetailSerializer, IssueListSerializer, IssueDetailSerializer,
     CommentListSerializer, CommentDetailSerializer, CreateContributorSerializer, CreateIssueSerializer,
-    CreateCommentSerializer, CreateProjectSerializer
+    CreateCommentSerializer, CreateProjectSerializer, BulkCreateIssueSerializer,
+    BulkContributorSerializer, BULK_MAX_ITEMS, NESTED_PREVIEW_SIZE
 )
 
+# Rows per INSERT statement of a bulk request
+BULK_BATCH_SIZE = 200
+
+
+class NestedResolverMixin:
+    """
+    Resolve the project / issue / object addressed by the URL kwargs once per request.
+    Permissions, serializer context and perform_create reuse the loaded rows.
+    Queries of the request go to the shard of the project (see tracking_projects.sharding).
+    """
 
-class ProjectViewset(ModelViewSet):
+    def dispatch(self, request, *args, **kwargs):
+        self.kwargs = kwargs
+        with sharding.for_project(self.get_project_id()):
+            return super().dispatch(request, *args, **kwargs)
+
+    def get_project_id(self):
+        """Return project id from URL"""
+        return self.kwargs.get('project_pk')
+
+    def get_project(self):
+        """Return project from URL, loaded once"""
+        if not hasattr(self, '_project'):
+            self._project = get_object_or_404(Project, pk=self.get_project_id())
+        return self._project
+
+    def get_issue(self):
+        """Return issue from URL (must belong to project), loaded once"""
+        if not hasattr(self, '_issue'):
+            self._issue = get_object_or_404(
+                Issue, pk=self.kwargs.get('issue_pk'), project_id=self.get_project_id()
+            )
+        return self._issue
+
+    def get_target_object(self):
+        """Return the object addressed by the URL without checking permissions, loaded once"""
+        if not hasattr(self, '_target_object'):
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = self.filter_queryset(self.get_queryset())
+            self._target_object = get_object_or_404(
+                queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        return self._target_object
+
+    def get_object(self):
+        obj = self.get_target_object()
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class ProjectViewset(ConditionalMixin, DetailCacheMixin, CompiledListMixin, NestedResolverMixin, ModelViewSet):
     """
     ViewSet for Project.
 
@@ -27,17 +92,38 @@ class ProjectViewset(ModelViewSet):
     - Create: POST /api/v1/projects/
     - Update: PUT/PATCH /api/v1/projects/<int:project_id>
     - Delete: DELETE /api/v1/projects/<int:project_id>
+    - Export: GET /api/v1/projects/<int:project_id>/export/?format=ndjson|csv
+    - Statistics: GET /api/v1/projects/<int:project_id>/statistics/
     """
+    pagination_class = ProjectPagination
+    detail_cache_key = staticmethod(project_detail_key)
+    detail_cache_stub = staticmethod(lambda kwargs: Project(pk=kwargs['pk']))
 
 
     def get_queryset(self):
-        """Return projects where user is a contributor"""
+        """
+        Return projects where user is a contributor.
+        The list pages the membership index of the user on its (user, created_at)
+        index, then loads the page (see paginate_queryset).
+        """
         user = self.request.user
-        return Project.objects.filter(contributors__user=user).distinct()
+        if self.action == 'list':
+            return sharding.memberships(user)
+        queryset = Project.objects.visible_to(user)
+        if self.action == 'retrieve':
+            queryset = sharding.with_users(queryset, 'author').with_previews(NESTED_PREVIEW_SIZE)
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        """Load the projects of a page of the membership index, from their shards if sharded"""
+        page = super().paginate_queryset(queryset)
+        if page is not None and queryset.model is MembershipIndex:
+            return sharding.load_projects([row.project_id for row in page])
+        return page
 
     def get_permissions(self):
         """Set permissions based on action"""
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'export', 'statistics']:
             return [IsAuthenticated(), IsContributor()]
         if self.action == 'create':
             return [IsAuthenticated()]
@@ -55,14 +141,46 @@ class ProjectViewset(ModelViewSet):
             return ProjectListSerializer
         return ProjectListSerializer
 
+    def get_project_id(self):
+        """Return project id from URL"""
+        return self.kwargs.get('pk')
+
+    def get_project(self):
+        """Return project from URL, loaded once"""
+        return self.get_target_object()
+
     def perform_create(self, serializer):
         """Save project with current user as author"""
         serializer.save(author=self.request.user)
 
-
-
-
-class ContributorViewset(ModelViewSet):
+    @action(
+        detail=True, methods=['get'], url_path='export',
+        renderer_classes=[export.NDJSONRenderer, export.CSVRenderer],
+        content_negotiation_class=export.ExportContentNegotiation,
+    )
+    def export(self, request, *args, **kwargs):
+        """Stream issues and their comments as NDJSON (default) or CSV"""
+        project = self.get_object()
+        if request.accepted_renderer.format == 'csv':
+            rows, content_type = export.iter_csv(project.pk), 'text/csv'
+        else:
+            rows, content_type = export.iter_ndjson(project.pk), 'application/x-ndjson'
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="project-{project.pk}.{request.accepted_renderer.format}"'
+        )
+        return response
+
+    @action(detail=True, methods=['get'])
+    def statistics(self, request, *args, **kwargs):
+        """Return issue / comment / contributor counters of the project"""
+        project = self.get_object()
+        return Response(statistics.get_statistics(project))
+
+
+
+
+class ContributorViewset(ConditionalMixin, CompiledListMixin, NestedResolverMixin, ModelViewSet):
     """
     ViewSet for Contributor management.
 
@@ -76,23 +194,32 @@ class ContributorViewset(ModelViewSet):
     - Create: POST /api/v1/projects/<int:project_id>/contributors/
     - Update: PUT/PATCH /api/v1/projects/<int:project_id>/contributors/<int:contributor_id>
     - Delete: DELETE /api/v1/projects/<int:project_id>/contributors/<int:contributor_id>
+    - Bulk add/remove: POST /api/v1/projects/<int:project_id>/contributors/bulk/
     """
+    pagination_class = ContributorPagination
 
     def get_queryset(self):
         """Return contributors to specified project"""
         projet_id = self.kwargs['project_pk']
-        return Contributor.objects.filter(project_id=projet_id)
+        queryset = Contributor.objects.filter(project_id=projet_id)
+        if self.action == 'list':
+            return sharding.with_users(queryset, 'user')
+        if self.action == 'retrieve':
+            return sharding.with_users(queryset.select_related('project'), 'user')
+        return queryset
 
     def get_permissions(self):
         """Set permissions based on action"""
         if self.action in ['list', 'retrieve']:
             return [IsAuthenticated(), IsContributor()]
-        if self.action in ['destroy', 'update', 'partial_update', 'create']:
+        if self.action in ['destroy', 'update', 'partial_update', 'create', 'bulk_membership']:
             return [IsAuthenticated(), IsAuthor()]
         return [IsAuthenticated()]
 
     def get_serializer_class(self):
         """Return appropriate serializer based on action"""
+        if self.action == 'bulk_membership':
+            return BulkContributorSerializer
         if self.action == 'retrieve':
             return ContributorDetailSerializer
         if self.action == 'list':
@@ -105,12 +232,50 @@ class ContributorViewset(ModelViewSet):
         """Add project to serializer context for create action"""
         context = super().get_serializer_context()
         if self.action == 'create':
-            project_id = self.kwargs['project_pk']
-            context['project'] = get_object_or_404(Project, id=project_id)
+            context['project'] = self.get_project()
         return context
 
-
-class IssuesViewset(ModelViewSet):
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_membership(self, request, *args, **kwargs):
+        """
+        Add and remove lists of user ids in one transaction.
+        Existing contributors are skipped on add, non contributors on remove:
+        memberships are read again in the transaction, the project row locked,
+        so the response and counts only list the rows written.
+        """
+        project_id = int(self.get_project_id())
+        author_id, _ = membership.get_membership(project_id)
+        context = self.get_serializer_context()
+        context['author_id'] = author_id
+        serializer = BulkContributorSerializer(data=request.data, context=context)
+        serializer.is_valid(raise_exception=True)
+        add, remove = serializer.validated_data['add'], serializer.validated_data['remove']
+
+        with transaction.atomic(using=sharding.db_for_project(project_id)), bulk_write():
+            list(Project.objects.select_for_update().filter(pk=project_id).values_list('pk'))
+            contributor_ids = set(
+                Contributor.objects.filter(project_id=project_id, user_id__in=add | remove)
+                .values_list('user_id', flat=True)
+            )
+            added, removed = sorted(add - contributor_ids), sorted(remove & contributor_ids)
+            if added:
+                contributors = Contributor.objects.bulk_create(
+                    sharding.assign_ids([
+                        Contributor(project_id=project_id, user_id=user_id) for user_id in added
+                    ]),
+                    batch_size=BULK_BATCH_SIZE,
+                )
+                bulk_created.send(sender=Contributor, project_id=project_id, instances=contributors)
+            if removed:
+                contributors = Contributor.objects.filter(project_id=project_id, user_id__in=removed)
+                instances = list(contributors)
+                contributors.delete()
+                bulk_deleted.send(sender=Contributor, project_id=project_id, instances=instances)
+
+        return Response({'added': added, 'removed': removed}, status=status.HTTP_200_OK)
+
+
+class IssuesViewset(ConditionalMixin, DetailCacheMixin, CompiledListMixin, NestedResolverMixin, ModelViewSet):
     """
     ViewSet for Issue.
 
@@ -120,16 +285,30 @@ class IssuesViewset(ModelViewSet):
 
     [Endpoint]
     - List: GET /api/v1/projects/<int:project_id>/issues/
+      filters: ?status=&priority=&tag=&assigned_to=<user_id>|me|none, ?ordering=created_at|-created_at
     - Retrieve: GET /api/v1/projects/<int:project_id>/issues/<int:issue_id>
     - Create: POST /api/v1/projects/<int:project_id>/issues/
     - Update: PUT/PATCH /api/v1/projects/<int:project_id>/issues/<int:issue_id>
     - Delete: DELETE /api/v1/projects/<int:project_id>/issues/<int:issue_id>
+    - Bulk create: POST /api/v1/projects/<int:project_id>/issues/bulk/
     """
+    pagination_class = IssuePagination
+    filter_backends = [IssueFilterBackend, CreatedAtOrderingFilter]
+    detail_cache_key = staticmethod(issue_detail_key)
+    detail_cache_stub = staticmethod(lambda kwargs: Issue(pk=kwargs['pk'], project_id=kwargs['project_pk']))
 
     def get_queryset(self):
         """Return issues for the specified project"""
         projet_id = self.kwargs['project_pk']
-        return Issue.objects.filter(project_id=projet_id)
+        queryset = Issue.objects.filter(project_id=projet_id)
+        if self.action == 'list':
+            return sharding.with_users(queryset, 'author')
+        if self.action == 'retrieve':
+            return (
+                sharding.with_users(queryset.select_related('project'), 'author', 'assigned_to')
+                .with_previews(NESTED_PREVIEW_SIZE)
+            )
+        return queryset
 
     def get_permissions(self):
         """Set permissions based on action"""
@@ -150,20 +329,63 @@ class IssuesViewset(ModelViewSet):
         return IssueListSerializer
 
     def get_serializer_context(self):
-        """Add project to serializer context"""
+        """Add project id to serializer context"""
         context = super().get_serializer_context()
-        project_id = self.kwargs.get('project_pk')
-        context['project'] = get_object_or_404(Project, id=project_id)
+        context['project_id'] = self.get_project_id()
         return context
 
     def perform_create(self, serializer):
-        """Save issue with current user as author and link to project"""
-        project_id = self.kwargs.get('project_pk')
-        project = get_object_or_404(Project, id=project_id)
-        serializer.save(project=project, author=self.request.user)
-
-
-class CommentsViewset(ModelViewSet):
+        """
+        Save issue with current user as author and link to project.
+        Project existence is guaranteed by IsContributor.
+        """
+        serializer.save(project_id=self.get_project_id(), author=self.request.user)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        """
+        Create a list of issues in one transaction.
+        Every item is validated first: errors are reported by item index and nothing is created.
+        """
+        if not isinstance(request.data, list) or not 0 < len(request.data) <= BULK_MAX_ITEMS:
+            return Response(
+                {'detail': f"Une liste de 1 à {BULK_MAX_ITEMS} issues est attendue."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        project_id = int(self.get_project_id())
+        context = self.get_serializer_context()
+        context['contributor_ids'] = membership.get_membership(project_id)[1]
+
+        issues, errors = [], []
+        for item in request.data:
+            serializer = BulkCreateIssueSerializer(data=item, context=context)
+            if serializer.is_valid():
+                data = dict(serializer.validated_data)
+                assigned_to_id = data.pop('assigned_to', None)
+                issues.append(Issue(
+                    **data,
+                    assigned_to_id=assigned_to_id,
+                    project_id=project_id,
+                    author=request.user,
+                ))
+                errors.append({})
+            else:
+                errors.append(serializer.errors)
+        if any(errors):
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic(using=sharding.db_for_project(project_id)):
+            issues = Issue.objects.bulk_create(sharding.assign_ids(issues), batch_size=BULK_BATCH_SIZE)
+            bulk_created.send(sender=Issue, project_id=project_id, instances=issues)
+
+        return Response(
+            IssueListSerializer(issues, many=True, context=context).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class CommentsViewset(ConditionalMixin, CompiledListMixin, NestedResolverMixin, ModelViewSet):
     """
     ViewSet for Comment.
 
@@ -178,11 +400,17 @@ class CommentsViewset(ModelViewSet):
     - Update: PUT/PATCH /api/v1/projects/<int:project_id>/issues/<int:issue_id>/comments/<int:comment_id>
     - Delete: DELETE /api/v1/projects/<int:project_id>/issues/<int:issue_id>/comments/<int:comment_id>
     """
+    pagination_class = CommentPagination
 
     def get_queryset(self):
         """Return comments for the specified issue"""
         issue_id = self.kwargs['issue_pk']
-        return Comment.objects.filter(issue_id=issue_id)
+        queryset = Comment.objects.filter(issue_id=issue_id, issue__project_id=self.get_project_id())
+        if self.action == 'list':
+            return sharding.with_users(queryset, 'author')
+        if self.action == 'retrieve':
+            return sharding.with_users(queryset.select_related('issue'), 'author')
+        return queryset.select_related('issue')
 
     def get_permissions(self):
         """Set permissions based on action"""
@@ -204,6 +432,63 @@ class CommentsViewset(ModelViewSet):
 
     def perform_create(self, serializer):
         """Save comment with current user as author and link to issue"""
-        issue_id = self.kwargs.get('issue_pk')
-        issue = get_object_or_404(Issue, id=issue_id)
-        serializer.save(author=self.request.user, issue=issue)
+        serializer.save(author=self.request.user, issue=self.get_issue())
+
+
+class SearchViewset(ViewSet):
+    """
+    Full-text search over issues and comments of the user's projects.
+
+    [Permission]
+    - Any authenticated user, results limited to projects where user is a contributor
+
+    [Endpoint]
+    - Search: GET /api/v1/search/?q=<text>[&project=<int:project_id>][&limit=<int>]
+    """
+    permission_classes = [IsAuthenticated]
+    max_limit = 50
+
+    def list(self, request, *args, **kwargs):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response(
+                {'detail': "Le paramètre de recherche q est requis."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+            project_id = request.query_params.get('project')
+            project_id = int(project_id) if project_id else None
+        except ValueError:
+            return Response(
+                {'detail': "Les paramètres limit et project doivent être des entiers."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response({'results': search.search(request.user, text, max(limit, 1), project_id)})
+
+
+class SyncViewset(ViewSet):
+    """
+    Changes feed of the user's projects for offline clients.
+
+    [Permission]
+    - Any authenticated user, changes limited to projects where user is a contributor
+
+    [Endpoint]
+    - Changes: GET /api/v1/sync/[?cursor=<cursor of the previous response>]
+      (while `more` is true, the cursor continues the same sync)
+    """
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request, *args, **kwargs):
+        cursor = request.query_params.get('cursor')
+        try:
+            since, page = sync.decode_cursor(cursor) if cursor else (None, None)
+            return Response(sync.changes(request.user, since, context={'request': request}, page=page))
+        except ValueError:
+            return Response({'detail': "Curseur invalide."}, status=status.HTTP_400_BAD_REQUEST)
+        except sync.CursorExpired:
+            return Response(
+                {'detail': "Curseur expiré : synchronisation complète requise (sans curseur)."},
+                status=status.HTTP_410_GONE,
+            )